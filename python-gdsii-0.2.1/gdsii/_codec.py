@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from __future__ import absolute_import
+from . import elements
+import operator
+
+ELEMENT_CLASSES = elements._all_elements
+
+def _element_attrs(cls):
+    """Return names of attributes of element class `cls` except ``xy``."""
+    return tuple(name for name in cls.__slots__ if name != 'xy')
+
+def _decoder(cls):
+    """
+    Return function ``(values, xy)`` that creates element of class `cls`
+    from tuple of attribute values returned by its getter and `xy`.
+    """
+    names = _element_attrs(cls)
+    lines = ['def decode(values, xy):',
+            '    self = new(cls)',
+            '    %s, = values' % ', '.join('self.' + name for name in names),
+            '    self.xy = xy',
+            '    return self']
+    namespace = {'cls': cls, 'new': cls.__new__}
+    exec('\n'.join(lines) + '\n', namespace)
+    return namespace['decode']
+
+#: index of each element class in the tables below
+CLASS_INDEX = dict((cls, i) for (i, cls) in enumerate(ELEMENT_CLASSES))
+#: functions returning tuple of attributes of an element except ``xy``
+GETTERS = tuple(operator.attrgetter(*_element_attrs(cls)) for cls in ELEMENT_CLASSES)
+#: functions ``(values, xy)`` creating elements from such tuples
+DECODERS = tuple(_decoder(cls) for cls in ELEMENT_CLASSES)
@@ -15,7 +15,19 @@
 #   You should have received a copy of the GNU Lesser General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import absolute_import
-from . import record, tags
+from . import exceptions, points, record, tags
+import linecache
+
+def _indent(lines):
+    return ['    ' + line for line in lines]
+
+def _check_tag(gds_record):
+    return ['if tag != %d:' % gds_record,
+            '    _Record(tag, data).check_tag(%d)' % gds_record]
+
+def _check_size(size):
+    return ['if len(data) != %d:' % size,
+            '    raise _DataSizeError(tag)']
 
 class AbstractRecord(object):
     def __init__(self, variable):
@@ -24,9 +36,37 @@ class AbstractRecord(object):
     def read(self, instance, gen):
         raise NotImplementedError
 
-    def save(self, instance, stream):
+    def read_trusted(self, instance, gen):
+        """
+        Same as :meth:`read` but without checks of record tags and data sizes,
+        used for files from trusted sources.
+        """
+        self.read(instance, gen)
+
+    def save(self, instance, writer):
         raise NotImplementedError
 
+    def read_code(self, name, validate):
+        """
+        Return source lines of code equivalent to :meth:`read` (or to
+        :meth:`read_trusted` if `validate` is false), used by :func:`compile_reader`.
+        The code reads into ``self``; ``tag`` and ``data`` hold the current
+        record and the next record is obtained with ``tag, data = read()``.
+        This default implementation calls the descriptor available as `name`.
+        """
+        return ['gen.current = _Record(tag, data)',
+                '%s.%s(self, gen)' % (name, 'read' if validate else 'read_trusted'),
+                'rec = gen.current',
+                'tag, data = rec.tag, rec.data']
+
+    def save_code(self, name):
+        """
+        Return source lines of code equivalent to :meth:`save`, used by
+        :func:`compile_writer`. The code writes ``self`` using ``write``
+        bound to :meth:`gdsii.record.RecordWriter.write`.
+        """
+        return ['%s.save(self, writer)' % name]
+
     def __repr__(self):
         return '<property: %s>'%self.variable
 
@@ -47,8 +87,21 @@ class SimpleRecord(AbstractRecord):
         setattr(instance, self.variable, rec.data[0])
         gen.read_next()
 
-    def save(self, instance, stream):
-        record.Record(self.gds_record, (getattr(instance, self.variable),)).save(stream)
+    def read_trusted(self, instance, gen):
+        setattr(instance, self.variable, gen.current.data[0])
+        gen.read_next()
+
+    def save(self, instance, writer):
+        writer.write(self.gds_record, (getattr(instance, self.variable),))
+
+    def read_code(self, name, validate):
+        lines = []
+        if validate:
+            lines += _check_tag(self.gds_record) + _check_size(1)
+        return lines + ['self.%s = data[0]' % self.variable, 'tag, data = read()']
+
+    def save_code(self, name):
+        return ['write(%d, (self.%s,))' % (self.gds_record, self.variable)]
 
 class SimpleOptionalRecord(SimpleRecord):
     def optional_read(self, instance, unused_gen, rec):
@@ -59,26 +112,61 @@ class SimpleOptionalRecord(SimpleRecord):
         rec.check_size(1)
         setattr(instance, self.variable, rec.data[0])
 
+    def optional_read_trusted(self, instance, unused_gen, rec):
+        """Same as :meth:`optional_read` but without data checks."""
+        setattr(instance, self.variable, rec.data[0])
+
     def read(self, instance, gen):
         rec = gen.current
         if rec.tag == self.gds_record:
             gen.read_next()
             self.optional_read(instance, gen, rec)
 
-    def save(self, instance, stream):
+    def read_trusted(self, instance, gen):
+        rec = gen.current
+        if rec.tag == self.gds_record:
+            gen.read_next()
+            self.optional_read_trusted(instance, gen, rec)
+
+    def save(self, instance, writer):
         data = getattr(instance, self.variable, None)
         if data is not None:
-            record.Record(self.gds_record, (data,)).save(stream)
+            writer.write(self.gds_record, (data,))
+
+    def optional_read_code(self, name, validate):
+        """Return source lines of code equivalent to :meth:`optional_read`."""
+        lines = _check_size(1) if validate else []
+        return lines + ['self.%s = data[0]' % self.variable, 'tag, data = read()']
+
+    def read_code(self, name, validate):
+        return ['if tag == %d:' % self.gds_record] + \
+                _indent(self.optional_read_code(name, validate))
+
+    def save_code(self, name):
+        return ['data = getattr(self, %r, None)' % self.variable,
+                'if data is not None:',
+                '    write(%d, (data,))' % self.gds_record]
 
 class OptionalWholeRecord(SimpleOptionalRecord):
     """Class for records that need to store all data (not data[0])."""
     def optional_read(self, instance, unused_gen, rec):
         setattr(instance, self.variable, rec.data)
 
-    def save(self, instance, stream):
+    def optional_read_trusted(self, instance, unused_gen, rec):
+        setattr(instance, self.variable, rec.data)
+
+    def save(self, instance, writer):
         data = getattr(instance, self.variable, None)
         if data is not None:
-            record.Record(self.gds_record, data).save(stream)
+            writer.write(self.gds_record, data)
+
+    def optional_read_code(self, name, validate):
+        return ['self.%s = data' % self.variable, 'tag, data = read()']
+
+    def save_code(self, name):
+        return ['data = getattr(self, %r, None)' % self.variable,
+                'if data is not None:',
+                '    write(%d, data)' % self.gds_record]
 
 class PropertiesRecord(AbstractRecord):
     def read(self, instance, gen):
@@ -93,23 +181,79 @@ class PropertiesRecord(AbstractRecord):
             rec = gen.read_next()
         setattr(instance, self.variable, props)
 
-    def save(self, instance, stream):
+    def read_trusted(self, instance, gen):
+        rec = gen.current
+        props = []
+        while rec.tag == tags.PROPATTR:
+            propattr = rec.data[0]
+            props.append((propattr, gen.read_next().data))
+            rec = gen.read_next()
+        setattr(instance, self.variable, props)
+
+    def save(self, instance, writer):
         props = getattr(instance, self.variable)
         if props:
             for (propattr, propvalue) in props:
-                record.Record(tags.PROPATTR, (propattr,)).save(stream)
-                record.Record(tags.PROPVALUE, propvalue).save(stream)
+                writer.write(tags.PROPATTR, (propattr,))
+                writer.write(tags.PROPVALUE, propvalue)
+
+    def read_code(self, name, validate):
+        lines = ['props = []', 'while tag == %d:' % tags.PROPATTR]
+        body = _check_size(1) if validate else []
+        body += ['propattr = data[0]', 'tag, data = read()']
+        if validate:
+            body += _check_tag(tags.PROPVALUE)
+        body += ['props.append((propattr, data))', 'tag, data = read()']
+        return lines + _indent(body) + ['self.%s = props' % self.variable]
+
+    def save_code(self, name):
+        return ['props = self.%s' % self.variable,
+                'if props:',
+                '    for (propattr, propvalue) in props:',
+                '        write(%d, (propattr,))' % tags.PROPATTR,
+                '        write(%d, propvalue)' % tags.PROPVALUE]
 
 class XYRecord(SimpleRecord):
     def read(self, instance, gen):
         rec = gen.current
         rec.check_tag(self.gds_record)
-        setattr(instance, self.variable, rec.points)
+        if gen.xy_arrays:
+            setattr(instance, self.variable, rec.point_array)
+        else:
+            setattr(instance, self.variable, rec.points)
         gen.read_next()
 
-    def save(self, instance, stream):
+    def read_trusted(self, instance, gen):
+        rec = gen.current
+        if gen.xy_arrays:
+            setattr(instance, self.variable, rec.point_array)
+        else:
+            coords = iter(rec.data)
+            setattr(instance, self.variable, list(zip(coords, coords)))
+        gen.read_next()
+
+    def save(self, instance, writer):
         pts = getattr(instance, self.variable)
-        record.Record(self.gds_record, points=pts).save(stream)
+        if not isinstance(pts, points.PointArray):
+            pts = points.PointArray(pts)
+        writer.write(self.gds_record, pts.flat)
+
+    def read_code(self, name, validate):
+        size_check = ['if not len(data) or len(data) % 2:',
+                '    raise _DataSizeError(tag)']
+        lines = _check_tag(self.gds_record) if validate else []
+        lines += ['if xy_arrays:'] + _indent(size_check + [
+                'self.%s = _PointArray.from_flat(data)' % self.variable])
+        lines += ['else:'] + _indent((size_check if validate else []) + [
+                'coords = iter(data)',
+                'self.%s = list(zip(coords, coords))' % self.variable])
+        return lines + ['tag, data = read()']
+
+    def save_code(self, name):
+        return ['pts = self.%s' % self.variable,
+                'if not isinstance(pts, _PointArray):',
+                '    pts = _PointArray(pts)',
+                'write(%d, pts.flat)' % self.gds_record]
 
 class StringRecord(SimpleRecord):
     def read(self, instance, gen):
@@ -118,8 +262,19 @@ class StringRecord(SimpleRecord):
         setattr(instance, self.variable, rec.data)
         gen.read_next()
 
-    def save(self, instance, stream):
-        record.Record(self.gds_record, getattr(instance, self.variable)).save(stream)
+    def read_trusted(self, instance, gen):
+        setattr(instance, self.variable, gen.current.data)
+        gen.read_next()
+
+    def save(self, instance, writer):
+        writer.write(self.gds_record, getattr(instance, self.variable))
+
+    def read_code(self, name, validate):
+        lines = _check_tag(self.gds_record) if validate else []
+        return lines + ['self.%s = data' % self.variable, 'tag, data = read()']
+
+    def save_code(self, name):
+        return ['write(%d, self.%s)' % (self.gds_record, self.variable)]
 
 class ColRowRecord(AbstractRecord, SecondVar):
     def __init__(self, variable1, variable2):
@@ -135,10 +290,25 @@ class ColRowRecord(AbstractRecord, SecondVar):
         setattr(instance, self.variable2, rows)
         gen.read_next()
 
-    def save(self, instance, stream):
+    def read_trusted(self, instance, gen):
+        cols, rows = gen.current.data
+        setattr(instance, self.variable, cols)
+        setattr(instance, self.variable2, rows)
+        gen.read_next()
+
+    def save(self, instance, writer):
         col = getattr(instance, self.variable)
         row = getattr(instance, self.variable2)
-        record.Record(tags.COLROW, (col, row)).save(stream)
+        writer.write(tags.COLROW, (col, row))
+
+    def read_code(self, name, validate):
+        lines = _check_tag(tags.COLROW) + _check_size(2) if validate else []
+        return lines + ['self.%s, self.%s = data' % (self.variable, self.variable2),
+                'tag, data = read()']
+
+    def save_code(self, name):
+        return ['write(%d, (self.%s, self.%s))' % (tags.COLROW, self.variable,
+                self.variable2)]
 
 class TimestampsRecord(SimpleRecord, SecondVar):
     def __init__(self, variable1, variable2, gds_record):
@@ -153,10 +323,16 @@ class TimestampsRecord(SimpleRecord, SecondVar):
         setattr(instance, self.variable2, acc_time)
         gen.read_next()
 
-    def save(self, instance, stream):
+    def read_trusted(self, instance, gen):
+        self.read(instance, gen)
+
+    def save(self, instance, writer):
         mod_time = getattr(instance, self.variable)
         acc_time = getattr(instance, self.variable2)
-        record.Record(self.gds_record, times=(mod_time, acc_time)).save(stream)
+        writer.write_record(record.Record(self.gds_record, times=(mod_time, acc_time)))
+
+    read_code = AbstractRecord.read_code
+    save_code = AbstractRecord.save_code
 
 class STransRecord(OptionalWholeRecord):
     mag = SimpleOptionalRecord('mag', tags.MAG)
@@ -167,21 +343,42 @@ class STransRecord(OptionalWholeRecord):
         self.mag.read(instance, gen)
         self.angle.read(instance, gen)
 
-    def save(self, instance, stream):
+    def optional_read_trusted(self, instance, gen, rec):
+        setattr(instance, self.variable, rec.data)
+        self.mag.read_trusted(instance, gen)
+        self.angle.read_trusted(instance, gen)
+
+    def save(self, instance, writer):
         data = getattr(instance, self.variable, None)
         if data is not None:
-            OptionalWholeRecord.save(self, instance, stream)
-            self.mag.save(instance, stream)
-            self.angle.save(instance, stream)
+            OptionalWholeRecord.save(self, instance, writer)
+            self.mag.save(instance, writer)
+            self.angle.save(instance, writer)
+
+    def optional_read_code(self, name, validate):
+        return OptionalWholeRecord.optional_read_code(self, name, validate) + \
+                self.mag.read_code(name + '.mag', validate) + \
+                self.angle.read_code(name + '.angle', validate)
+
+    def save_code(self, name):
+        return OptionalWholeRecord.save_code(self, name) + _indent(
+                self.mag.save_code(name + '.mag') +
+                self.angle.save_code(name + '.angle'))
 
 class ACLRecord(SimpleOptionalRecord):
     def optional_read(self, instance, unused_gen, rec):
         setattr(instance, self.variable, rec.acls)
 
-    def save(self, instance, stream):
+    def optional_read_trusted(self, instance, gen, rec):
+        self.optional_read(instance, gen, rec)
+
+    def save(self, instance, writer):
         data = getattr(instance, self.variable, None)
         if data:
-            record.Record(self.gds_record, acls=data).save(stream)
+            writer.write_record(record.Record(self.gds_record, acls=data))
+
+    read_code = AbstractRecord.read_code
+    save_code = AbstractRecord.save_code
 
 class FormatRecord(SimpleOptionalRecord, SecondVar):
     def __init__(self, variable1, variable2, gds_record):
@@ -200,15 +397,21 @@ class FormatRecord(SimpleOptionalRecord, SecondVar):
             setattr(instance, self.variable2, masks)
             gen.read_next()
 
-    def save(self, instance, stream):
+    def optional_read_trusted(self, instance, gen, rec):
+        self.optional_read(instance, gen, rec)
+
+    def save(self, instance, writer):
         fmt = getattr(instance, self.variable, None)
         if fmt is not None:
-            SimpleOptionalRecord.save(self, instance, stream)
+            SimpleOptionalRecord.save(self, instance, writer)
             masks = getattr(instance, self.variable2, None)
             if masks:
                 for mask in masks:
-                    record.Record(tags.MASK, mask).save(stream)
-                record.Record(tags.ENDMASKS).save(stream)
+                    writer.write(tags.MASK, mask)
+                writer.write(tags.ENDMASKS)
+
+    read_code = AbstractRecord.read_code
+    save_code = AbstractRecord.save_code
 
 class UnitsRecord(SimpleRecord, SecondVar):
     def __init__(self, variable1, variable2, gds_record):
@@ -224,7 +427,86 @@ class UnitsRecord(SimpleRecord, SecondVar):
         setattr(instance, self.variable2, unit2)
         gen.read_next()
 
-    def save(self, instance, stream):
+    def read_trusted(self, instance, gen):
+        unit1, unit2 = gen.current.data
+        setattr(instance, self.variable, unit1)
+        setattr(instance, self.variable2, unit2)
+        gen.read_next()
+
+    def save(self, instance, writer):
         unit1 = getattr(instance, self.variable)
         unit2 = getattr(instance, self.variable2)
-        record.Record(self.gds_record, (unit1, unit2)).save(stream)
+        writer.write(self.gds_record, (unit1, unit2))
+
+    def read_code(self, name, validate):
+        lines = _check_tag(self.gds_record) + _check_size(2) if validate else []
+        return lines + ['self.%s, self.%s = data' % (self.variable, self.variable2),
+                'tag, data = read()']
+
+    def save_code(self, name):
+        return ['write(%d, (self.%s, self.%s))' % (self.gds_record, self.variable,
+                self.variable2)]
+
+def _compile(func_name, filename, lines, objs):
+    """Compile function `func_name` defined by source `lines`."""
+    namespace = {
+        '_Record': record.Record,
+        '_DataSizeError': exceptions.DataSizeError,
+        '_PointArray': points.PointArray,
+    }
+    for (i, obj) in enumerate(objs):
+        namespace['_obj%d' % i] = obj
+    source = '\n'.join(lines) + '\n'
+    exec(compile(source, filename, 'exec'), namespace)
+    # make source available for tracebacks
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    return namespace[func_name]
+
+def compile_reader(cls, validate=True):
+    """
+    Generate function ``(cls, gen)`` reading element of class `cls` using
+    generator `gen`. The function is equivalent to reading with all
+    descriptors from ``cls._gds_objs``, followed by :const:`ENDEL`, but
+    has no loops over descriptors and no dynamic attribute access.
+    If `validate` is false, record tags and data sizes are not checked.
+
+    If ``gen.layers`` is not None and the element is not on one of these
+    layers, the rest of the element is skipped and the function returns None.
+    """
+    body = ['self = cls.__new__(cls)',
+            'self._init_optional()',
+            'read = gen.read_data',
+            'xy_arrays = gen.xy_arrays',
+            'tag, data = read()']
+    layer_attrs = cls._gds_layer_attrs
+    if layer_attrs:
+        body.insert(0, 'layers = gen.layers')
+    for (i, obj) in enumerate(cls._gds_objs):
+        lines = obj.read_code('_obj%d' % i, validate)
+        if layer_attrs and obj.variable == layer_attrs[1]:
+            # skip the rest of element before the next record is parsed
+            next_line = lines.pop()
+            lines += ['if layers is not None and (self.%s, self.%s) not in layers:' % layer_attrs,
+                    '    gen.skip_until(%d)' % tags.ENDEL,
+                    '    gen.read_next()',
+                    '    return None',
+                    next_line]
+        body += lines
+    if validate:
+        body += _check_tag(tags.ENDEL)
+    body += ['gen.read_next()', 'return self']
+    lines = ['def _read_element(cls, gen):'] + _indent(body)
+    filename = '<%s reader%s>' % (cls.__name__, '' if validate else ' (trusted)')
+    return _compile('_read_element', filename, lines, cls._gds_objs)
+
+def compile_writer(cls):
+    """
+    Generate function ``(self, writer)`` that writes element of class `cls`
+    including :const:`ENDEL` to :class:`gdsii.record.RecordWriter`.
+    """
+    body = ['write = writer.write', 'write(%d)' % cls._gds_tag]
+    for (i, obj) in enumerate(cls._gds_objs):
+        body += obj.save_code('_obj%d' % i)
+    body += ['write(%d)' % tags.ENDEL]
+    lines = ['def _save(self, writer):'] + _indent(body)
+    return _compile('_save', '<%s writer>' % cls.__name__, lines, cls._gds_objs)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.aio` --- asynchronous GDSII I/O
+===========================================
+
+This module contains classes for reading GDSII streams with :mod:`asyncio`,
+for example from pipes or sockets. Data is read in large chunks, so one event
+loop can read many streams concurrently. Requires Python 3.5 or newer.
+
+Records are parsed by the same code as in :mod:`gdsii.record`: complete
+structures are collected asynchronously and then parsed from memory.
+"""
+from __future__ import absolute_import
+from . import exceptions, record, structure, tags
+
+__all__ = ('AsyncReader', 'load_library')
+
+# tags that can follow library header or a structure
+_LIBRARY_TAGS = (tags.BGNSTR, tags.ENDLIB)
+
+class AsyncReader(object):
+    """
+    Counterpart of :class:`gdsii.record.Reader` for :class:`asyncio.StreamReader`.
+
+    Example::
+
+        reader = AsyncReader(stream_reader)
+        while True:
+            rec = await reader.read_next()
+            if rec.tag == tags.ENDLIB:
+                break
+    """
+    __slots__ = ('current', 'stream', 'chunk_size', 'xy_arrays', 'lazy',
+            'last_record', '_buffer', '_pos')
+
+    def __init__(self, stream, chunk_size=1 << 16, xy_arrays=False, lazy=False):
+        """
+        Initialize the reader.
+
+        :param stream: :class:`asyncio.StreamReader` or any object with
+            coroutine method ``read(n)``
+        :param chunk_size: number of bytes requested from `stream` at once
+        :param xy_arrays: same as for :class:`gdsii.record.Reader`
+        :param lazy: same as for :class:`gdsii.record.Reader`
+        """
+        self.current = None
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.xy_arrays = xy_arrays
+        self.lazy = lazy
+        self.last_record = None
+        self._buffer = bytearray()
+        self._pos = 0
+
+    async def _fill(self, size):
+        """Make sure that at least `size` unread bytes are buffered."""
+        buf = self._buffer
+        if len(buf) - self._pos >= size:
+            return
+        if self._pos:
+            del buf[:self._pos]
+            self._pos = 0
+        while len(buf) < size:
+            chunk = await self.stream.read(max(self.chunk_size, size - len(buf)))
+            if not chunk:
+                raise exceptions.EndOfFileError
+            buf += chunk
+
+    async def _next_size(self):
+        """Return size of the next record and make sure it is buffered."""
+        await self._fill(4)
+        size, tag = record._RECORD_HEADER_FMT.unpack_from(self._buffer, self._pos)
+        if size < 4:
+            raise exceptions.IncorrectDataSize('data size is too small')
+        if size % 2:
+            raise exceptions.IncorrectDataSize('data size is odd')
+        await self._fill(size)
+        return size, tag
+
+    async def read_next(self):
+        """Read and return next record from stream."""
+        size, tag = await self._next_size()
+        start = self._pos + 4
+        self._pos += size
+        if self.lazy:
+            # payload is kept by the record, so it must not change with the buffer
+            self.current = record.LazyRecord(tag, bytes(self._buffer[start:self._pos]))
+            return self.current
+        # the view is released before the buffer is resized by _fill()
+        with memoryview(self._buffer) as view, view[start:self._pos] as data:
+            if tag == tags.XY and self.xy_arrays:
+                self.current = record.Record(tag, record._parse_xy_array(data))
+            else:
+                self.current = record.Record(tag, record._TAG_PARSERS[tag](data))
+        return self.current
+
+    async def read_until(self, end_tags):
+        """
+        Read raw records up to and including the first record with a tag from
+        `end_tags`. Data of the last record is also stored in :attr:`last_record`.
+
+        :returns: :class:`bytes` with the records
+        """
+        # offsets are relative to the start of the block, so that they remain
+        # valid if the buffer is compacted by _fill()
+        block = bytearray()
+        while True:
+            size, tag = await self._next_size()
+            start = self._pos
+            self._pos += size
+            block += self._buffer[start:self._pos]
+            if tag in end_tags:
+                self.last_record = bytes(self._buffer[start:self._pos])
+                return bytes(block)
+
+async def load_library(stream, cls=None, xy_arrays=False, validate=True):
+    """
+    Load a GDS library from :class:`asyncio.StreamReader`.
+
+    Library header and each structure are read asynchronously into memory
+    and then parsed with :class:`gdsii.record.MappedReader`, so control
+    is returned to the event loop between structures and while waiting
+    for data.
+
+    :param stream: :class:`asyncio.StreamReader` or any object with
+        coroutine method ``read(n)``
+    :param cls: library class, :class:`gdsii.library.Library` by default
+    :param xy_arrays: same as for :meth:`gdsii.library.Library.load`
+    :param validate: same as for :meth:`gdsii.library.Library.load`
+    :returns: a new library
+    """
+    if cls is None:
+        from .library import Library as cls
+    reader = AsyncReader(stream)
+    gen = record.MappedReader(await reader.read_until(_LIBRARY_TAGS),
+            xy_arrays=xy_arrays)
+    self = cls._load_header(gen)
+    rec = gen.current
+    while True:
+        if rec.tag == tags.BGNSTR:
+            data = reader.last_record + await reader.read_until((tags.ENDSTR,))
+            data += await reader.read_until(_LIBRARY_TAGS)
+            gen = record.MappedReader(data, xy_arrays=xy_arrays)
+            gen.read_next()
+            self.append(structure.Structure._load(gen, validate))
+            rec = gen.read_next()
+        elif rec.tag == tags.ENDLIB:
+            break
+        else:
+            raise exceptions.FormatError('unexpected tag where BGNSTR or ENDLIB are expected: %d' % rec.tag)
+    return self
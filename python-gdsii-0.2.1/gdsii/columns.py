@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.columns` --- columnar storage of element geometry
+=============================================================
+
+This module contains :class:`ColumnStore`, a compact replacement for lists
+of elements. Geometry of :class:`gdsii.elements.Boundary`,
+:class:`gdsii.elements.Path`, :class:`gdsii.elements.Box` and
+:class:`gdsii.elements.Node` elements is stored per pair ``(layer, type)``
+in a :class:`LayerColumns` object: coordinates of all elements in one
+array of 32-bit integers, plus arrays with indices of the first point,
+kind, width and path type of each element. This takes about ten times
+less memory than element objects with lists of tuples.
+
+Elements are created again when they are accessed::
+
+    store = ColumnStore(struc)
+    print(store[(74, 30)].bbox())
+    store.scale(2)
+    struc[:] = store.to_elements()
+
+Elements that cannot be stored in columns (references, texts and elements
+with :attr:`elflags`, :attr:`plex`, :attr:`properties`, :attr:`bgn_extn`
+or :attr:`end_extn`) are kept in :attr:`ColumnStore.others`.
+
+Bulk operations (:meth:`LayerColumns.bboxes`, :meth:`LayerColumns.transform`
+and others) process all coordinates with single :mod:`numpy` calls and
+require :mod:`numpy`. :meth:`LayerColumns.bbox` also works without it.
+"""
+from __future__ import absolute_import
+from . import elements, events, points, record
+from array import array
+from collections import OrderedDict
+import itertools
+import math
+import operator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('LayerColumns', 'ColumnStore')
+
+#: Element classes stored in columns, kinds are indices in this tuple.
+KINDS = (elements.Boundary, elements.Path, elements.Box, elements.Node)
+_KIND_INDEX = dict((cls, i) for (i, cls) in enumerate(KINDS))
+_PATH = _KIND_INDEX[elements.Path]
+
+# value of width and path type for None
+_NONE = -1 << 31
+
+# optional attributes that prevent storing an element in columns if they
+# are not None (or empty list for properties)
+_OTHER_ATTRS = ('elflags', 'plex', 'bgn_extn', 'end_extn', 'properties')
+
+def _getters(cls):
+    """
+    Return getter of ``(layer, type)``, getter of optional attributes and
+    tuple of their allowed values for element class `cls`.
+    """
+    names = [name for name in _OTHER_ATTRS if name in cls.__slots__]
+    defaults = (None,) * len(names)
+    return (operator.attrgetter(*cls._gds_layer_attrs), operator.attrgetter(*names),
+            (defaults, defaults[:-1] + ([],)))
+
+_GETTERS = dict((cls, _getters(cls)) for cls in KINDS)
+
+def _check_numpy():
+    if numpy is None:
+        raise ImportError('numpy is required for this operation')
+
+class LayerColumns(object):
+    """
+    Geometry of elements on one layer with one data type (or box or node
+    type). Attributes are :class:`array.array` objects:
+
+        * :attr:`coords` -- coordinates ``x0, y0, x1, y1, ...`` of all points,
+        * :attr:`offsets` -- index of the first point of each element and
+          number of points as the last item,
+        * :attr:`kinds` -- index of element class in :data:`KINDS`,
+        * :attr:`widths` and :attr:`path_types` -- :attr:`width` and
+          :attr:`path_type` of paths, ``-2**31`` for None and for other
+          elements.
+    """
+    __slots__ = ('layer', 'data_type', 'coords', 'offsets', 'kinds', 'widths',
+            'path_types')
+
+    def __init__(self, layer, data_type):
+        self.layer = layer
+        self.data_type = data_type
+        self.coords = array(points._TYPECODE)
+        self.offsets = array(record._OFFSET_TYPECODE, [0])
+        self.kinds = array('B')
+        self.widths = array(points._TYPECODE)
+        self.path_types = array(points._TYPECODE)
+
+    def __len__(self):
+        """Return number of elements."""
+        return len(self.kinds)
+
+    def append(self, elem):
+        """Append geometry of `elem`, the layer is not checked."""
+        kind = _KIND_INDEX[type(elem)]
+        xy = elem.xy
+        if isinstance(xy, points.PointArray):
+            self.coords.extend(xy.flat)
+        else:
+            self.coords.extend(itertools.chain.from_iterable(xy))
+        self.offsets.append(len(self.coords) // 2)
+        self.kinds.append(kind)
+        if kind == _PATH:
+            self.widths.append(_NONE if elem.width is None else elem.width)
+            self.path_types.append(_NONE if elem.path_type is None else elem.path_type)
+        else:
+            self.widths.append(_NONE)
+            self.path_types.append(_NONE)
+
+    def element(self, index, xy_arrays=False):
+        """
+        Return a new element with index `index`.
+
+        :param xy_arrays: if true, :attr:`xy` is a :class:`gdsii.points.PointArray`
+        """
+        cls = KINDS[self.kinds[index]]
+        elem = cls.__new__(cls)
+        elem._init_optional()
+        (layer_attr, type_attr) = cls._gds_layer_attrs
+        setattr(elem, layer_attr, self.layer)
+        setattr(elem, type_attr, self.data_type)
+        flat = self.coords[2 * self.offsets[index]:2 * self.offsets[index + 1]]
+        if xy_arrays:
+            elem.xy = points.PointArray.from_flat(flat)
+        else:
+            coords = iter(flat)
+            elem.xy = list(zip(coords, coords))
+        if cls is elements.Path:
+            (width, path_type) = (self.widths[index], self.path_types[index])
+            elem.width = None if width == _NONE else width
+            elem.path_type = None if path_type == _NONE else path_type
+        return elem
+
+    def to_elements(self, xy_arrays=False):
+        """Yield all elements, see :meth:`element`."""
+        for index in range(len(self)):
+            yield self.element(index, xy_arrays)
+
+    def as_numpy(self):
+        """
+        Return :mod:`numpy` array of shape ``(N, 2)`` and type ``int32``
+        sharing memory with :attr:`coords`. Elements cannot be appended
+        while the returned view exists.
+        """
+        _check_numpy()
+        return numpy.frombuffer(self.coords, dtype=numpy.int32).reshape(-1, 2)
+
+    def bbox(self):
+        """
+        Return bounding box ``(xmin, ymin, xmax, ymax)`` of all points,
+        or None if there are no points.
+        """
+        if not self.coords:
+            return None
+        if numpy is None:
+            (xs, ys) = (self.coords[0::2], self.coords[1::2])
+            return (min(xs), min(ys), max(xs), max(ys))
+        coords = self.as_numpy()
+        (xmin, ymin) = coords.min(axis=0).tolist()
+        (xmax, ymax) = coords.max(axis=0).tolist()
+        return (xmin, ymin, xmax, ymax)
+
+    def bboxes(self):
+        """
+        Return :mod:`numpy` array of shape ``(len(self), 4)`` with bounding
+        boxes ``(xmin, ymin, xmax, ymax)`` of elements.
+        """
+        coords = self.as_numpy()
+        if not len(self):
+            return numpy.empty((0, 4), dtype=numpy.int32)
+        starts = numpy.frombuffer(self.offsets, dtype=numpy.int64)[:-1]
+        return numpy.concatenate((numpy.minimum.reduceat(coords, starts),
+            numpy.maximum.reduceat(coords, starts)), axis=1)
+
+    def transform(self, a, b, c, d, tx=0, ty=0):
+        """
+        Replace each point ``(x, y)`` with ``(a*x + b*y + tx, c*x + d*y + ty)``
+        rounded to integers. Positive widths of paths are multiplied by
+        square root of the determinant.
+        """
+        coords = self.as_numpy()
+        xs = coords[:, 0].astype(numpy.float64)
+        ys = coords[:, 1].astype(numpy.float64)
+        coords[:, 0] = numpy.rint(a * xs + b * ys + tx)
+        coords[:, 1] = numpy.rint(c * xs + d * ys + ty)
+        self._scale_widths(math.sqrt(abs(a * d - b * c)))
+
+    def translate(self, dx, dy):
+        """Add `dx` and `dy` to coordinates of all points."""
+        coords = self.as_numpy()
+        coords += numpy.array([dx, dy], dtype=numpy.int32)
+
+    def scale(self, factor):
+        """
+        Multiply coordinates and positive widths by `factor`,
+        for example to convert units.
+        """
+        self.transform(factor, 0, 0, factor)
+
+    def _scale_widths(self, factor):
+        if factor != 1:
+            widths = numpy.frombuffer(self.widths, dtype=numpy.int32)
+            positive = widths > 0
+            widths[positive] = numpy.rint(widths[positive] * factor)
+
+class ColumnStore(dict):
+    """
+    Dictionary mapping pairs ``(layer, type)`` to :class:`LayerColumns`.
+    Attribute :attr:`others` is a :class:`list` of elements that are not
+    stored in columns.
+    """
+
+    def __init__(self, elems=()):
+        """Initialize with elements from iterable `elems`."""
+        dict.__init__(self)
+        self.others = []
+        self.extend(elems)
+
+    def append(self, elem):
+        """Add element `elem`."""
+        getters = _GETTERS.get(type(elem))
+        if getters is None or getters[1](elem) not in getters[2]:
+            self.others.append(elem)
+            return
+        key = getters[0](elem)
+        columns = self.get(key)
+        if columns is None:
+            columns = self[key] = LayerColumns(key[0], key[1])
+        columns.append(elem)
+
+    def extend(self, elems):
+        """Add elements from iterable `elems`."""
+        for elem in elems:
+            self.append(elem)
+
+    @classmethod
+    def from_library(cls, lib):
+        """Return :class:`OrderedDict` mapping structure names to stores."""
+        return OrderedDict((struc.name, cls(struc)) for struc in lib)
+
+    @classmethod
+    def from_stream(cls, stream, validate=True, layers=None):
+        """
+        Read GDS library from `stream` with :func:`gdsii.events.iterparse`
+        and return :class:`OrderedDict` mapping structure names to stores.
+        Element objects exist only while they are added to columns.
+
+        :param validate: same as for :meth:`gdsii.library.Library.load`
+        :param layers: same as for :meth:`gdsii.library.Library.load`
+        """
+        result = OrderedDict()
+        store = None
+        for (event, obj) in events.iterparse(stream, True, validate, layers):
+            if event == events.ELEMENT:
+                store.append(obj)
+            elif event == events.BGNSTRUCTURE:
+                store = result[obj.name] = cls()
+        return result
+
+    def to_elements(self, xy_arrays=False):
+        """
+        Yield all elements: elements from columns ordered by layer,
+        then :attr:`others`.
+        """
+        for key in sorted(self):
+            for elem in self[key].to_elements(xy_arrays):
+                yield elem
+        for elem in self.others:
+            yield elem
+
+    def bbox(self):
+        """
+        Return bounding box ``(xmin, ymin, xmax, ymax)`` of elements in columns
+        or None if there are no elements.
+        """
+        boxes = [box for box in (columns.bbox() for columns in self.values()) if box]
+        if not boxes:
+            return None
+        return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+                max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+    def transform(self, a, b, c, d, tx=0, ty=0):
+        """Call :meth:`LayerColumns.transform` for all layers."""
+        for columns in self.values():
+            columns.transform(a, b, c, d, tx, ty)
+
+    def translate(self, dx, dy):
+        """Call :meth:`LayerColumns.translate` for all layers."""
+        for columns in self.values():
+            columns.translate(dx, dy)
+
+    def scale(self, factor):
+        """Call :meth:`LayerColumns.scale` for all layers."""
+        for columns in self.values():
+            columns.scale(factor)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.dedup` --- removal of duplicate data
+================================================
+
+This module contains :func:`deduplicate`, which finds identical elements
+and structures of a library by hashes of their GDS encoding::
+
+    report = deduplicate(lib, keep=lib.hierarchy().top_cells())
+    print(report)
+
+Structures are compared by their elements regardless of order, names
+and timestamps are ignored. Structures are processed bottom-up, so
+structures that differ only by names of identical referenced structures
+are identical too. Duplicate structures are removed from the library and
+references to them are changed to refer to the first identical structure.
+
+Elements of remaining structures with equal coordinates share their
+coordinates. Lists of points are replaced by one tuple, so that the shared
+coordinates cannot be changed by accident.
+:class:`gdsii.points.PointArray` objects are replaced by point arrays
+sharing :attr:`flat`, which copy the coordinates before they are changed
+in place (except by direct changes of :attr:`flat`).
+"""
+from __future__ import absolute_import
+from . import elements, points, record, tags
+from array import array
+import hashlib
+import io
+import itertools
+import sys
+
+__all__ = ('Report', 'deduplicate')
+
+_REFERENCES = (elements.SRef, elements.ARef)
+
+class Report(object):
+    """
+    Result of :func:`deduplicate`. Attributes:
+
+        * :attr:`merged` -- dictionary mapping names of removed structures
+          to names of identical structures that replaced them,
+        * :attr:`elements` -- number of removed elements, including elements
+          of removed structures,
+        * :attr:`bytes` -- decrease of size of the GDS file,
+        * :attr:`shared` -- number of elements whose :attr:`xy` is shared
+          with an element with equal coordinates,
+        * :attr:`memory` -- approximate memory freed by sharing of :attr:`xy`.
+    """
+    __slots__ = ('merged', 'elements', 'bytes', 'shared', 'memory')
+
+    def __init__(self):
+        self.merged = {}
+        self.elements = 0
+        self.bytes = 0
+        self.shared = 0
+        self.memory = 0
+
+    def __repr__(self):
+        return ('<Report: %d structures merged, %d elements and %d bytes removed, '
+                '%d xy shared saving %d bytes>' % (len(self.merged), self.elements,
+                    self.bytes, self.shared, self.memory))
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def _encode(struc):
+    """
+    Return GDS encoding of structure `struc` and list of offsets of its
+    elements, with the end of the last element as the last item.
+    """
+    stream = io.BytesIO()
+    writer = record.RecordWriter(stream)
+    for obj in struc._gds_objs:
+        obj.save(struc, writer)
+    offsets = []
+    for elem in struc:
+        offsets.append(stream.tell() + writer._pos)
+        elem._save(writer)
+    offsets.append(stream.tell() + writer._pos)
+    writer.write(tags.ENDSTR)
+    writer.flush()
+    return (memoryview(stream.getvalue()), offsets)
+
+def _xy_size(xy):
+    """Return approximate memory freed when `xy` is shared."""
+    if isinstance(xy, points.PointArray):
+        return sys.getsizeof(xy.flat)
+    return sys.getsizeof(xy) + sum(sys.getsizeof(pt) + sys.getsizeof(pt[0]) +
+            sys.getsizeof(pt[1]) for pt in xy)
+
+def _xy_key(xy):
+    # point arrays and lists are shared separately, so types do not change
+    if isinstance(xy, points.PointArray):
+        return (True, xy.flat.tobytes())
+    return (False, array(points._TYPECODE, itertools.chain.from_iterable(xy)).tobytes())
+
+def _shared_data(xy):
+    """Return data of `xy` that can be shared: a tuple or a flat array."""
+    if isinstance(xy, points._SharedPointArray):
+        return xy.flat
+    if isinstance(xy, points.PointArray):
+        return array(points._TYPECODE, xy.flat)
+    return xy if isinstance(xy, tuple) else tuple(xy)
+
+def _sharing(data):
+    """Return :attr:`xy` value sharing `data` returned by :func:`_shared_data`."""
+    if isinstance(data, tuple):
+        return data
+    xy = points._SharedPointArray.__new__(points._SharedPointArray)
+    xy.flat = data
+    return xy
+
+def _is_sharing(xy, data):
+    return xy is data or (isinstance(xy, points._SharedPointArray) and xy.flat is data)
+
+def deduplicate(lib, keep=(), merge_structures=True, share_xy=True,
+        remove_duplicates=False):
+    """
+    Remove duplicate data from library `lib` in place and return :class:`Report`.
+
+    :param keep: names of structures that must not be removed, for example
+        top cells
+    :param merge_structures: if true, identical structures are merged
+    :param share_xy: if true, equal coordinates of elements are shared
+    :param remove_duplicates: if true, identical elements of a structure
+        are removed, except the first one
+    :raises: :exc:`gdsii.exceptions.FormatError` if references are cyclic
+    """
+    report = Report()
+    keep = set(keep)
+    order = lib.hierarchy().topological_order()
+    # index of the first structure with each name
+    positions = {}
+    for (index, item) in enumerate(list.__iter__(lib)):
+        positions.setdefault(item.name, index)
+
+    merged = report.merged
+    known = {}
+    shared = {}
+    for name in order:
+        index = positions[name]
+        struc = lib[index]
+        changed = False
+        for elem in struc:
+            if isinstance(elem, _REFERENCES) and elem.struct_name in merged:
+                elem.struct_name = merged[elem.struct_name]
+                changed = True
+        if changed:
+            struc.reindex()
+
+        (data, offsets) = _encode(struc)
+        size = offsets[-1] + 4
+        digests = [_digest(data[begin:end]) for (begin, end) in zip(offsets, offsets[1:])]
+        if remove_duplicates:
+            seen = set()
+            unique = []
+            for (elem, digest, begin, end) in zip(list(struc), digests, offsets, offsets[1:]):
+                if digest in seen:
+                    report.elements += 1
+                    report.bytes += end - begin
+                    size -= end - begin
+                else:
+                    seen.add(digest)
+                    unique.append(elem)
+            if len(unique) != len(struc):
+                struc[:] = unique
+                changed = True
+            digests = sorted(seen)
+        else:
+            digests.sort()
+
+        if merge_structures:
+            key = _digest(b''.join(digests) + repr(getattr(struc, 'strclass', None)).encode())
+            first = known.setdefault(key, name)
+            if first != name and name not in keep:
+                merged[name] = first
+                report.elements += len(struc)
+                report.bytes += size
+                continue
+
+        if share_xy:
+            for elem in struc:
+                if isinstance(elem, _REFERENCES):
+                    continue
+                xy = elem.xy
+                xy_key = _xy_key(xy)
+                entry = shared.get(xy_key)
+                if entry is None:
+                    shared[xy_key] = [xy, elem]
+                    continue
+                if entry[1] is not None:
+                    # the first element starts sharing
+                    entry[0] = _shared_data(entry[0])
+                    entry[1].xy = _sharing(entry[0])
+                    entry[1] = None
+                if not _is_sharing(xy, entry[0]):
+                    report.shared += 1
+                    report.memory += _xy_size(xy)
+                    elem.xy = _sharing(entry[0])
+        if changed:
+            lib[index] = struc
+
+    if merged:
+        for index in reversed(range(len(lib))):
+            name = list.__getitem__(lib, index).name
+            if name in merged and positions[name] == index:
+                del lib[index]
+    lib.reindex()
+    return report
@@ -61,7 +61,7 @@ Additional definitions:
 .. moduleauthor:: Eugeniy Meshcheryakov <eugen@debian.org>
 """
 from __future__ import absolute_import
-from . import exceptions, record, tags, _records
+from . import exceptions, tags, _records
 
 __all__ = (
     'Boundary',
@@ -98,6 +98,8 @@ class _Base(object):
     # dummy descriptors to silence pyckecker, should be set in derived classes
     _gds_tag = None
     _gds_objs = None
+    # names of layer and type attributes used for filtering, if any
+    _gds_layer_attrs = None
     __slots__ = ()
 
     def __init__(self):
@@ -109,20 +111,31 @@ class _Base(object):
         raise NotImplementedError
 
     @classmethod
-    def _load(cls, gen):
+    def _load(cls, gen, validate=True):
         """
         Load an element from file using given generator `gen`.
 
         :param gen: :class:`pygdsii.record.Record` generator
-        :returns: new element of class defined by `gen`
+        :param validate: if false, tags and sizes of records are not checked
+        :returns: new element of class defined by `gen`, or None if the
+            element is skipped because of ``gen.layers`` or ``gen.element_types``
         """
-        element_class = cls._tag_to_class_map[gen.current.tag]
+        element_class = cls._tag_to_class_map.get(gen.current.tag)
         if not element_class:
             raise exceptions.FormatError('unexpected element tag')
+        element_types = gen.element_types
+        if element_types is not None and element_class not in element_types:
+            gen.skip_until(tags.ENDEL)
+            gen.read_next()
+            return None
         # do not call __init__() during reading from file
         # __init__() should require some arguments
-        new_element = element_class._read_element(gen)
-        return new_element
+        if validate:
+            return element_class._read_element(gen)
+        return element_class._read_element_trusted(gen)
+
+    # _read_element(), _read_element_trusted() and _save() are replaced in
+    # derived classes by code generated from _gds_objs, see _records.compile_reader()
 
     @classmethod
     def _read_element(cls, gen):
@@ -136,11 +149,23 @@ class _Base(object):
         gen.read_next()
         return self
 
-    def _save(self, stream):
-        record.Record(self._gds_tag).save(stream)
+    @classmethod
+    def _read_element_trusted(cls, gen):
+        """Same as :meth:`_read_element` but without validation."""
+        self = cls.__new__(cls)
+        self._init_optional()
+        gen.read_next()
+        for obj in cls._gds_objs:
+            obj.read_trusted(self, gen)
+        # skip ENDEL
+        gen.read_next()
+        return self
+
+    def _save(self, writer):
+        writer.write(self._gds_tag)
         for obj in self._gds_objs:
-            obj.save(self, stream)
-        record.Record(tags.ENDEL).save(stream)
+            obj.save(self, writer)
+        writer.write(tags.ENDEL)
 
 class Boundary(_Base):
     """
@@ -158,6 +183,7 @@ class Boundary(_Base):
                      : ENDEL
     """
     _gds_tag = tags.BOUNDARY
+    _gds_layer_attrs = ('layer', 'data_type')
     _gds_objs = (_ELFLAGS, _PLEX, _LAYER, _DATATYPE, _XY, _PROPERTIES)
     __slots__ = ('layer', 'data_type', 'xy', 'elflags', 'plex', 'properties')
 
@@ -192,6 +218,7 @@ class Path(_Base):
                 : ENDEL
     """
     _gds_tag = tags.PATH
+    _gds_layer_attrs = ('layer', 'data_type')
     _gds_objs = (_ELFLAGS, _PLEX, _LAYER, _DATATYPE, _PATHTYPE, _WIDTH,
             _BGNEXTN, _ENDEXTN, _XY, _PROPERTIES)
     __slots__ = ('layer', 'data_type', 'xy', 'elflags', 'plex', 'path_type',
@@ -272,6 +299,14 @@ class ARef(_Base):
         self.rows = rows
         self.xy = xy
 
+    def lattice(self):
+        """
+        Return :class:`gdsii.lattice.Lattice` describing instances of this
+        reference without expanding them.
+        """
+        from . import lattice
+        return lattice.Lattice(self)
+
     def _init_optional(self):
         self.elflags = None
         self.plex = None
@@ -301,6 +336,7 @@ class Text(_Base):
                 : ENDEL
     """
     _gds_tag = tags.TEXT
+    _gds_layer_attrs = ('layer', 'text_type')
     _gds_objs = (_ELFLAGS, _PLEX, _LAYER, _TEXTTYPE, _PRESENTATION, _PATHTYPE,
             _WIDTH, _STRANS, _XY, _STRING, _PROPERTIES)
     __slots__ = ('layer', 'text_type', 'xy', 'string', 'elflags', 'plex',
@@ -341,6 +377,7 @@ class Node(_Base):
                 : ENDEL
     """
     _gds_tag = tags.NODE
+    _gds_layer_attrs = ('layer', 'node_type')
     _gds_objs = (_ELFLAGS, _PLEX, _LAYER, _NODETYPE, _XY, _PROPERTIES)
     __slots__ = ('layer', 'node_type', 'xy', 'elflags', 'plex', 'properties')
 
@@ -371,6 +408,7 @@ class Box(_Base):
                : ENDEL
     """
     _gds_tag = tags.BOX
+    _gds_layer_attrs = ('layer', 'box_type')
     _gds_objs = (_ELFLAGS, _PLEX, _LAYER, _BOXTYPE, _XY, _PROPERTIES)
     __slots__ = ('layer', 'box_type', 'xy', 'elflags', 'plex', 'properties')
 
@@ -388,3 +426,9 @@ class Box(_Base):
 _all_elements = (Boundary, Path, SRef, ARef, Text, Node, Box)
 
 _Base._tag_to_class_map = (lambda: dict(((cls._gds_tag, cls) for cls in _all_elements)))()
+
+for _cls in _all_elements:
+    _cls._read_element = classmethod(_records.compile_reader(_cls))
+    _cls._read_element_trusted = classmethod(_records.compile_reader(_cls, False))
+    _cls._save = _records.compile_writer(_cls)
+del _cls
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.events` --- event-driven reading of GDSII libraries
+===============================================================
+
+This module reads GDS files as a sequence of events instead of building
+a :class:`gdsii.library.Library`, so that files larger than available
+memory can be processed. Only the library header, the header of the
+current structure and the current element are kept in memory.
+
+Events can be iterated with :func:`iterparse`::
+
+    with open('file.gds', 'rb') as stream:
+        for (event, obj) in iterparse(stream):
+            if event == ELEMENT:
+                print(obj)
+
+or passed to methods of a :class:`Handler` with :func:`parse`.
+
+Events are the following strings:
+
+    +-----------------------+-------------------------------------------------+
+    | Event                 | Object                                          |
+    +=======================+=================================================+
+    | :const:`LIBRARY`      | library with header attributes, no structures   |
+    +-----------------------+-------------------------------------------------+
+    | :const:`BGNSTRUCTURE` | structure with header attributes, no elements   |
+    +-----------------------+-------------------------------------------------+
+    | :const:`ELEMENT`      | element from :mod:`gdsii.elements`              |
+    +-----------------------+-------------------------------------------------+
+    | :const:`ENDSTRUCTURE` | the same structure as for :const:`BGNSTRUCTURE` |
+    +-----------------------+-------------------------------------------------+
+    | :const:`ENDLIBRARY`   | the same library as for :const:`LIBRARY`        |
+    +-----------------------+-------------------------------------------------+
+"""
+from __future__ import absolute_import
+from . import elements, exceptions, library, record, structure, tags
+
+__all__ = (
+    'LIBRARY',
+    'BGNSTRUCTURE',
+    'ELEMENT',
+    'ENDSTRUCTURE',
+    'ENDLIBRARY',
+    'iterparse',
+    'Handler',
+    'parse'
+)
+
+LIBRARY = 'library'
+BGNSTRUCTURE = 'begin_structure'
+ELEMENT = 'element'
+ENDSTRUCTURE = 'end_structure'
+ENDLIBRARY = 'end_library'
+
+def iterparse(stream, xy_arrays=False, validate=True, layers=None,
+        element_types=None):
+    """
+    Read GDS library from `stream` and yield tuples ``(event, object)``.
+    Records are read from the stream one by one, so it can be a pipe.
+
+    :param stream: a :class:`file` or file-like object opened for reading in binary mode
+    :param xy_arrays: same as for :meth:`gdsii.library.Library.load`
+    :param validate: same as for :meth:`gdsii.library.Library.load`
+    :param layers: same as for :meth:`gdsii.library.Library.load`
+    :param element_types: same as for :meth:`gdsii.library.Library.load`
+    """
+    gen = record.Reader(stream, xy_arrays, False, layers, element_types)
+    lib = library.Library._load_header(gen)
+    yield (LIBRARY, lib)
+
+    load_element = elements._Base._load
+    rec = gen.current
+    while True:
+        if rec.tag == tags.BGNSTR:
+            struc = structure.Structure._load_header(gen, validate)
+            yield (BGNSTRUCTURE, struc)
+            while gen.current.tag != tags.ENDSTR:
+                elem = load_element(gen, validate)
+                if elem is not None:
+                    yield (ELEMENT, elem)
+            yield (ENDSTRUCTURE, struc)
+            rec = gen.read_next()
+        elif rec.tag == tags.ENDLIB:
+            break
+        else:
+            raise exceptions.FormatError('unexpected tag where BGNSTR or ENDLIB are expected: %d' % rec.tag)
+    yield (ENDLIBRARY, lib)
+
+class Handler(object):
+    """
+    Base class for event handlers used by :func:`parse`.
+    Method names are the same as event names, all methods do nothing.
+    """
+    def library(self, lib):
+        """Called after library header is read."""
+
+    def begin_structure(self, struc):
+        """Called after structure header is read."""
+
+    def element(self, elem):
+        """Called for each element of the current structure."""
+
+    def end_structure(self, struc):
+        """Called at the end of the current structure."""
+
+    def end_library(self, lib):
+        """Called at the end of the library."""
+
+def parse(stream, handler, xy_arrays=False, validate=True, layers=None,
+        element_types=None):
+    """
+    Read GDS library from `stream` and call methods of `handler`
+    (usually a subclass of :class:`Handler`) for each event.
+
+    :param stream: a :class:`file` or file-like object opened for reading in binary mode
+    :param handler: object with methods named as events
+    :param xy_arrays: same as for :meth:`gdsii.library.Library.load`
+    :param validate: same as for :meth:`gdsii.library.Library.load`
+    :param layers: same as for :meth:`gdsii.library.Library.load`
+    :param element_types: same as for :meth:`gdsii.library.Library.load`
+    """
+    for (event, obj) in iterparse(stream, xy_arrays, validate, layers, element_types):
+        getattr(handler, event)(obj)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.extents` --- bounding boxes
+=======================================
+
+This module contains functions computing bounding boxes
+``(xmin, ymin, xmax, ymax)`` of elements and of instances of references.
+Empty extents are represented by None. Usually they are used through
+:meth:`gdsii.structure.Structure.bbox` and :meth:`gdsii.library.Library.bbox`,
+which cache bounding boxes of structures::
+
+    print(lib.bbox(b'TOP'))
+
+Bounding boxes of paths are extended by half of the width and by the
+extensions, and contain the corners of miter joins at bends as outlined by
+:mod:`gdsii.outline` (without miter limit). Bounding boxes of texts
+contain only the text origin.
+The box of a referenced structure is transformed as a rectangle, so for
+rotations by angles that are not multiples of 90 degrees the result is
+larger than the exact extent of the transformed geometry. Instances of
+:class:`gdsii.elements.ARef` are not expanded: the extent of the array
+is the transformed box moved to the corners of the lattice.
+Transformed coordinates are rounded outwards to integers.
+"""
+from __future__ import absolute_import
+from . import elements, points
+from array import array
+import itertools
+import math
+
+__all__ = ('element_bbox', 'elements_bbox', 'reference_bbox', 'union')
+
+_REFERENCES = (elements.SRef, elements.ARef)
+
+# STRANS flag of reflection about the X axis
+_REFLECTION = 0x8000
+
+def _cos_sin(angle):
+    """Return cosine and sine of `angle` in degrees, exact for right angles."""
+    if angle % 90 == 0:
+        return ((1, 0), (0, 1), (-1, 0), (0, -1))[int(angle // 90) % 4]
+    angle = math.radians(angle)
+    return (math.cos(angle), math.sin(angle))
+
+def _linear(strans, mag, angle):
+    """
+    Return linear part ``(a, b, c, d)`` of transformation defined by
+    `strans`, `mag` and `angle` attributes.
+    """
+    mag = 1 if mag is None else mag
+    (cos, sin) = _cos_sin(angle or 0)
+    flip = -1 if strans is not None and strans & _REFLECTION else 1
+    return (mag * cos, -mag * sin * flip, mag * sin, mag * cos * flip)
+
+def _padding(elem):
+    """Return distance by which the bounding box of points of `elem` is extended."""
+    if not isinstance(elem, elements.Path):
+        return 0
+    half_width = abs(elem.width or 0) / 2.0
+    if elem.path_type == 2:
+        return 2 * half_width
+    if elem.path_type == 4:
+        return half_width + max(elem.bgn_extn or 0, elem.end_extn or 0, 0)
+    return half_width
+
+def _miters(xy, half_width):
+    """
+    Return list of corners ``(x, y)`` of miter joins at inner points of
+    path points `xy` with half width `half_width`, computed as by
+    :mod:`gdsii.outline`. Consecutive equal points are ignored, joins of
+    paths turning back are beveled and stay within the half width.
+    """
+    pts = []
+    for pt in xy:
+        if not pts or pts[-1] != pt:
+            pts.append(tuple(pt))
+    result = []
+    for ((x0, y0), (x1, y1), (x2, y2)) in zip(pts, pts[1:], pts[2:]):
+        (ux, uy) = (x1 - x0, y1 - y0)
+        (vx, vy) = (x2 - x1, y2 - y1)
+        (length_u, length_v) = (math.hypot(ux, uy), math.hypot(vx, vy))
+        (ux, uy, vx, vy) = (ux / length_u, uy / length_u, vx / length_v, vy / length_v)
+        denominator = 1 + ux * vx + uy * vy
+        # the threshold of beveled joins of gdsii.outline
+        if denominator < 1e-9:
+            continue
+        (dx, dy) = ((uy + vy) * half_width / denominator, -(ux + vx) * half_width / denominator)
+        result.append((x1 + dx, y1 + dy))
+        result.append((x1 - dx, y1 - dy))
+    return result
+
+def _miter_bbox(elem):
+    """
+    Return bounding box of miter joins of :class:`gdsii.elements.Path`
+    `elem`, None if there are none.
+    """
+    if not elem.width or len(elem.xy) < 3:
+        return None
+    corners = _miters(elem.xy, abs(elem.width) / 2.0)
+    if not corners:
+        return None
+    xs = [x for (x, y) in corners]
+    ys = [y for (x, y) in corners]
+    return (int(math.floor(min(xs))), int(math.floor(min(ys))),
+            int(math.ceil(max(xs))), int(math.ceil(max(ys))))
+
+def _flat_bbox(flat, pad=0):
+    """Return bounding box of coordinates `flat` extended by `pad`."""
+    if not flat:
+        return None
+    (xs, ys) = (flat[0::2], flat[1::2])
+    if pad:
+        return (int(math.floor(min(xs) - pad)), int(math.floor(min(ys) - pad)),
+                int(math.ceil(max(xs) + pad)), int(math.ceil(max(ys) + pad)))
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def _points_bbox(xy, pad=0):
+    """Return bounding box of points `xy` extended by `pad`."""
+    if isinstance(xy, points.PointArray):
+        return _flat_bbox(xy.flat, pad)
+    return _flat_bbox(array(points._TYPECODE, itertools.chain.from_iterable(xy)), pad)
+
+def union(boxes):
+    """Return bounding box of `boxes`, None items are ignored."""
+    boxes = [box for box in boxes if box is not None]
+    if not boxes:
+        return None
+    if len(boxes) == 1:
+        return boxes[0]
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+def element_bbox(elem):
+    """
+    Return bounding box of element `elem` other than a reference,
+    or None for references.
+    """
+    if isinstance(elem, _REFERENCES):
+        return None
+    box = _points_bbox(elem.xy, _padding(elem))
+    if isinstance(elem, elements.Path):
+        return union([box, _miter_bbox(elem)])
+    return box
+
+def elements_bbox(elems):
+    """
+    Return bounding box of elements from `elems`, references are ignored.
+    """
+    flat = array(points._TYPECODE)
+    paths = []
+    for elem in elems:
+        if isinstance(elem, _REFERENCES):
+            continue
+        if isinstance(elem, elements.Path) and _padding(elem):
+            paths.append(element_bbox(elem))
+            continue
+        xy = elem.xy
+        if isinstance(xy, points.PointArray):
+            flat.extend(xy.flat)
+        else:
+            flat.extend(itertools.chain.from_iterable(xy))
+    return union([_flat_bbox(flat)] + paths)
+
+def reference_bbox(ref, box):
+    """
+    Return bounding box of all instances of :class:`gdsii.elements.SRef`
+    or :class:`gdsii.elements.ARef` `ref` of a structure with bounding
+    box `box`.
+    """
+    if box is None:
+        return None
+    (a, b, c, d) = _linear(ref.strans, ref.mag, ref.angle)
+    corners = [(a * x + b * y, c * x + d * y)
+            for (x, y) in ((box[0], box[1]), (box[2], box[1]), (box[0], box[3]), (box[2], box[3]))]
+    (x0, y0) = ref.xy[0]
+    origins = [(x0, y0)]
+    if isinstance(ref, elements.ARef):
+        (cols, rows) = (ref.cols, ref.rows)
+        (x1, y1) = ref.xy[1]
+        (x2, y2) = ref.xy[2]
+        # extremes of the lattice are in its corners
+        (col, row) = ((cols - 1) / float(cols), (rows - 1) / float(rows))
+        (col_dx, col_dy) = ((x1 - x0) * col, (y1 - y0) * col)
+        (row_dx, row_dy) = ((x2 - x0) * row, (y2 - y0) * row)
+        origins = [(x0, y0), (x0 + col_dx, y0 + col_dy), (x0 + row_dx, y0 + row_dy),
+                (x0 + col_dx + row_dx, y0 + col_dy + row_dy)]
+    xs = [x for (x, y) in corners]
+    ys = [y for (x, y) in corners]
+    ox = [x for (x, y) in origins]
+    oy = [y for (x, y) in origins]
+    return (int(math.floor(min(xs) + min(ox))), int(math.floor(min(ys) + min(oy))),
+            int(math.ceil(max(xs) + max(ox))), int(math.ceil(max(ys) + max(oy))))
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.flatten` --- expansion of structure hierarchy
+=========================================================
+
+This module expands :class:`gdsii.elements.SRef` and
+:class:`gdsii.elements.ARef` elements of a structure, producing all
+other elements of the structure and of referenced structures with
+absolute coordinates::
+
+    for elem in flatten(lib, b'TOP'):
+        print(elem.layer, elem.xy)
+
+Reflection, magnification and rotation of references are applied to
+coordinates, to :attr:`width`, :attr:`bgn_extn` and :attr:`end_extn`
+of paths and to :attr:`strans`, :attr:`mag` and :attr:`angle` of texts.
+Absolute magnification and absolute angle flags are not supported.
+Coordinates are rounded to integers only in the produced elements.
+
+Each structure is expanded once: if the expanded structure has no more
+than :attr:`Flattener.cache_limit` points, its coordinates are kept in
+memory and each instance is produced by applying an affine transformation
+to all of them at once. Larger structures are expanded instance by
+instance, so elements are produced as a stream and the whole result never
+has to be in memory. References to structures missing from the library
+are ignored.
+
+Requires :mod:`numpy`.
+"""
+from __future__ import absolute_import
+from . import _codec, elements, extents, points
+from array import array
+import bisect
+import itertools
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('Flattener', 'flatten')
+
+_REFERENCES = (elements.SRef, elements.ARef)
+
+# elements with attributes changed by transformations
+_TRANSFORMED = (elements.Path, elements.Text)
+
+# maximum number of points or transformations processed in one batch
+_CHUNK = 1 << 16
+
+def _decompose(a, b, c, d):
+    """
+    Return ``(reflected, mag, angle)`` for linear transformation
+    ``(a, b, c, d)`` computed by :func:`_linear`.
+    """
+    angle = math.degrees(math.atan2(c, a)) % 360
+    return (a * d - b * c < 0, math.hypot(a, c), angle)
+
+def _compose_linear(outer, inner):
+    """
+    Compose arrays of linear transformations of shape ``(K, 4)`` and
+    ``(M, 4)``, return array of shape ``(K, M, 4)``.
+    """
+    (a1, b1, c1, d1) = (outer[:, i, None] for i in range(4))
+    (a2, b2, c2, d2) = (inner[None, :, i] for i in range(4))
+    return numpy.stack((a1 * a2 + b1 * c2, a1 * b2 + b1 * d2,
+        c1 * a2 + d1 * c2, c1 * b2 + d1 * d2), axis=-1)
+
+def _apply(mats, coords):
+    """
+    Apply transformations `mats` of shape ``(K, 6)`` to points `coords` of
+    shape ``(N, 2)``, return array of shape ``(K, N, 2)``.
+    """
+    (xs, ys) = (coords[None, :, 0], coords[None, :, 1])
+    return numpy.stack((mats[:, 0, None] * xs + mats[:, 1, None] * ys + mats[:, 4, None],
+        mats[:, 2, None] * xs + mats[:, 3, None] * ys + mats[:, 5, None]), axis=-1)
+
+def _compose(outer, inner):
+    """
+    Compose arrays of transformations ``(a, b, c, d, tx, ty)`` of shape
+    ``(K, 6)`` and ``(M, 6)``, return array of shape ``(K * M, 6)``.
+    """
+    linear = _compose_linear(outer, inner)
+    offsets = _apply(outer, inner[:, 4:])
+    return numpy.concatenate((linear, offsets), axis=-1).reshape(-1, 6)
+
+def _reference_transforms(ref):
+    """
+    Yield arrays of transformations of shape ``(K, 6)`` for instances
+    of reference `ref`, each array has at most about :data:`_CHUNK` rows.
+    """
+    linear = extents._linear(ref.strans, ref.mag, ref.angle)
+    (x0, y0) = ref.xy[0]
+    if not isinstance(ref, elements.ARef):
+        yield numpy.array([linear + (x0, y0)], dtype=numpy.float64)
+        return
+    (cols, rows) = (ref.cols, ref.rows)
+    (x1, y1) = ref.xy[1]
+    (x2, y2) = ref.xy[2]
+    col = numpy.arange(cols, dtype=numpy.float64)
+    col_x = x0 + col * ((x1 - x0) / float(cols))
+    col_y = y0 + col * ((y1 - y0) / float(cols))
+    (row_dx, row_dy) = ((x2 - x0) / float(rows), (y2 - y0) / float(rows))
+    step = max(1, _CHUNK // cols)
+    for start in range(0, rows, step):
+        row = numpy.arange(start, min(start + step, rows), dtype=numpy.float64)
+        mats = numpy.empty((len(row), cols, 6))
+        mats[..., :4] = linear
+        mats[..., 4] = col_x[None, :] + row[:, None] * row_dx
+        mats[..., 5] = col_y[None, :] + row[:, None] * row_dy
+        yield mats.reshape(-1, 6)
+
+def _transform_attributes(elem, mat, linear):
+    """
+    Transform attributes of path or text `elem` placed with transformation
+    `mat` of an instance and transformation `linear` inside the instance.
+    """
+    linear = _compose_linear(mat[None, :4], linear[None, :])[0, 0]
+    if isinstance(elem, elements.Text):
+        (a, b, c, d) = _compose_linear(linear[None, :], numpy.array(
+            [extents._linear(elem.strans, elem.mag, elem.angle)]))[0, 0]
+        (reflected, mag, angle) = _decompose(a, b, c, d)
+        strans = (elem.strans or 0) & ~extents._REFLECTION
+        if reflected:
+            strans |= extents._REFLECTION
+        if strans or elem.strans is not None:
+            elem.strans = strans
+        if abs(mag - 1) > 1e-9 or elem.mag is not None:
+            elem.mag = mag
+        if angle or elem.angle is not None:
+            elem.angle = angle
+    else:
+        mag = _decompose(*linear)[1]
+        if elem.width is not None and elem.width > 0:
+            elem.width = int(round(elem.width * mag))
+        if elem.bgn_extn is not None:
+            elem.bgn_extn = int(round(elem.bgn_extn * mag))
+        if elem.end_extn is not None:
+            elem.end_extn = int(round(elem.end_extn * mag))
+
+class _Geometry(object):
+    """
+    Elements of an expanded structure: `elements` are original elements,
+    `coords` is an array of shape ``(N, 2)`` with their transformed points,
+    `ends` are indices of the last points of elements plus one and `linear`
+    is an array of shape ``(len(elements), 4)`` with linear parts of
+    the transformations.
+    """
+    __slots__ = ('elements', 'coords', 'ends', 'linear')
+
+    def __init__(self, elems, coords, ends, linear):
+        self.elements = elems
+        self.coords = coords
+        self.ends = ends
+        self.linear = linear
+
+    @classmethod
+    def from_elements(cls, elems):
+        """Create geometry of non-reference elements `elems`."""
+        flat = array('d')
+        for elem in elems:
+            flat.extend(itertools.chain.from_iterable(elem.xy))
+        coords = numpy.frombuffer(flat, dtype=numpy.float64).reshape(-1, 2)
+        ends = numpy.cumsum([len(elem.xy) for elem in elems], dtype=numpy.int64)
+        linear = numpy.empty((len(elems), 4))
+        linear[:] = (1, 0, 0, 1)
+        return cls(elems, coords, ends, linear)
+
+    def transformed(self, mats):
+        """Return geometry of instances placed with transformations `mats`."""
+        count = len(mats)
+        return _Geometry(self.elements * count, _apply(mats, self.coords).reshape(-1, 2),
+                (self.ends[None, :] + len(self.coords) * numpy.arange(count)[:, None]).ravel(),
+                _compose_linear(mats, self.linear).reshape(-1, 4))
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Join list of geometries."""
+        elems = []
+        ends = []
+        size = 0
+        for part in parts:
+            elems.extend(part.elements)
+            ends.append(part.ends + size)
+            size += len(part.coords)
+        return cls(elems, numpy.concatenate([part.coords for part in parts]),
+                numpy.concatenate(ends), numpy.concatenate([part.linear for part in parts]))
+
+class Flattener(object):
+    """
+    Expands structures of library `lib`. Expanded structures are cached,
+    so one object should be used to expand several structures of the same
+    library. The library must not be changed while the object is used.
+
+    :raises: :exc:`gdsii.exceptions.FormatError` if references are cyclic
+    """
+
+    #: Maximum number of points of an expanded structure kept in memory.
+    cache_limit = 1 << 20
+
+    def __init__(self, lib, cache_limit=None):
+        if numpy is None:
+            raise ImportError('numpy is required for gdsii.flatten')
+        self.library = lib
+        if cache_limit is not None:
+            self.cache_limit = cache_limit
+        self._hierarchy = lib.hierarchy()
+        # check for cycles
+        self._hierarchy.topological_order()
+        self._counts = {}
+        self._cache = {}
+
+    def _references(self, struc):
+        """Return references of `struc` to existing structures."""
+        return [elem for elem in struc if isinstance(elem, _REFERENCES)
+                and elem.struct_name in self._hierarchy]
+
+    def _count(self, name):
+        """Return number of points in expanded structure `name`."""
+        count = self._counts.get(name)
+        if count is None:
+            count = 0
+            struc = self.library.structure_by_name(name)
+            for elem in struc:
+                if not isinstance(elem, _REFERENCES):
+                    count += len(elem.xy)
+            for ref in self._references(struc):
+                instances = ref.cols * ref.rows if isinstance(ref, elements.ARef) else 1
+                count += self._count(ref.struct_name) * instances
+            self._counts[name] = count
+        return count
+
+    def _geometry(self, name):
+        """Return cached :class:`_Geometry` of structure `name` or None if it is too big."""
+        geometry = self._cache.get(name)
+        if geometry is None and self._count(name) <= self.cache_limit:
+            struc = self.library.structure_by_name(name)
+            parts = [_Geometry.from_elements([elem for elem in struc
+                if not isinstance(elem, _REFERENCES)])]
+            for ref in self._references(struc):
+                child = self._geometry(ref.struct_name)
+                for mats in _reference_transforms(ref):
+                    parts.append(child.transformed(mats))
+            geometry = _Geometry.concatenate(parts)
+            self._cache[name] = geometry
+        return geometry
+
+    def _walk(self, name, mats, xy_arrays):
+        """Yield elements of structure `name` placed with transformations `mats`."""
+        geometry = self._geometry(name)
+        if geometry is not None:
+            for elem in self._emit(geometry, mats, xy_arrays):
+                yield elem
+            return
+        struc = self.library.structure_by_name(name)
+        own = _Geometry.from_elements([elem for elem in struc
+            if not isinstance(elem, _REFERENCES)])
+        for elem in self._emit(own, mats, xy_arrays):
+            yield elem
+        for ref in self._references(struc):
+            for ref_mats in _reference_transforms(ref):
+                step = max(1, _CHUNK // len(ref_mats))
+                for start in range(0, len(mats), step):
+                    for elem in self._walk(ref.struct_name,
+                            _compose(mats[start:start+step], ref_mats), xy_arrays):
+                        yield elem
+
+    def _emit(self, geometry, mats, xy_arrays):
+        """Yield elements of `geometry` placed with transformations `mats`."""
+        ends = geometry.ends.tolist()
+        begins = [0] + ends[:-1]
+        new_points = points.PointArray.__new__
+        point_array = points.PointArray
+        first = 0
+        while first < len(ends):
+            # elements from first to last with about _CHUNK points
+            base = begins[first]
+            last = max(first + 1, bisect.bisect_right(ends, base + _CHUNK))
+            coords = geometry.coords[base:ends[last - 1]]
+            step = max(1, _CHUNK // max(len(coords), 1))
+            # (decoder, attributes, first coordinate, end coordinate, index)
+            # for each element, index is None if only coordinates are changed
+            group = []
+            for index in range(first, last):
+                template = geometry.elements[index]
+                kind = _codec.CLASS_INDEX[type(template)]
+                group.append((_codec.DECODERS[kind], _codec.GETTERS[kind](template),
+                    2 * (begins[index] - base), 2 * (ends[index] - base),
+                    index if isinstance(template, _TRANSFORMED) else None))
+            for start in range(0, len(mats), step):
+                chunk = mats[start:start+step]
+                placed = numpy.rint(_apply(chunk, coords)).astype(numpy.int32)
+                for (mat, instance) in zip(chunk, placed):
+                    if xy_arrays:
+                        flat = array(points._TYPECODE)
+                        flat.frombytes(instance.tobytes())
+                    else:
+                        flat = instance.ravel().tolist()
+                    for (decode, values, begin, end, index) in group:
+                        if xy_arrays:
+                            xy = new_points(point_array)
+                            xy.flat = flat[begin:end]
+                        else:
+                            xy = iter(flat[begin:end])
+                            xy = list(zip(xy, xy))
+                        elem = decode(values, xy)
+                        if index is not None:
+                            _transform_attributes(elem, mat, geometry.linear[index])
+                        yield elem
+            first = last
+
+    def flatten(self, name, xy_arrays=False):
+        """
+        Yield copies of non-reference elements of structure `name` and of all
+        structures referenced by it, with absolute coordinates.
+
+        :param name: name of the structure to expand
+        :param xy_arrays: if true, :attr:`xy` attributes are
+            :class:`gdsii.points.PointArray` objects
+        :raises: :exc:`KeyError` if there is no such structure
+        """
+        self.library.structure_by_name(name)
+        identity = numpy.array([(1, 0, 0, 1, 0, 0)], dtype=numpy.float64)
+        return self._walk(name, identity, xy_arrays)
+
+def flatten(lib, name, xy_arrays=False, cache_limit=None):
+    """
+    Yield elements of structure `name` of library `lib` with all references
+    expanded. See :meth:`Flattener.flatten`.
+
+    :param cache_limit: see :attr:`Flattener.cache_limit`
+    """
+    return Flattener(lib, cache_limit).flatten(name, xy_arrays)
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.geometry` --- geometry metrics of elements
+======================================================
+
+This module computes area, perimeter, orientation and bounding box of
+:class:`gdsii.elements.Boundary`, :class:`gdsii.elements.Box` and
+:class:`gdsii.elements.Path` elements. Coordinates of all elements are
+concatenated and each metric is computed with a few :mod:`numpy` calls
+for all elements at once::
+
+    metrics = measure(struc)
+    print(metrics.area.sum())
+    for (key, (count, area, perimeter, density)) in metrics.totals().items():
+        print(key, count, area, density)
+
+:func:`measure_columns` does the same for a
+:class:`gdsii.columns.ColumnStore` without creating elements, which is the
+fastest way to process large layers.
+
+Areas of polygons are computed with the shoelace formula. Paths are
+measured as straight rectangles of length equal to the length of the
+center line plus extensions (with half discs at round ends), overlaps
+at bends are not subtracted. Bounding boxes of paths are extended like
+those of :mod:`gdsii.extents`, including corners of miter joins, but
+not rounded. Coordinates are in database units.
+
+Requires :mod:`numpy`.
+"""
+from __future__ import absolute_import
+from . import columns, elements, points
+from array import array
+import itertools
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('Metrics', 'measure', 'measure_columns')
+
+def _check_numpy():
+    if numpy is None:
+        raise ImportError('numpy is required for gdsii.geometry')
+
+class Metrics(object):
+    """
+    Metrics of measured elements, all attributes are :mod:`numpy` arrays
+    with one item per element:
+
+        * :attr:`indices` -- index of the element in the measured sequence,
+        * :attr:`layers` and :attr:`data_types` -- layer and data type
+          (or box type) of the element,
+        * :attr:`area` -- area, non-negative,
+        * :attr:`perimeter` -- perimeter,
+        * :attr:`orientation` -- 1 for polygons with points in
+          counterclockwise order, -1 for clockwise order and 0 for
+          degenerate polygons and paths,
+        * :attr:`bboxes` -- bounding boxes ``(xmin, ymin, xmax, ymax)``,
+          array of shape ``(N, 4)``.
+    """
+    __slots__ = ('indices', 'layers', 'data_types', 'area', 'perimeter', 'orientation',
+            'bboxes')
+
+    def __len__(self):
+        return len(self.indices)
+
+    def bbox(self):
+        """
+        Return bounding box of all elements or None if there are no elements.
+        """
+        if not len(self):
+            return None
+        (xmin, ymin) = self.bboxes[:, :2].min(axis=0).tolist()
+        (xmax, ymax) = self.bboxes[:, 2:].max(axis=0).tolist()
+        return (xmin, ymin, xmax, ymax)
+
+    def totals(self, region=None):
+        """
+        Return dictionary mapping pairs ``(layer, type)`` to tuples
+        ``(count, area, perimeter, density)``, where density is the total
+        area divided by area of rectangle `region` ``(xmin, ymin, xmax, ymax)``.
+        By default `region` is the bounding box of all elements.
+        Overlapping elements are counted several times.
+        """
+        if not len(self):
+            return {}
+        if region is None:
+            region = self.bbox()
+        region_area = float(region[2] - region[0]) * (region[3] - region[1])
+        # one 64-bit key per pair is much faster to sort than rows of an array
+        pairs = (self.layers.astype(numpy.int64) << 32) | \
+                (self.data_types.astype(numpy.int64) & 0xffffffff)
+        (keys, inverse) = numpy.unique(pairs, return_inverse=True)
+        keys = numpy.stack((keys >> 32, (keys & 0xffffffff).astype(numpy.int32)), axis=1)
+        counts = numpy.bincount(inverse)
+        areas = numpy.bincount(inverse, weights=self.area)
+        perimeters = numpy.bincount(inverse, weights=self.perimeter)
+        densities = areas / region_area if region_area else numpy.zeros(len(keys))
+        return dict((tuple(key), (count, area, perimeter, density))
+                for (key, count, area, perimeter, density) in zip(keys.tolist(),
+                    counts.tolist(), areas.tolist(), perimeters.tolist(),
+                    densities.tolist()))
+
+_EMPTY = (numpy.empty(0), numpy.empty(0), numpy.empty(0, dtype=numpy.int8),
+        numpy.empty((0, 4))) if numpy is not None else None
+
+def _miter_corners(coords, starts, halves):
+    """
+    Return tuple ``(ids, corners)`` with corners of miter joins of paths
+    with points ``coords[starts[i]:starts[i+1]]`` and half widths
+    ``halves[i]`` (zero for elements that are skipped), computed as by
+    :mod:`gdsii.outline`; `ids` are indices of elements of the corners.
+    """
+    counts = numpy.diff(numpy.append(starts, len(coords)))
+    elem_ids = numpy.repeat(numpy.arange(len(starts)), counts)
+    # consecutive equal points are ignored
+    keep = halves[elem_ids] > 0
+    keep[1:] &= (coords[1:] != coords[:-1]).any(axis=1) | (elem_ids[1:] != elem_ids[:-1])
+    (pts, ids) = (coords[keep], elem_ids[keep])
+    inner = numpy.nonzero((ids[1:-1] == ids[:-2]) & (ids[1:-1] == ids[2:]))[0] + 1
+    segments = pts[1:] - pts[:-1]
+    lengths = numpy.hypot(segments[:, 0], segments[:, 1])
+    segments /= numpy.where(lengths, lengths, 1)[:, None]
+    (incoming, outgoing) = (segments[inner - 1], segments[inner])
+    denominators = 1 + (incoming * outgoing).sum(axis=1)
+    # joins of paths turning back are beveled and stay within the half width
+    inner = inner[denominators >= 1e-9]
+    (incoming, outgoing) = (segments[inner - 1], segments[inner])
+    scale = halves[ids[inner]] / (1 + (incoming * outgoing).sum(axis=1))
+    miters = numpy.stack((incoming[:, 1] + outgoing[:, 1], -incoming[:, 0] - outgoing[:, 0]),
+            axis=1) * scale[:, None]
+    return (numpy.tile(ids[inner], 2),
+            numpy.concatenate((pts[inner] + miters, pts[inner] - miters)))
+
+def _compute(coords, starts, is_path, widths, path_types, bgn_extns, end_extns):
+    """
+    Return tuple ``(area, perimeter, orientation, bboxes)`` for elements
+    with points ``coords[starts[i]:starts[i+1]]``. Path parameters are
+    arrays with one item per element, ignored where `is_path` is false.
+    """
+    count = len(starts)
+    if not count:
+        return _EMPTY
+    last = numpy.empty(count, dtype=numpy.int64)
+    last[:-1] = starts[1:] - 1
+    last[-1] = len(coords) - 1
+    # points relative to the first point of their element, so that cross
+    # products of large coordinates do not cancel
+    relative = coords - coords[numpy.repeat(starts, last - starts + 1)]
+    (xs, ys) = (relative[:, 0], relative[:, 1])
+
+    # values for pairs of consecutive points, the pair starting at the last
+    # point of an element is zeroed, so sums over elements can use reduceat()
+    cross = numpy.zeros(len(coords))
+    cross[:-1] = xs[:-1] * ys[1:] - xs[1:] * ys[:-1]
+    lengths = numpy.zeros(len(coords))
+    (dxs, dys) = (xs[1:] - xs[:-1], ys[1:] - ys[:-1])
+    lengths[:-1] = numpy.sqrt(dxs * dxs + dys * dys)
+    cross[last] = 0
+    lengths[last] = 0
+    # the closing pair contributes nothing, the first point is the origin
+    signed = 0.5 * numpy.add.reduceat(cross, starts)
+    length = numpy.add.reduceat(lengths, starts)
+
+    area = numpy.abs(signed)
+    perimeter = length + numpy.hypot(xs[last], ys[last])
+    orientation = numpy.sign(signed).astype(numpy.int8)
+    pads = numpy.zeros(count)
+    corners = None
+    if is_path.any():
+        corners = _miter_corners(coords, starts, numpy.where(is_path, numpy.abs(widths) / 2, 0))
+        widths = numpy.abs(widths[is_path])
+        path_types = path_types[is_path]
+        length = length[is_path]
+        extensions = numpy.where(path_types == 2, widths,
+                numpy.where(path_types == 4, bgn_extns[is_path] + end_extns[is_path], 0))
+        round_ends = path_types == 1
+        area[is_path] = widths * (length + extensions) + \
+                numpy.where(round_ends, math.pi / 4 * widths * widths, 0)
+        perimeter[is_path] = 2 * (length + extensions) + \
+                numpy.where(round_ends, math.pi, 2) * widths
+        orientation[is_path] = 0
+        pads[is_path] = widths / 2 + numpy.where(path_types == 2, widths / 2,
+                numpy.where(path_types == 4, numpy.maximum(numpy.maximum(bgn_extns[is_path],
+                    end_extns[is_path]), 0), 0))
+    pads = pads[:, None]
+    bboxes = numpy.concatenate((numpy.minimum.reduceat(coords, starts) - pads,
+        numpy.maximum.reduceat(coords, starts) + pads), axis=1)
+    if corners is not None:
+        (ids, points) = corners
+        numpy.minimum.at(bboxes[:, :2], ids, points)
+        numpy.maximum.at(bboxes[:, 2:], ids, points)
+    return (area, perimeter, orientation, bboxes)
+
+def _metrics(indices, layers, data_types, values):
+    metrics = Metrics()
+    metrics.indices = indices
+    metrics.layers = layers
+    metrics.data_types = data_types
+    (metrics.area, metrics.perimeter, metrics.orientation, metrics.bboxes) = values
+    return metrics
+
+def measure(elems, layers=None):
+    """
+    Return :class:`Metrics` of :class:`gdsii.elements.Boundary`,
+    :class:`gdsii.elements.Box` and :class:`gdsii.elements.Path` elements
+    from sequence `elems` (for example a structure). Other elements are
+    skipped, :attr:`Metrics.indices` are indices in `elems`.
+
+    :param layers: if not None, only elements with pairs ``(layer, type)``
+        from this set are measured
+    """
+    _check_numpy()
+    flat = array(points._TYPECODE)
+    extend = flat.extend
+    chain = itertools.chain.from_iterable
+    starts = array('q')
+    indices = array('q')
+    layer_list = array(points._TYPECODE)
+    type_list = array(points._TYPECODE)
+    # parameters of paths: index in the result, width, type, extensions
+    path_rows = array('q')
+    path_params = array('d')
+    for (index, elem) in enumerate(elems):
+        cls = type(elem)
+        if cls is elements.Boundary or cls is elements.Path:
+            data_type = elem.data_type
+        elif cls is elements.Box:
+            data_type = elem.box_type
+        else:
+            continue
+        if layers is not None and (elem.layer, data_type) not in layers:
+            continue
+        if cls is elements.Path:
+            path_rows.append(len(indices))
+            path_params.extend((elem.width or 0, elem.path_type or 0, elem.bgn_extn or 0,
+                elem.end_extn or 0))
+        indices.append(index)
+        layer_list.append(elem.layer)
+        type_list.append(data_type)
+        starts.append(len(flat) // 2)
+        xy = elem.xy
+        if isinstance(xy, points.PointArray):
+            extend(xy.flat)
+        else:
+            extend(chain(xy))
+
+    count = len(indices)
+    coords = numpy.frombuffer(flat, dtype=numpy.int32).reshape(-1, 2).astype(numpy.float64)
+    is_path = numpy.zeros(count, dtype=bool)
+    params = numpy.zeros((count, 4))
+    if path_rows:
+        rows = numpy.frombuffer(path_rows, dtype=numpy.int64)
+        is_path[rows] = True
+        params[rows] = numpy.frombuffer(path_params, dtype=numpy.float64).reshape(-1, 4)
+    values = _compute(coords, numpy.frombuffer(starts, dtype=numpy.int64), is_path,
+            params[:, 0], params[:, 1], params[:, 2], params[:, 3])
+    return _metrics(numpy.frombuffer(indices, dtype=numpy.int64),
+            numpy.frombuffer(layer_list, dtype=numpy.int32),
+            numpy.frombuffer(type_list, dtype=numpy.int32), values)
+
+def measure_columns(store, layers=None):
+    """
+    Return :class:`Metrics` of elements in :class:`gdsii.columns.ColumnStore`
+    `store`, computed directly from the columns. Elements are ordered by
+    pairs ``(layer, type)``, :attr:`Metrics.indices` are indices of elements
+    in their :class:`gdsii.columns.LayerColumns`. Nodes and elements in
+    :attr:`gdsii.columns.ColumnStore.others` are skipped.
+
+    :param layers: if not None, only pairs ``(layer, type)`` from this set
+        are measured
+    """
+    _check_numpy()
+    keys = sorted(key for key in store if layers is None or key in layers)
+    result = []
+    for key in keys:
+        layer = store[key]
+        if not len(layer):
+            continue
+        coords = layer.as_numpy().astype(numpy.float64)
+        offsets = numpy.frombuffer(layer.offsets, dtype=numpy.int64)
+        kinds = numpy.frombuffer(layer.kinds, dtype=numpy.uint8)
+        widths = numpy.frombuffer(layer.widths, dtype=numpy.int32).astype(numpy.float64)
+        path_types = numpy.frombuffer(layer.path_types, dtype=numpy.int32)
+        is_path = kinds == columns._PATH
+        widths[widths == columns._NONE] = 0
+        path_types = numpy.where(path_types == columns._NONE, 0, path_types)
+        zeros = numpy.zeros(len(kinds))
+        values = _compute(coords, offsets[:-1], is_path, widths, path_types, zeros, zeros)
+        selected = numpy.nonzero(kinds != columns._KIND_INDEX[elements.Node])[0]
+        result.append((selected, key, [value[selected] for value in values]))
+    if not result:
+        return _metrics(numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.int32),
+                numpy.empty(0, dtype=numpy.int32), _EMPTY)
+    return _metrics(numpy.concatenate([selected for (selected, key, values) in result]),
+            numpy.concatenate([numpy.full(len(selected), key[0], dtype=numpy.int32)
+                for (selected, key, values) in result]),
+            numpy.concatenate([numpy.full(len(selected), key[1], dtype=numpy.int32)
+                for (selected, key, values) in result]),
+            [numpy.concatenate([values[i] for (selected, key, values) in result])
+                for i in range(4)])
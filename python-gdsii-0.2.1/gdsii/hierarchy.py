@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.hierarchy` --- graph of structure references
+========================================================
+
+This module contains :class:`Hierarchy`, a graph of references between
+structures of a library. Nodes of the graph are structure names, there is
+an edge from a parent to a child if the parent contains
+:class:`gdsii.elements.SRef` or :class:`gdsii.elements.ARef` elements
+referring to the child.
+
+The graph is built with one pass over all elements, after that queries
+take constant time or time proportional to the number of returned names.
+Usually it is obtained with :meth:`gdsii.library.Library.hierarchy`, which
+caches the graph until references in the library change::
+
+    graph = lib.hierarchy()
+    for name in graph.top_cells():
+        print(name, graph.children(name))
+"""
+from __future__ import absolute_import
+from . import elements, exceptions
+
+__all__ = ('Hierarchy',)
+
+_REFERENCES = (elements.SRef, elements.ARef)
+
+class Hierarchy(object):
+    """
+    Graph of references between structures.
+
+    If there are several structures with the same name, only the first one
+    is used, as in :meth:`gdsii.library.Library.structure_by_name`.
+    """
+
+    def __init__(self, structures):
+        """
+        Build the graph from an iterable of structures.
+        """
+        names = []
+        children = {}
+        for struc in structures:
+            name = struc.name
+            if name in children:
+                continue
+            names.append(name)
+            counts = {}
+            for elem in struc:
+                if isinstance(elem, _REFERENCES):
+                    child = elem.struct_name
+                    counts[child] = counts.get(child, 0) + 1
+            children[name] = counts
+
+        parents = dict((name, {}) for name in names)
+        ref_counts = dict.fromkeys(names, 0)
+        undefined = set()
+        for name in names:
+            for (child, count) in children[name].items():
+                if child not in parents:
+                    undefined.add(child)
+                    parents[child] = {}
+                    ref_counts[child] = 0
+                parents[child][name] = count
+                ref_counts[child] += count
+
+        self._names = names
+        self._children = children
+        self._parents = parents
+        self._ref_counts = ref_counts
+        self._undefined = undefined
+        self._order = None
+
+    def __len__(self):
+        """Return number of structures."""
+        return len(self._names)
+
+    def __iter__(self):
+        """Iterate over structure names in library order."""
+        return iter(self._names)
+
+    def __contains__(self, name):
+        """Return true if there is a structure named `name`."""
+        return name in self._children
+
+    def _check(self, name):
+        if name not in self._parents:
+            raise KeyError(name)
+
+    def children(self, name):
+        """
+        Return :class:`dict` mapping names of structures referenced by
+        structure `name` to numbers of referring elements.
+        """
+        self._check(name)
+        return dict(self._children.get(name, ()))
+
+    def parents(self, name):
+        """
+        Return :class:`dict` mapping names of structures referring to
+        structure `name` to numbers of referring elements.
+        """
+        self._check(name)
+        return dict(self._parents[name])
+
+    def ref_count(self, name):
+        """
+        Return total number of :class:`gdsii.elements.SRef` and
+        :class:`gdsii.elements.ARef` elements referring to structure `name`.
+        """
+        self._check(name)
+        return self._ref_counts[name]
+
+    def top_cells(self):
+        """Return list of names of structures that are not referenced."""
+        ref_counts = self._ref_counts
+        return [name for name in self._names if not ref_counts[name]]
+
+    def undefined(self):
+        """Return set of names that are referenced but have no structure."""
+        return set(self._undefined)
+
+    def descendants(self, name):
+        """
+        Return set of names of all structures referenced by structure
+        `name` directly or indirectly, including undefined ones.
+        """
+        self._check(name)
+        children = self._children
+        result = set()
+        stack = [name]
+        while stack:
+            for child in children.get(stack.pop(), ()):
+                if child not in result:
+                    result.add(child)
+                    stack.append(child)
+        return result
+
+    def topological_order(self):
+        """
+        Return list of structure names where each structure follows all
+        structures it references (that is, leaf cells come first).
+        Undefined names are not included.
+
+        :raises: :exc:`gdsii.exceptions.FormatError` if references are cyclic
+        """
+        if self._order is None:
+            children = self._children
+            parents = self._parents
+            undefined = self._undefined
+            remaining = dict((name, len(children[name]) -
+                len(undefined.intersection(children[name]))) for name in self._names)
+            order = [name for name in self._names if not remaining[name]]
+            for name in order:
+                for parent in parents[name]:
+                    remaining[parent] -= 1
+                    if not remaining[parent]:
+                        order.append(parent)
+            if len(order) != len(self._names):
+                cyclic = [name for name in self._names if remaining[name]]
+                raise exceptions.FormatError('cyclic references in hierarchy '
+                        'of structure %s' % cyclic[0].decode())
+            self._order = order
+        return list(self._order)
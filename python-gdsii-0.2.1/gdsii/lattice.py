@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.lattice` --- instances of array references
+======================================================
+
+This module contains :class:`Lattice`, which describes instances of
+a :class:`gdsii.elements.ARef` without expanding them. Usually it is
+obtained with :meth:`gdsii.elements.ARef.lattice`::
+
+    lattice = aref.lattice()
+    box = lib.bbox(aref.struct_name)
+    print(len(lattice), lattice.bbox(box))
+    for (col, row) in lattice.query(0, 0, 1000, 1000, box):
+        print(lattice.origin(col, row))
+
+Instance ``(col, row)`` is placed at ``P0 + col * (P1 - P0) / cols +
+row * (P2 - P0) / rows``, where ``P0``, ``P1`` and ``P2`` are points of
+:attr:`xy` of the reference. Queries are computed with exact integer
+arithmetic for integer arguments and take time proportional to the number
+of rows of the lattice crossing the queried rectangle, not to the number
+of instances.
+
+Bounding boxes of instances are computed as in :mod:`gdsii.extents`.
+:meth:`Lattice.origin_array` requires :mod:`numpy`, the rest of this
+module does not.
+"""
+from __future__ import absolute_import
+from . import extents
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('Lattice',)
+
+def _div(num, den):
+    """Return `num` / `den`, an integer if the division is exact."""
+    if not isinstance(num, float) and num % den == 0:
+        return num // den
+    return num / float(den)
+
+def _floor_div(num, den):
+    return int(math.floor(num / float(den))) if isinstance(num, float) else num // den
+
+def _ceil_div(num, den):
+    return -_floor_div(-num, den)
+
+def _range(low, high, base, step):
+    """
+    Return integers ``k`` such that ``low <= base + k * step <= high`` as
+    ``(first, last)``, or None if all integers satisfy the condition.
+    """
+    if step > 0:
+        return (_ceil_div(low - base, step), _floor_div(high - base, step))
+    if step < 0:
+        return (_ceil_div(high - base, step), _floor_div(low - base, step))
+    if low <= base <= high:
+        return None
+    return (1, 0)
+
+class Lattice(object):
+    """
+    Instances of an array reference. Values are taken from the reference
+    when the lattice is created, later changes of the reference are not
+    reflected.
+    """
+    __slots__ = ('cols', 'rows', 'reference', '_origin', '_col_step', '_row_step')
+
+    def __init__(self, aref):
+        """Create lattice of instances of :class:`gdsii.elements.ARef` `aref`."""
+        self.reference = aref
+        (self.cols, self.rows) = (aref.cols, aref.rows)
+        ((x0, y0), (x1, y1), (x2, y2)) = aref.xy[:3]
+        self._origin = (x0, y0)
+        # steps multiplied by cols * rows, so that they are integers
+        self._col_step = ((x1 - x0) * self.rows, (y1 - y0) * self.rows)
+        self._row_step = ((x2 - x0) * self.cols, (y2 - y0) * self.cols)
+
+    def __len__(self):
+        return self.cols * self.rows
+
+    def origin(self, col, row):
+        """
+        Return origin ``(x, y)`` of instance in column `col` and row `row`.
+        Coordinates are integers when the pitch allows it.
+
+        :raises: :exc:`IndexError` if the instance does not exist
+        """
+        if not (0 <= col < self.cols and 0 <= row < self.rows):
+            raise IndexError('instance (%d, %d) out of range' % (col, row))
+        scale = self.cols * self.rows
+        return tuple(_div(origin * scale + col * col_step + row * row_step, scale)
+                for (origin, col_step, row_step) in zip(self._origin, self._col_step,
+                    self._row_step))
+
+    def origins(self):
+        """
+        Generate tuples ``(col, row, x, y)`` for all instances, ordered
+        by rows.
+        """
+        origin = self.origin
+        for row in range(self.rows):
+            for col in range(self.cols):
+                (x, y) = origin(col, row)
+                yield (col, row, x, y)
+
+    def origin_array(self, start=0, stop=None):
+        """
+        Return :mod:`numpy` array of shape ``(N, 2)`` with origins of
+        instances in rows ``range(start, stop)`` (all rows by default),
+        ordered by rows.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required for Lattice.origin_array')
+        stop = self.rows if stop is None else min(stop, self.rows)
+        scale = float(self.cols * self.rows)
+        cols = numpy.arange(self.cols, dtype=numpy.float64)
+        rows = numpy.arange(max(start, 0), max(start, stop), dtype=numpy.float64)
+        result = numpy.empty((len(rows), self.cols, 2))
+        for axis in (0, 1):
+            result[:, :, axis] = self._origin[axis] + \
+                    (cols * self._col_step[axis])[None, :] / scale + \
+                    (rows * self._row_step[axis])[:, None] / scale
+        return result.reshape(-1, 2)
+
+    def _extent(self, box):
+        """
+        Return bounding box of an instance at origin ``(0, 0)`` of
+        a structure with bounding box `box`, ``(0, 0, 0, 0)`` if `box` is None.
+        """
+        if box is None:
+            return (0, 0, 0, 0)
+        ref = self.reference
+        (a, b, c, d) = extents._linear(ref.strans, ref.mag, ref.angle)
+        corners = [(a * x + b * y, c * x + d * y)
+                for (x, y) in ((box[0], box[1]), (box[2], box[1]), (box[0], box[3]),
+                    (box[2], box[3]))]
+        xs = [x for (x, y) in corners]
+        ys = [y for (x, y) in corners]
+        return (int(math.floor(min(xs))), int(math.floor(min(ys))),
+                int(math.ceil(max(xs))), int(math.ceil(max(ys))))
+
+    def bbox(self, box=None):
+        """
+        Return bounding box of all instances of a structure with bounding
+        box `box`. If `box` is None, return bounding box of origins.
+        """
+        if not len(self):
+            return None
+        origins = [self.origin(col, row) for col in (0, self.cols - 1)
+                for row in (0, self.rows - 1)]
+        extent = self._extent(box)
+        return (int(math.floor(min(x for (x, y) in origins) + extent[0])),
+                int(math.floor(min(y for (x, y) in origins) + extent[1])),
+                int(math.ceil(max(x for (x, y) in origins) + extent[2])),
+                int(math.ceil(max(y for (x, y) in origins) + extent[3])))
+
+    def _col_range(self, low, high, row, axis):
+        scale = self.cols * self.rows
+        base = self._origin[axis] * scale + row * self._row_step[axis]
+        return _range(low[axis], high[axis], base, self._col_step[axis])
+
+    def _row_limits(self, low, high):
+        """
+        Return range of rows that can contain origins in rectangle
+        ``low``, ``high`` (scaled by ``cols * rows``).
+        """
+        (ux, uy) = self._col_step
+        (vx, vy) = self._row_step
+        # distance from the line through columns of row 0 does not depend on col
+        (nx, ny) = (-uy, ux)
+        along = nx * vx + ny * vy
+        if not along:
+            return (0, self.rows - 1)
+        scale = self.cols * self.rows
+        base = (nx * self._origin[0] + ny * self._origin[1]) * scale
+        values = [nx * x + ny * y for x in (low[0], high[0]) for y in (low[1], high[1])]
+        (first, last) = _range(min(values), max(values), base, along)
+        return (max(first, 0), min(last, self.rows - 1))
+
+    def query(self, xmin, ymin, xmax, ymax, box=None):
+        """
+        Generate pairs ``(col, row)`` of instances of a structure with
+        bounding box `box` whose bounding boxes intersect rectangle
+        ``(xmin, ymin, xmax, ymax)``, ordered by rows. If `box` is None,
+        instances with origins in the rectangle are generated.
+        """
+        extent = self._extent(box)
+        scale = self.cols * self.rows
+        low = ((xmin - extent[2]) * scale, (ymin - extent[3]) * scale)
+        high = ((xmax - extent[0]) * scale, (ymax - extent[1]) * scale)
+        if low[0] > high[0] or low[1] > high[1]:
+            return
+        (first_row, last_row) = self._row_limits(low, high)
+        for row in range(first_row, last_row + 1):
+            (first, last) = (0, self.cols - 1)
+            for axis in (0, 1):
+                limits = self._col_range(low, high, row, axis)
+                if limits is not None:
+                    (first, last) = (max(first, limits[0]), min(last, limits[1]))
+            for col in range(first, last + 1):
+                yield (col, row)
+
+    def query_point(self, x, y, box=None):
+        """
+        Return list of pairs ``(col, row)`` of instances whose bounding
+        boxes contain point ``(x, y)``, see :meth:`query`.
+        """
+        return list(self.query(x, y, x, y, box))
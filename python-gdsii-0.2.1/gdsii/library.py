@@ -23,7 +23,8 @@ This module contains class that represents a GDSII library.
 .. moduleauthor:: Eugeniy Meshcheryakov <eugen@debian.org>
 """
 from __future__ import absolute_import
-from . import exceptions, record, structure, tags, _records
+from . import exceptions, extents, hierarchy, record, structure, tags, _records
+from collections import OrderedDict
 from datetime import datetime
 
 _HEADER = _records.SimpleRecord('version', tags.HEADER)
@@ -62,10 +63,26 @@ class Library(list):
                    : ENDLIB
             format: FORMAT
                   : [MASK+ ENDMASKS]
+
+    The library keeps an index of structure names (see
+    :meth:`structure_by_name`) and a graph of references between structures
+    (see :meth:`hierarchy`). Both are updated when structures are added or
+    removed with list methods, and when references are added to or removed
+    from structures. If structures are renamed or attributes of references
+    are changed in place, :meth:`reindex` must be called. Bounding boxes
+    of structures (see :meth:`bbox`) are cached until elements of any
+    structure are changed.
     """
     _gds_objs = (_HEADER, _BGNLIB, _LIBDIRSIZE, _SRFNAME, _LIBSECUR, _LIBNAME, _REFLIBS,
             _FONTS, _ATTRTABLE, _GENERATIONS, _FORMAT, _UNITS)
 
+    # dictionary of structures by name, built on demand
+    _names = None
+    # tuple (structure._reference_generation, hierarchy.Hierarchy), built on demand
+    _hierarchy = None
+    # tuple (structure._generation, dictionary of bounding boxes by name), built on demand
+    _bboxes = None
+
     def __init__(self, version, name, physical_unit, logical_unit, mod_time=None,
             acc_time=None):
         """
@@ -94,28 +111,129 @@ class Library(list):
         self.masks = None
 
     @classmethod
-    def load(cls, stream):
+    def load(cls, stream, xy_arrays=False, validate=True, layers=None,
+            element_types=None):
         """
         Load a GDS library from a file.
 
+        If `stream` is a real file, it is mapped into memory and records are
+        parsed directly from the mapping (see :class:`gdsii.record.MappedReader`).
+        Otherwise records are read from the stream one by one.
+
         :param stream: a :class:`file` or file-like object opened for reading in binary mode.
+        :param xy_arrays: if true, :attr:`xy` attributes of elements are
+            :class:`gdsii.points.PointArray` objects instead of lists of tuples.
+        :param validate: if false, tags and data sizes of records inside
+            structures are not checked. This is faster, but should be used only
+            for files known to be correct (e.g. written by this library).
+            Truncated files are still detected.
+        :param layers: if not None, only elements with pairs ``(layer, type)``
+            from this set are loaded, where ``type`` is :attr:`data_type`,
+            :attr:`text_type`, :attr:`node_type` or :attr:`box_type`.
+            :class:`gdsii.elements.SRef` and :class:`gdsii.elements.ARef`
+            have no layer and are not affected.
+        :param element_types: if not None, only elements of these classes
+            from :mod:`gdsii.elements` are loaded.
         :returns: a new library.
+
+        Records of elements that are not loaded are skipped without parsing::
+
+            lib = Library.load(stream, layers={(74, 30), (5, 3)},
+                    element_types={Boundary, Path})
+        """
+        mapping = record._map_stream(stream)
+        if mapping is None:
+            return cls._load(record.Reader(stream, xy_arrays, False, layers,
+                element_types), validate)
+        gen = record.MappedReader(mapping, stream.tell(), xy_arrays, False, layers,
+                element_types)
+        try:
+            self = cls._load(gen, validate)
+            stream.seek(gen.offset)
+        finally:
+            gen.close()
+            record._unmap(mapping)
+        return self
+
+    @classmethod
+    def open_lazy(cls, path, xy_arrays=False, validate=True, cache_size=1 << 24,
+            exact=True):
+        """
+        Open a GDS file without loading structures. The file is mapped into
+        memory and scanned for structure boundaries (see
+        :func:`gdsii.record.scan_structures`), structures are parsed
+        when accessed for the first time. See :class:`LazyLibrary`::
+
+            with Library.open_lazy('chip.gds') as lib:
+                struc = lib[lib.structure_names().index(b'top')]
+
+        :param path: name of GDS file
+        :param xy_arrays: same as for :meth:`load`
+        :param validate: same as for :meth:`load`
+        :param cache_size: see :attr:`LazyLibrary.cache_size`
+        :param exact: same as for :func:`gdsii.record.scan_structures`
+        :returns: a new :class:`LazyLibrary`
+        """
+        if not issubclass(cls, LazyLibrary):
+            cls = LazyLibrary
+        return cls._open(path, xy_arrays, validate, cache_size, exact)
+
+    @classmethod
+    def load_parallel(cls, path, workers=None, xy_arrays=False, validate=True):
+        """
+        Load a GDS library from a file, parsing structures in multiple
+        processes. See :func:`gdsii.parallel.load_library` for details.
+
+        :param path: name of GDS file
+        :param workers: number of worker processes, number of CPUs by default
+        :param xy_arrays: same as for :meth:`load`
+        :param validate: same as for :meth:`load`
+        :returns: a new library.
+        """
+        from . import parallel
+        return parallel.load_library(path, cls, workers, xy_arrays, validate)
+
+    @classmethod
+    def load_async(cls, stream, xy_arrays=False, validate=True):
+        """
+        Load a GDS library from :class:`asyncio.StreamReader`.
+        This is a coroutine, see :func:`gdsii.aio.load_library` for details::
+
+            lib = await Library.load_async(stream_reader)
+
+        :param stream: :class:`asyncio.StreamReader` or any object with
+            coroutine method ``read(n)``.
+        :param xy_arrays: same as for :meth:`load`
+        :param validate: same as for :meth:`load`
+        :returns: a new library.
+        """
+        from . import aio
+        return aio.load_library(stream, cls, xy_arrays, validate)
+
+    @classmethod
+    def _load_header(cls, gen):
+        """
+        Create a new library and read library header using `gen`.
+        On return ``gen.current`` is the first record after the header.
         """
         self = cls.__new__(cls)
         list.__init__(self)
         self._init_optional()
 
-        gen = record.Reader(stream)
-
         gen.read_next()
         for obj in self._gds_objs:
             obj.read(self, gen)
+        return self
+
+    @classmethod
+    def _load(cls, gen, validate=True):
+        self = cls._load_header(gen)
 
         # read structures starting with BGNSTR or ENDLIB
         rec = gen.current
         while True:
             if rec.tag == tags.BGNSTR:
-                self.append(structure.Structure._load(gen))
+                self.append(structure.Structure._load(gen, validate))
                 rec = gen.read_next()
             elif rec.tag == tags.ENDLIB:
                 break
@@ -129,11 +247,404 @@ class Library(list):
 
         :param stream: a :class:`file` or file-like object opened for writing in binary mode.
         """
+        writer = record.RecordWriter(stream)
         for obj in self._gds_objs:
-            obj.save(self, stream)
+            obj.save(self, writer)
+        self._save_structures(writer)
+        writer.write(tags.ENDLIB)
+        writer.flush()
+
+    def _save_structures(self, writer):
         for struc in self:
-            struc._save(stream)
-        record.Record(tags.ENDLIB).save(stream)
+            struc._save(writer)
+
+    def structure_by_name(self, name):
+        """
+        Return structure named `name`. If there are several structures
+        with the same name, the first one is returned.
+        The index of names is built on the first call, so this method
+        takes constant time.
+
+        :raises: :exc:`KeyError` if there is no such structure
+        """
+        names = self._names
+        if names is None:
+            names = self._names = {}
+            for item in list.__iter__(self):
+                names.setdefault(item.name, item)
+        item = names[name]
+        if item.name != name:
+            # renamed without reindex()
+            self._names = None
+            return self.structure_by_name(name)
+        return item
+
+    def hierarchy(self):
+        """
+        Return :class:`gdsii.hierarchy.Hierarchy` of structures in the library.
+        The graph is cached until structures or references are added or
+        removed.
+        """
+        cached = self._hierarchy
+        if cached is None or cached[0] != structure._reference_generation:
+            cached = (structure._reference_generation, hierarchy.Hierarchy(self))
+            self._hierarchy = cached
+        return cached[1]
+
+    def bbox(self, top):
+        """
+        Return bounding box ``(xmin, ymin, xmax, ymax)`` of structure named
+        `top` with all instances of referenced structures, or None if it
+        is empty. See :mod:`gdsii.extents`.
+
+        Bounding boxes are computed bottom-up, once for each structure in
+        the hierarchy of `top`, and cached, so that repeated calls take
+        constant time.
+
+        :raises: :exc:`KeyError` if there is no such structure
+        :raises: :exc:`gdsii.exceptions.FormatError` if references are cyclic
+        """
+        boxes = self._bbox_cache()
+        if top not in boxes:
+            self.structure_by_name(top)
+            graph = self.hierarchy()
+            needed = graph.descendants(top)
+            needed.add(top)
+            for name in graph.topological_order():
+                if name in needed and name not in boxes:
+                    boxes[name] = self._references_bbox(self.structure_by_name(name), boxes)
+        return boxes[top]
+
+    def _bbox_cache(self):
+        """Return dictionary of cached bounding boxes by structure name."""
+        cached = self._bboxes
+        if cached is None or cached[0] != structure._generation:
+            cached = self._bboxes = (structure._generation, {})
+        return cached[1]
+
+    def _references_bbox(self, struc, boxes):
+        """
+        Return bounding box of `struc`, bounding boxes of referenced
+        structures are taken from `boxes`.
+        """
+        result = [struc.bbox()]
+        for elem in struc:
+            if isinstance(elem, structure._REFERENCES):
+                result.append(extents.reference_bbox(elem, boxes.get(elem.struct_name)))
+        return extents.union(result)
+
+    def _structure_bbox(self, struc):
+        """Implementation of :meth:`gdsii.structure.Structure.bbox`."""
+        boxes = self._bbox_cache()
+        graph = self.hierarchy()
+        for name in set(elem.struct_name for elem in struc
+                if isinstance(elem, structure._REFERENCES)):
+            if name in graph:
+                self.bbox(name)
+        return self._references_bbox(struc, boxes)
+
+    def reindex(self):
+        """
+        Drop the index of structure names, the hierarchy graph and cached
+        bounding boxes. Must be called after structures are renamed or
+        references are changed in place.
+        """
+        self._names = None
+        self._hierarchy = None
+        self._bboxes = None
+
+    def append(self, struc):
+        list.append(self, struc)
+        if self._names is not None:
+            self._names.setdefault(struc.name, struc)
+        self._hierarchy = None
+        self._bboxes = None
+
+    def extend(self, strucs):
+        strucs = list(strucs)
+        list.extend(self, strucs)
+        if self._names is not None:
+            for struc in strucs:
+                self._names.setdefault(struc.name, struc)
+        self._hierarchy = None
+        self._bboxes = None
+
+    def __iadd__(self, strucs):
+        self.extend(strucs)
+        return self
+
+    def insert(self, index, struc):
+        list.insert(self, index, struc)
+        self.reindex()
+
+    def remove(self, struc):
+        list.remove(self, struc)
+        self.reindex()
+
+    def pop(self, index=-1):
+        struc = list.pop(self, index)
+        self.reindex()
+        return struc
+
+    def clear(self):
+        list.clear(self)
+        self.reindex()
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self.reindex()
+
+    def reverse(self):
+        list.reverse(self)
+        self.reindex()
+
+    def __setitem__(self, index, value):
+        list.__setitem__(self, index, value)
+        self.reindex()
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self.reindex()
 
     def __repr__(self):
         return '<Library: %s>' % self.name.decode()
+
+def _load_structure(gen, begin, end, validate):
+    """
+    Load structure from byte range found by :func:`gdsii.record.scan_structures`
+    using :class:`gdsii.record.MappedReader` `gen`.
+    """
+    gen.offset = begin
+    gen.read_next()
+    struc = structure.Structure._load(gen, validate)
+    if gen.offset != end:
+        raise exceptions.FormatError('structure %s does not end at offset %d, '
+                'try exact=True' % (struc.name.decode(), end))
+    return struc
+
+def _header(struc):
+    """Return attributes saved in structure header except the name."""
+    return (struc.mod_time, struc.acc_time, struc.strclass)
+
+class _LazyStructure(object):
+    """Placeholder for a structure that is not parsed yet."""
+    __slots__ = ('begin', 'end', 'name', 'structure', 'header')
+
+    def __init__(self, begin, end, name):
+        self.begin = begin
+        self.end = end
+        self.name = name
+        self.structure = None
+        # header attributes of the parsed structure
+        self.header = None
+
+    def unchanged(self):
+        """Return True if the structure can be copied from the file."""
+        struc = self.structure
+        return struc is None or (not struc._modified and struc.name == self.name and
+                _header(struc) == self.header)
+
+    def __repr__(self):
+        if self.structure is not None:
+            return repr(self.structure)
+        return '<Structure: %s (not loaded)>' % self.name.decode()
+
+class LazyLibrary(Library):
+    """
+    Library with structures parsed from a memory-mapped file on demand,
+    returned by :meth:`Library.open_lazy`.
+
+    Structures are parsed when they are accessed by index or iteration.
+    Parsed structures are kept in a cache limited by :attr:`cache_size`,
+    least recently used structures are dropped from the cache and parsed
+    again when needed. Structures added or replaced by the user (for example
+    ``lib[0] = struc``) and structures with detected changes (see
+    :meth:`save`) are never dropped. Other changes can be lost, so
+    a structure should be stored back into the library after modification.
+
+    Library must be closed with :meth:`close` (or used as a context
+    manager), after that only structures already in memory can be accessed.
+    :meth:`save` copies unchanged structures from the file, so saving after
+    a small change takes about as long as copying the file.
+    """
+
+    @classmethod
+    def _open(cls, path, xy_arrays, validate, cache_size, exact):
+        stream = open(path, 'rb')
+        mapping = None
+        try:
+            mapping = record._map_stream(stream)
+            if mapping is None:
+                raise exceptions.EndOfFileError
+            gen = record.MappedReader(mapping, 0, xy_arrays)
+            try:
+                self = cls._load_header(gen)
+            finally:
+                gen.close()
+            for (begin, end, name) in record.scan_structures(mapping, 0, exact):
+                list.append(self, _LazyStructure(begin, end, name))
+        except Exception:
+            if mapping is not None:
+                record._unmap(mapping)
+            stream.close()
+            raise
+        self._stream = stream
+        self._mapping = mapping
+        self._xy_arrays = xy_arrays
+        self._validate = validate
+        self._cache = OrderedDict()
+        self._cache_used = 0
+        self.cache_size = cache_size
+        return self
+
+    #: Maximum total size in bytes of GDS data of parsed structures kept in
+    #: memory. Parsed structures use several times more memory than their
+    #: size in the file.
+    cache_size = 1 << 24
+
+    def close(self):
+        """Drop cached structures and close the file."""
+        for entry in self._cache:
+            entry.structure = None
+        self._cache.clear()
+        self._cache_used = 0
+        if self._mapping is not None:
+            record._unmap(self._mapping)
+            self._stream.close()
+            self._mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *unused_exc):
+        self.close()
+
+    def save(self, stream):
+        """
+        Save the library into a file. Structures that were not parsed, or
+        were parsed but not changed, are copied from the opened file without
+        encoding, by the kernel if `stream` is a real file (see
+        :meth:`gdsii.record.RecordWriter.copy_range`). Other structures are
+        encoded as by :meth:`Library.save`.
+
+        Changes of elements made with list methods of
+        :class:`gdsii.structure.Structure` and changes of header attributes
+        are detected. After elements are modified in place,
+        :meth:`gdsii.structure.Structure.reindex` must be called.
+
+        :param stream: a :class:`file` or file-like object opened for writing
+            in binary mode, it must not be the file the library was opened from
+        :raises: :exc:`ValueError` if the library is closed
+        """
+        if self._mapping is None:
+            raise ValueError('library is closed')
+        Library.save(self, stream)
+
+    def _save_structures(self, writer):
+        fileno = self._stream.fileno()
+        # adjacent ranges are copied at once
+        (begin, end) = (0, 0)
+        for item in list.__iter__(self):
+            if isinstance(item, _LazyStructure) and item.unchanged():
+                if item.begin != end:
+                    writer.copy_range(fileno, self._mapping, begin, end)
+                    begin = item.begin
+                end = item.end
+            else:
+                writer.copy_range(fileno, self._mapping, begin, end)
+                (begin, end) = (0, 0)
+                self._resolve(item)._save(writer)
+        writer.copy_range(fileno, self._mapping, begin, end)
+
+    def structure_names(self):
+        """Return list of names of structures, without parsing them."""
+        return [item.name for item in list.__iter__(self)]
+
+    def structure_by_name(self, name):
+        """
+        Same as :meth:`Library.structure_by_name`, only the returned
+        structure is parsed.
+        """
+        return self._resolve(Library.structure_by_name(self, name))
+
+    def _parse(self, entry):
+        """Parse structure described by `entry`."""
+        if self._mapping is None:
+            raise ValueError('library is closed')
+        gen = record.MappedReader(self._mapping, 0, self._xy_arrays)
+        try:
+            return _load_structure(gen, entry.begin, entry.end, self._validate)
+        finally:
+            gen.close()
+
+    def _resolve(self, item):
+        """Return structure for list `item`, parse it if necessary."""
+        if not isinstance(item, _LazyStructure):
+            return item
+        cache = self._cache
+        if item.structure is not None:
+            if item in cache:
+                cache[item] = cache.pop(item)
+            return item.structure
+        struc = self._parse(item)
+        item.structure = struc
+        item.header = _header(struc)
+        cache[item] = None
+        self._cache_used += item.end - item.begin
+        while self._cache_used > self.cache_size and len(cache) > 1:
+            old, unused = cache.popitem(last=False)
+            self._cache_used -= old.end - old.begin
+            # modified structures leave the cache but stay in memory
+            if old.unchanged():
+                old.structure = None
+        return struc
+
+    def __getitem__(self, index):
+        item = list.__getitem__(self, index)
+        if isinstance(index, slice):
+            return [self._resolve(x) for x in item]
+        return self._resolve(item)
+
+    def __iter__(self):
+        for item in list.__iter__(self):
+            yield self._resolve(item)
+
+    def __reversed__(self):
+        for item in list.__reversed__(self):
+            yield self._resolve(item)
+
+    def __contains__(self, value):
+        return any(struc is value or struc == value for struc in self)
+
+    def index(self, value, *args):
+        return list(self).index(value, *args)
+
+    def count(self, value):
+        return list(self).count(value)
+
+    def remove(self, value):
+        del self[self.index(value)]
+
+    def pop(self, index=-1):
+        struc = self[index]
+        del self[index]
+        return struc
+
+    def _forget(self, index):
+        """Remove items at `index` from the cache."""
+        items = list.__getitem__(self, index)
+        if not isinstance(index, slice):
+            items = [items]
+        for item in items:
+            if isinstance(item, _LazyStructure) and item in self._cache:
+                del self._cache[item]
+                item.structure = None
+                self._cache_used -= item.end - item.begin
+
+    def __setitem__(self, index, value):
+        self._forget(index)
+        Library.__setitem__(self, index, value)
+
+    def __delitem__(self, index):
+        self._forget(index)
+        Library.__delitem__(self, index)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.outline` --- conversion of paths to polygons
+========================================================
+
+This module converts :class:`gdsii.elements.Path` elements to outline
+polygons. All paths are converted together with :mod:`numpy` operations
+on their concatenated points, so that millions of paths can be processed
+at once::
+
+    polygons = boundaries(paths)
+    count = replace_paths(struc)
+
+Ends of paths are handled according to :attr:`path_type`:
+
+    * 0 -- square ends flush with the end points,
+    * 1 -- round ends, approximated by `arc_points` points per half circle,
+    * 2 -- square ends extended by half of the width,
+    * 4 -- square ends extended by :attr:`bgn_extn` and :attr:`end_extn`.
+
+Bends are joined with miters. A bend whose miter would be longer than
+`miter_limit` times the half width is beveled instead; a path turning
+back on itself is always beveled. Consecutive equal points are ignored,
+paths with less than two distinct points have no outline. Outlines are
+counterclockwise and may self-intersect where the path crosses itself or
+turns sharply.
+
+An :const:`XY` record holds at most 8191 points, so :func:`boundaries`
+cuts longer outlines into several polygons. Neighbouring pieces touch
+along a line through a vertex of the path, between its outline points.
+
+Requires :mod:`numpy`.
+"""
+from __future__ import absolute_import
+from . import elements, points
+from array import array
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('outline', 'boundaries', 'replace_paths')
+
+# largest number of points of an XY record
+_MAX_POINTS = 8191
+
+def _check_numpy():
+    if numpy is None:
+        raise ImportError('numpy is required for gdsii.outline')
+
+def _outline(coords, starts, widths, path_types, bgn_extns, end_extns, arc_points=8,
+        miter_limit=None, closed=False):
+    """
+    Return tuple ``(outlines, offsets)`` for paths with points
+    ``coords[starts[i]:starts[i+1]]``, other arguments are arrays with one
+    item per path. Outline of path ``i`` is ``outlines[offsets[i]:offsets[i+1]]``.
+    """
+    count = len(starts)
+    counts = numpy.diff(numpy.append(starts, len(coords)))
+    path_ids = numpy.repeat(numpy.arange(count), counts)
+    # drop repeated points, then paths with less than two points
+    keep = numpy.ones(len(coords), dtype=bool)
+    keep[1:] = (coords[1:] != coords[:-1]).any(axis=1)
+    keep[starts[counts > 0]] = True
+    counts = numpy.bincount(path_ids[keep], minlength=count)
+    keep &= (counts >= 2)[path_ids]
+    coords = coords[keep]
+    path_ids = path_ids[keep]
+    counts[counts < 2] = 0
+    valid = counts > 0
+    # first and last points of paths, only items of valid paths are used
+    first = numpy.cumsum(counts) - counts
+    last = first + counts - 1
+    (ends_first, ends_last) = (first[valid], last[valid])
+
+    # directions of incoming and outgoing segments of each point
+    segments = coords[1:] - coords[:-1]
+    lengths = numpy.hypot(segments[:, 0], segments[:, 1])
+    segments /= numpy.where(lengths, lengths, 1)[:, None]
+    outgoing = numpy.zeros_like(coords)
+    outgoing[:-1] = segments
+    incoming = numpy.zeros_like(coords)
+    incoming[1:] = segments
+    incoming[ends_first] = outgoing[ends_first]
+    outgoing[ends_last] = incoming[ends_last]
+
+    # move end points by extensions
+    half = numpy.abs(widths) / 2.0
+    extensions = numpy.where(path_types == 2, half, numpy.where(path_types == 4, bgn_extns, 0))
+    coords = coords.copy()
+    coords[ends_first] -= outgoing[ends_first] * extensions[valid][:, None]
+    extensions = numpy.where(path_types == 2, half, numpy.where(path_types == 4, end_extns, 0))
+    coords[ends_last] += incoming[ends_last] * extensions[valid][:, None]
+
+    # normals pointing to the right of the path
+    normal_in = numpy.stack((incoming[:, 1], -incoming[:, 0]), axis=1)
+    normal_out = numpy.stack((outgoing[:, 1], -outgoing[:, 0]), axis=1)
+    point_half = half[path_ids][:, None]
+    denominators = 1 + incoming[:, 0] * outgoing[:, 0] + incoming[:, 1] * outgoing[:, 1]
+    threshold = 2.0 / (miter_limit * miter_limit) if miter_limit else 1e-9
+    bevels = denominators < threshold
+    miters = (normal_in + normal_out) * point_half / \
+            numpy.where(bevels, 1, denominators)[:, None]
+    offsets_in = normal_in * point_half
+    offsets_out = normal_out * point_half
+
+    # points of the right side in path order and of the left side in
+    # reverse order, a bevel adds a second point
+    sizes = 1 + bevels
+    positions = numpy.cumsum(sizes) - sizes
+    total = positions[-1] + sizes[-1] if len(sizes) else 0
+    side = numpy.empty((total, 2))
+    beveled = bevels[:, None]
+    side[positions] = coords + numpy.where(beveled, offsets_in, miters)
+    side[positions[bevels] + 1] = coords[bevels] + offsets_out[bevels]
+    other = numpy.empty((total, 2))
+    other[positions] = coords - numpy.where(beveled, offsets_in, miters)
+    other[positions[bevels] + 1] = coords[bevels] - offsets_out[bevels]
+    side_ids = numpy.repeat(path_ids, sizes)
+
+    side_counts = numpy.bincount(side_ids, minlength=count)
+    side_starts = numpy.cumsum(side_counts) - side_counts
+    arcs = numpy.where(valid & (path_types == 1), arc_points, 0)
+    sizes = 2 * side_counts + 2 * arcs + (valid if closed else 0)
+    offsets = numpy.zeros(count + 1, dtype=numpy.int64)
+    numpy.cumsum(sizes, out=offsets[1:])
+
+    result = numpy.empty((offsets[-1], 2))
+    local = numpy.arange(total) - side_starts[side_ids]
+    result[offsets[side_ids] + local] = side
+    result[offsets[side_ids] + 2 * side_counts[side_ids] + arcs[side_ids] - 1 - local] = other
+
+    rounds = numpy.nonzero(arcs)[0]
+    if len(rounds):
+        steps = numpy.pi * numpy.arange(1, arc_points + 1) / (arc_points + 1)
+        radii = half[rounds][:, None]
+        # the end cap turns from the right side to the left side
+        (centers, normals) = (coords[last[rounds]], normal_in[last[rounds]])
+        angles = numpy.arctan2(normals[:, 1], normals[:, 0])[:, None] + steps
+        indices = (offsets[rounds] + side_counts[rounds])[:, None] + numpy.arange(arc_points)
+        result[indices, 0] = centers[:, :1] + radii * numpy.cos(angles)
+        result[indices, 1] = centers[:, 1:] + radii * numpy.sin(angles)
+        (centers, normals) = (coords[first[rounds]], normal_out[first[rounds]])
+        angles = numpy.arctan2(-normals[:, 1], -normals[:, 0])[:, None] + steps
+        indices = (offsets[rounds] + 2 * side_counts[rounds] + arc_points)[:, None] + \
+                numpy.arange(arc_points)
+        result[indices, 0] = centers[:, :1] + radii * numpy.cos(angles)
+        result[indices, 1] = centers[:, 1:] + radii * numpy.sin(angles)
+    if closed:
+        ends = offsets[1:][valid]
+        result[ends - 1] = result[offsets[:-1][valid]]
+    return (result, offsets)
+
+def outline(paths, arc_points=8, miter_limit=None, closed=False):
+    """
+    Return tuple ``(outlines, offsets)`` of :mod:`numpy` arrays with
+    outlines of :class:`gdsii.elements.Path` elements from `paths`.
+    `outlines` has shape ``(N, 2)`` and contains points of all outlines,
+    points of the outline of ``paths[i]`` are
+    ``outlines[offsets[i]:offsets[i+1]]``, this range is empty for paths
+    without outline. Coordinates are not rounded.
+
+    :param arc_points: number of points of a half circle of round ends
+    :param miter_limit: maximum ratio of miter length to half width,
+        None for no limit
+    :param closed: if true, the first point of each outline is repeated
+        at its end
+    """
+    _check_numpy()
+    flat = array(points._TYPECODE)
+    extend = flat.extend
+    chain = itertools.chain.from_iterable
+    starts = array('q')
+    params = array('d')
+    for path in paths:
+        starts.append(len(flat) // 2)
+        params.extend((path.width or 0, path.path_type or 0, path.bgn_extn or 0,
+            path.end_extn or 0))
+        xy = path.xy
+        if isinstance(xy, points.PointArray):
+            extend(xy.flat)
+        else:
+            extend(chain(xy))
+    coords = numpy.frombuffer(flat, dtype=numpy.int32).reshape(-1, 2).astype(numpy.float64)
+    params = numpy.frombuffer(params, dtype=numpy.float64).reshape(-1, 4)
+    return _outline(coords, numpy.frombuffer(starts, dtype=numpy.int64), params[:, 0],
+            params[:, 1], params[:, 2], params[:, 3], arc_points, miter_limit, closed)
+
+def _pieces(size, arcs, max_points):
+    """
+    Return list of index arrays of pieces of an outline with `size` points
+    (not closed) and `arcs` points of each end cap, each piece has at most
+    `max_points` points including the repeated first point.
+    """
+    if size < max_points:
+        return [numpy.arange(size)]
+    # points of each side, the right side is first, the left side follows
+    # the end cap in reverse order
+    sides = (size - 2 * arcs) // 2
+    step = (max_points - 1 - 2 * arcs) // 2 - 1
+    if step < 1:
+        raise ValueError('max_points is too small')
+    result = []
+    for low in range(0, sides - 1, step):
+        high = min(low + step, sides - 1)
+        parts = [numpy.arange(low, high + 1)]
+        if high == sides - 1:
+            parts.append(numpy.arange(sides, sides + arcs))
+        parts.append(numpy.arange(2 * sides + arcs - 1 - high, 2 * sides + arcs - low))
+        if low == 0:
+            parts.append(numpy.arange(2 * sides + arcs, size))
+        result.append(numpy.concatenate(parts))
+    return result
+
+def boundaries(paths, arc_points=8, miter_limit=None, max_points=_MAX_POINTS):
+    """
+    Return list with a list of :class:`gdsii.elements.Boundary` elements
+    for each path from `paths`: its closed outline rounded to integers,
+    cut into several boundaries if it has more than `max_points` points,
+    or no boundaries for paths without outline. Layers, data types and
+    optional attributes except those of paths are copied. See
+    :func:`outline` for other parameters.
+    """
+    paths = list(paths)
+    (outlines, offsets) = outline(paths, arc_points, miter_limit)
+    coords = numpy.rint(outlines).astype(numpy.int32)
+    offsets = offsets.tolist()
+    result = []
+    for (path, begin, end) in zip(paths, offsets, offsets[1:]):
+        pieces = []
+        if begin != end:
+            arcs = arc_points if path.path_type == 1 else 0
+            for indices in _pieces(end - begin, arcs, max_points):
+                flat = array(points._TYPECODE)
+                flat.frombytes(coords[begin + numpy.append(indices, indices[0])].tobytes())
+                boundary = elements.Boundary(path.layer, path.data_type,
+                        points.PointArray.from_flat(flat))
+                boundary.elflags = path.elflags
+                boundary.plex = path.plex
+                boundary.properties = path.properties
+                pieces.append(boundary)
+        result.append(pieces)
+    return result
+
+def replace_paths(struc, path_types=None, arc_points=8, miter_limit=None):
+    """
+    Replace :class:`gdsii.elements.Path` elements of structure `struc` by
+    their outlines in place and return number of replaced paths. Paths
+    without outline are kept.
+
+    :param path_types: if not None, only paths with path type from this
+        set are replaced (missing path type is 0)
+    """
+    indices = [index for (index, elem) in enumerate(struc) if isinstance(elem, elements.Path)
+            and (path_types is None or (elem.path_type or 0) in path_types)]
+    if not indices:
+        return 0
+    replaced = 0
+    elems = list(struc)
+    # lists of elements replacing each element
+    items = [[elem] for elem in elems]
+    for (index, pieces) in zip(indices, boundaries([elems[index] for index in indices],
+            arc_points, miter_limit)):
+        if pieces:
+            items[index] = pieces
+            replaced += 1
+    if replaced:
+        struc[:] = [elem for item in items for elem in item]
+    return replaced
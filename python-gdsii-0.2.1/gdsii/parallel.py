@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.parallel` --- loading GDSII libraries in multiple processes
+=======================================================================
+
+This module contains a loader that parses structures of a GDS file in
+parallel using :class:`concurrent.futures.ProcessPoolExecutor`.
+Structures are found with :func:`gdsii.record.scan_structures` and divided
+into contiguous groups of similar size. Worker processes map the file
+themselves, only parsed data is sent back.
+
+Elements are sent back in a compact form: attributes of each element as
+a tuple of simple values, and coordinates of all elements of a structure
+as one block of bytes. The main process only unpickles this data and
+creates element objects, which is several times cheaper than parsing
+records, and it does so while workers are parsing the next groups.
+"""
+from __future__ import absolute_import
+from . import _codec, exceptions, library, points, record, structure
+from array import array
+from concurrent import futures
+import operator
+import os
+
+__all__ = ('load_library',)
+
+# number of groups of structures per worker, more groups give better balance
+_CHUNKS_PER_WORKER = 4
+
+# attributes of a loaded structure
+_STRUCTURE_ATTRS = ('name', 'mod_time', 'acc_time', 'strclass')
+
+_get_structure_attrs = operator.attrgetter(*_STRUCTURE_ATTRS)
+
+def _encode(struc):
+    """
+    Encode structure loaded with `xy_arrays` into tuple
+    ``(attributes, kinds, values, coords, ends)``.
+    """
+    kinds = array('B')
+    values = []
+    coords = array(points._TYPECODE)
+    ends = array(record._OFFSET_TYPECODE)
+    for elem in struc:
+        kind = _codec.CLASS_INDEX[type(elem)]
+        kinds.append(kind)
+        values.append(_codec.GETTERS[kind](elem))
+        coords.extend(elem.xy.flat)
+        ends.append(len(coords))
+    return (_get_structure_attrs(struc), kinds.tobytes(), values,
+            coords.tobytes(), ends)
+
+def _decode(data, xy_arrays):
+    """Create structure from data returned by :func:`_encode`."""
+    (attrs, kinds, values, coords, ends) = data
+    struc = structure.Structure.__new__(structure.Structure)
+    list.__init__(struc)
+    (struc.name, struc.mod_time, struc.acc_time, struc.strclass) = attrs
+    flat = array(points._TYPECODE)
+    flat.frombytes(coords)
+    append = list.append
+    point_array = points.PointArray
+    new_points = point_array.__new__
+    start = 0
+    for (kind, elem_values, end) in zip(bytearray(kinds), values, ends):
+        if xy_arrays:
+            # coordinates were checked by the worker, skip from_flat()
+            xy = new_points(point_array)
+            xy.flat = flat[start:end]
+        else:
+            xy = iter(flat[start:end])
+            xy = list(zip(xy, xy))
+        start = end
+        append(struc, _codec.DECODERS[kind](elem_values, xy))
+    return struc
+
+def _load_ranges(path, ranges, validate):
+    """Load and encode structures from byte ranges `ranges` of file `path`."""
+    with open(path, 'rb') as stream:
+        mapping = record._map_stream(stream)
+        try:
+            gen = record.MappedReader(mapping, 0, True)
+            try:
+                return [_encode(library._load_structure(gen, begin, end, validate))
+                        for (begin, end, unused_name) in ranges]
+            finally:
+                gen.close()
+        finally:
+            record._unmap(mapping)
+
+def _split(ranges, count):
+    """Split `ranges` into at most `count` contiguous groups of similar size."""
+    total = sum(end - begin for (begin, end, unused_name) in ranges)
+    chunk_size = max(total // count, 1)
+    chunks = [[]]
+    size = 0
+    for item in ranges:
+        if size >= chunk_size:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(item)
+        size += item[1] - item[0]
+    return chunks
+
+def load_library(path, cls=None, workers=None, xy_arrays=False, validate=True,
+        exact=True):
+    """
+    Load a GDS library from file `path` using multiple processes.
+
+    Files with less than two structures are loaded in the calling process.
+
+    :param path: name of GDS file
+    :param cls: library class, :class:`gdsii.library.Library` by default
+    :param workers: number of worker processes, number of CPUs by default
+    :param xy_arrays: same as for :meth:`gdsii.library.Library.load`
+    :param validate: same as for :meth:`gdsii.library.Library.load`
+    :param exact: same as for :func:`gdsii.record.scan_structures`; if false
+        and structures do not end where they were found, the file is
+        scanned and loaded again with `exact`
+    :returns: a new library
+    """
+    if cls is None:
+        cls = library.Library
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if exact:
+        return _load_library(path, cls, workers, xy_arrays, validate, True)
+    try:
+        return _load_library(path, cls, workers, xy_arrays, validate, False)
+    except exceptions.FormatError:
+        return _load_library(path, cls, workers, xy_arrays, validate, True)
+
+def _load_library(path, cls, workers, xy_arrays, validate, exact):
+    with open(path, 'rb') as stream:
+        mapping = record._map_stream(stream)
+        if mapping is None:
+            return cls.load(stream, xy_arrays, validate)
+        try:
+            gen = record.MappedReader(mapping, 0, xy_arrays)
+            try:
+                self = cls._load_header(gen)
+            finally:
+                gen.close()
+            ranges = record.scan_structures(mapping, 0, exact)
+        finally:
+            record._unmap(mapping)
+        if workers < 2 or len(ranges) < 2:
+            stream.seek(0)
+            return cls.load(stream, xy_arrays, validate)
+
+    chunks = _split(ranges, workers * _CHUNKS_PER_WORKER)
+    with futures.ProcessPoolExecutor(workers) as executor:
+        results = executor.map(_load_ranges, [path] * len(chunks), chunks,
+                [validate] * len(chunks))
+        for result in results:
+            for data in result:
+                self.append(_decode(data, xy_arrays))
+    return self
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.points` --- compact storage for element coordinates
+===============================================================
+
+This module contains :class:`PointArray`, a compact replacement for lists of
+``(x, y)`` tuples used as :attr:`xy` attribute of elements. Coordinates are
+stored in a single :class:`array.array` of 32-bit integers, so no Python
+objects are created for points unless they are accessed.
+"""
+from __future__ import absolute_import
+from array import array
+import itertools
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('PointArray',)
+
+# typecode of 32-bit signed integer
+_TYPECODE = 'i' if array('i').itemsize == 4 else 'l'
+
+def _int4_array(data):
+    """
+    Convert big-endian INT4 data to :class:`array.array`.
+
+        >>> _int4_array(b'\\0\\0\\0\\1\\xff\\xff\\xff\\xfe').tolist()
+        [1, -2]
+    """
+    flat = array(_TYPECODE)
+    flat.frombytes(data)
+    if sys.byteorder == 'little':
+        flat.byteswap()
+    return flat
+
+def _int4_bytes(flat):
+    """
+    Convert :class:`array.array` of 32-bit integers to big-endian INT4 data.
+
+        >>> _int4_bytes(array(_TYPECODE, [1, -2])) == b'\\0\\0\\0\\1\\xff\\xff\\xff\\xfe'
+        True
+    """
+    if sys.byteorder == 'little':
+        flat = array(flat.typecode, flat)
+        flat.byteswap()
+    return flat.tobytes()
+
+class PointArray(object):
+    """
+    List of points ``(x, y)`` stored as flat array of 32-bit integers.
+    Behaves like a list of tuples::
+
+        >>> pts = PointArray([(0, 0), (10, 0), (10, 20)])
+        >>> len(pts)
+        3
+        >>> pts[1]
+        (10, 0)
+        >>> pts[-1][1]
+        20
+        >>> pts == [(0, 0), (10, 0), (10, 20)]
+        True
+        >>> pts.append((0, 0))
+        >>> pts[1:3]
+        PointArray([(10, 0), (10, 20)])
+        >>> pts.flat.tolist()
+        [0, 0, 10, 0, 10, 20, 0, 0]
+    """
+    __slots__ = ('flat',)
+
+    def __init__(self, points=()):
+        """Initialize with a sequence of points ``(x, y)``."""
+        self.flat = array(_TYPECODE, itertools.chain.from_iterable(points))
+        if len(self.flat) % 2:
+            raise ValueError('odd number of coordinates')
+
+    @classmethod
+    def from_flat(cls, flat):
+        """
+        Create point array from flat sequence of coordinates
+        ``x0, y0, x1, y1, ...``. If `flat` is an :class:`array.array`
+        of suitable type, it is used without copying.
+        """
+        self = cls.__new__(cls)
+        if not isinstance(flat, array) or flat.typecode != _TYPECODE:
+            flat = array(_TYPECODE, flat)
+        if len(flat) % 2:
+            raise ValueError('odd number of coordinates')
+        self.flat = flat
+        return self
+
+    @classmethod
+    def frombytes(cls, data):
+        """Create point array from raw payload of :const:`XY` record."""
+        return cls.from_flat(_int4_array(data))
+
+    def tobytes(self):
+        """Return coordinates packed as payload of :const:`XY` record."""
+        return _int4_bytes(self.flat)
+
+    def as_numpy(self):
+        """
+        Return :mod:`numpy` array of shape ``(N, 2)`` and type ``int32``
+        sharing memory with this object. The point array cannot be resized
+        while the returned view exists.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required for as_numpy()')
+        return numpy.frombuffer(self.flat, dtype=numpy.int32).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.flat) // 2
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.from_flat(array(_TYPECODE, itertools.chain.from_iterable(
+                self[i] for i in range(*index.indices(len(self))))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('point index out of range')
+        return (self.flat[2*index], self.flat[2*index+1])
+
+    def __setitem__(self, index, point):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('point index out of range')
+        self.flat[2*index], self.flat[2*index+1] = point
+
+    def __iter__(self):
+        coords = iter(self.flat)
+        return zip(coords, coords)
+
+    def __eq__(self, other):
+        if isinstance(other, PointArray):
+            return self.flat == other.flat
+        try:
+            return len(self) == len(other) and all(
+                    tuple(a) == tuple(b) for (a, b) in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (self.from_flat, (self.flat,))
+
+    def append(self, point):
+        """Append a point ``(x, y)``."""
+        (x, y) = point
+        self.flat.append(x)
+        self.flat.append(y)
+
+    def extend(self, points):
+        """Append points from a sequence of points ``(x, y)``."""
+        if isinstance(points, PointArray):
+            self.flat.extend(points.flat)
+        else:
+            for point in points:
+                self.append(point)
+
+    def __repr__(self):
+        return 'PointArray(%r)' % list(self)
+
+class _SharedPointArray(PointArray):
+    """
+    Point array whose :attr:`flat` is shared with other point arrays.
+    Coordinates are copied before the first change, after that the object
+    is a plain :class:`PointArray`. Used by :mod:`gdsii.dedup`.
+    """
+    __slots__ = ()
+
+    # slices and unpickled copies are not shared
+    from_flat = staticmethod(PointArray.from_flat)
+
+    def _unshare(self):
+        self.flat = array(_TYPECODE, self.flat)
+        self.__class__ = PointArray
+
+    def as_numpy(self):
+        self._unshare()
+        return self.as_numpy()
+
+    def __setitem__(self, index, point):
+        self._unshare()
+        self[index] = point
+
+    def append(self, point):
+        self._unshare()
+        self.append(point)
+
+    def extend(self, points):
+        self._unshare()
+        self.extend(points)
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
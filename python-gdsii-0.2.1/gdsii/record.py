@@ -23,17 +23,63 @@ This module contains classes for low-level GDSII I/O.
 .. moduleauthor:: Eugeniy Meshcheryakov <eugen@debian.org>
 """
 from __future__ import absolute_import
-from . import exceptions, tags, types
+from . import exceptions, points as _points, tags, types
+from array import array
 from datetime import datetime
+import functools
 import math
+import mmap
+import os
 import struct
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 __all__ = [
     'Record',
-    'Reader'
+    'LazyRecord',
+    'Reader',
+    'MappedReader',
+    'RecordWriter',
+    'RecordIndex',
+    'scan_headers',
+    'scan_structures'
 ]
 
 _RECORD_HEADER_FMT = struct.Struct('>HH')
+_BITARRAY_FMT = struct.Struct('>H')
+_DOUBLE_FMT = struct.Struct('=d')
+_UINT64_FMT = struct.Struct('=Q')
+
+# number of compiled structures kept for each data type
+_STRUCT_CACHE_SIZE = 256
+
+@functools.lru_cache(maxsize=_STRUCT_CACHE_SIZE)
+def _int2_struct(data_len):
+    """Return compiled structure for INT2 payload of `data_len` bytes."""
+    return struct.Struct('>%dh' % (data_len//2))
+
+@functools.lru_cache(maxsize=_STRUCT_CACHE_SIZE)
+def _int4_struct(data_len):
+    """Return compiled structure for INT4 payload of `data_len` bytes."""
+    return struct.Struct('>%dl' % (data_len//4))
+
+@functools.lru_cache(maxsize=_STRUCT_CACHE_SIZE)
+def _real8_struct(data_len):
+    """Return compiled structure for REAL8 payload of `data_len` bytes."""
+    return struct.Struct('>%dQ' % (data_len//8))
+
+# minimal number of REAL8 values in a record to convert them with numpy,
+# for shorter records scalar conversion is faster
+_REAL8_BATCH_MIN = 64
+
+# scales of REAL8 mantissas indexed by the sign and exponent byte
+_REAL8_SCALES = tuple(math.ldexp(-1.0 if byte & 0x80 else 1.0, 4 * ((byte & 0x7f) - 64) - 56)
+        for byte in range(0x100))
+# scales of mantissas from math.frexp() indexed by the shift of GDSII mantissa
+_REAL8_MANT_SCALES = (2.0**56, 2.0**55, 2.0**54, 2.0**53)
 
 def _parse_nodata(data):
     """Parse :const:`NODATA` data type. Does nothing."""
@@ -55,7 +101,7 @@ def _parse_bitarray(data):
     """
     if len(data) != 2:
         raise exceptions.IncorrectDataSize('BITARRAY')
-    (val,) = struct.unpack('>H', data)
+    (val,) = _BITARRAY_FMT.unpack(data)
     return val
 
 def _parse_int2(data):
@@ -76,7 +122,7 @@ def _parse_int2(data):
     data_len = len(data)
     if not data_len or (data_len % 2):
         raise exceptions.IncorrectDataSize('INT2')
-    return struct.unpack('>%dh' % (data_len//2), data)
+    return _int2_struct(data_len).unpack(data)
 
 def _parse_int4(data):
     """
@@ -96,7 +142,7 @@ def _parse_int4(data):
     data_len = len(data)
     if not data_len or (data_len % 4):
         raise exceptions.IncorrectDataSize('INT4')
-    return struct.unpack('>%dl' % (data_len//4), data)
+    return _int4_struct(data_len).unpack(data)
 
 def _int_to_real(num):
     """
@@ -116,10 +162,22 @@ def _int_to_real(num):
         >>> print(_int_to_real(0xC120000000000000))
         -2.0
     """
-    sgn = -1 if 0x8000000000000000 & num else 1
-    mant = num & 0x00ffffffffffffff
-    exp = (num >> 56) & 0x7f
-    return math.ldexp(sgn * mant, 4 * (exp - 64) - 56)
+    # adding zero turns negative zeroes into positive ones
+    return (num & 0x00ffffffffffffff) * _REAL8_SCALES[num >> 56] + 0.0
+
+def _ints_to_reals(ints):
+    """
+    Vectorized version of :func:`_int_to_real`. Converts :mod:`numpy` array
+    of REAL8 values in internal integer representation to array of floats.
+    Results are bit-identical to :func:`_int_to_real`.
+    """
+    mant = (ints & numpy.uint64(0x00ffffffffffffff)).astype(numpy.float64)
+    exp = ((ints >> numpy.uint64(56)) & numpy.uint64(0x7f)).astype(numpy.int32)
+    reals = numpy.ldexp(mant, 4 * exp - (4 * 64 + 56))
+    numpy.negative(reals, out=reals, where=(ints >> numpy.uint64(63)).astype(bool))
+    # negative zeroes are returned as positive ones by _int_to_real()
+    reals += 0.0
+    return reals
 
 def _parse_real8(data):
     """
@@ -139,8 +197,12 @@ def _parse_real8(data):
     data_len = len(data)
     if not data_len or (data_len % 8):
         raise exceptions.IncorrectDataSize('REAL8')
-    ints = struct.unpack('>%dQ' % (data_len//8), data)
-    return tuple(_int_to_real(n) for n in ints)
+    count = data_len//8
+    if numpy is not None and count >= _REAL8_BATCH_MIN:
+        ints = numpy.frombuffer(data, dtype='>u8').astype(numpy.uint64)
+        return tuple(_ints_to_reals(ints).tolist())
+    ints = _real8_struct(data_len).unpack(data)
+    return tuple(map(_int_to_real, ints))
 
 def _parse_ascii(data):
     r"""
@@ -157,6 +219,8 @@ def _parse_ascii(data):
     """
     if not len(data):
         raise exceptions.IncorrectDataSize('ASCII')
+    if isinstance(data, memoryview):
+        data = data.tobytes()
     # XXX cross-version compatibility
     if data[-1:] == b'\0':
         return data[:-1]
@@ -171,6 +235,135 @@ _PARSE_FUNCS = {
     types.ASCII: _parse_ascii
 }
 
+def _unsupported_parser(tag_type):
+    """Return parse function that raises :exc:`UnsupportedTagType`."""
+    def parse_func(unused_data):
+        raise exceptions.UnsupportedTagType(tag_type)
+    return parse_func
+
+# parse functions for all possible tags, type of tag is its lower byte
+_TAG_PARSERS = [_PARSE_FUNCS.get(tag_type) or _unsupported_parser(tag_type)
+        for tag_type in range(0x100)] * 0x100
+
+def _parse_payload(tag, data):
+    """
+    Parse record payload `data` according to the type of `tag`.
+
+        >>> _parse_payload(tags.LAYER, b'\\x00\\x05')
+        (5,)
+        >>> _parse_payload(0x1234, b'')
+        Traceback (most recent call last):
+            ...
+        UnsupportedTagType: 52
+    """
+    return _TAG_PARSERS[tag](data)
+
+def _read_raw(stream):
+    """
+    Read one record from `stream` without parsing it.
+    Returns tuple ``(tag, payload)``.
+    """
+    header = stream.read(4)
+    if not header or len(header) != 4:
+        raise exceptions.EndOfFileError
+    data_size, tag = _RECORD_HEADER_FMT.unpack(header)
+    if data_size < 4:
+        raise exceptions.IncorrectDataSize('data size is too small')
+    if data_size % 2:
+        raise exceptions.IncorrectDataSize('data size is odd')
+
+    data_size -= 4 # substract header size
+
+    data = stream.read(data_size)
+    if len(data) != data_size:
+        raise exceptions.EndOfFileError
+    return tag, data
+
+def _unpack_raw(buf, offset):
+    """
+    Unpack one record at `offset` in buffer `buf` without parsing it.
+    Returns tuple ``(tag, payload, next_offset)``. If `buf` is a
+    :class:`memoryview` the payload is a slice of it, no data is copied.
+
+        >>> buf = memoryview(b'\\x00\\x06\\x0d\\x02\\x00\\x05\\x00\\x04\\x04\\x00')
+        >>> tag, payload, offset = _unpack_raw(buf, 0)
+        >>> '%04x' % tag, payload.tobytes() == b'\\x00\\x05', offset
+        ('0d02', True, 6)
+        >>> _unpack_raw(buf, 6)[:1]
+        (1024,)
+        >>> _unpack_raw(buf, 10)
+        Traceback (most recent call last):
+            ...
+        EndOfFileError
+    """
+    start = offset + 4
+    if start > len(buf):
+        raise exceptions.EndOfFileError
+    data_size, tag = _RECORD_HEADER_FMT.unpack_from(buf, offset)
+    if data_size < 4:
+        raise exceptions.IncorrectDataSize('data size is too small')
+    if data_size % 2:
+        raise exceptions.IncorrectDataSize('data size is odd')
+    end = offset + data_size
+    if end > len(buf):
+        raise exceptions.EndOfFileError
+    return tag, buf[start:end], end
+
+def _map_stream(stream):
+    """
+    Map file underlying `stream` into memory.
+    Returns :class:`mmap.mmap` object or ``None`` if `stream` is not
+    backed by a real file (pipes, :class:`io.BytesIO`, empty files, etc).
+    """
+    try:
+        fileno = stream.fileno()
+        stream.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+    try:
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError, OverflowError):
+        return None
+
+def _copy_file_range(src, dst, src_offset, dst_offset, count):
+    """
+    Copy `count` bytes between file descriptors `src` and `dst` inside
+    the kernel, with :func:`os.copy_file_range` or :func:`os.sendfile`.
+    Returns number of copied bytes, which is less than `count` if these
+    functions are not available or not supported for the files.
+    """
+    done = 0
+    for func in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, func):
+            continue
+        try:
+            while done < count:
+                if func == 'copy_file_range':
+                    size = os.copy_file_range(src, dst, count - done, src_offset + done,
+                            dst_offset + done)
+                else:
+                    os.lseek(dst, dst_offset + done, os.SEEK_SET)
+                    size = os.sendfile(dst, src, src_offset + done, count - done)
+                if not size:
+                    break
+                done += size
+        except OSError:
+            pass
+        if done == count:
+            break
+    return done
+
+def _unmap(mapping):
+    """
+    Close memory mapping returned by :func:`_map_stream`. If some slices
+    of the mapping are still alive (e.g. referenced from a traceback),
+    closing is left to the garbage collector.
+    """
+    try:
+        mapping.close()
+    except BufferError:
+        pass
+
 def _pack_nodata(data):
     """
     Pack NODATA tag data. Should always return empty string::
@@ -193,7 +386,7 @@ def _pack_bitarray(data):
         >>> len(packed)
         2
     """
-    return struct.pack('>H', data)
+    return _BITARRAY_FMT.pack(data)
 
 def _pack_int2(data):
     """
@@ -207,8 +400,7 @@ def _pack_int2(data):
         >>> len(packed)
         6
     """
-    size = len(data)
-    return struct.pack('>{0}h'.format(size), *data)
+    return _int2_struct(2*len(data)).pack(*data)
 
 def _pack_int4(data):
     """
@@ -222,8 +414,9 @@ def _pack_int4(data):
         >>> len(packed)
         12
     """
-    size = len(data)
-    return struct.pack('>{0}l'.format(size), *data)
+    if isinstance(data, array) and data.itemsize == 4:
+        return _points._int4_bytes(data)
+    return _int4_struct(4*len(data)).pack(*data)
 
 def _real_to_int(fnum):
     """
@@ -238,8 +431,20 @@ def _real_to_int(fnum):
         >>> print(_int_to_real(_real_to_int(1e-9)))
         1e-09
     """
-    # first convert number to IEEE double and split it in parts
-    (ieee,) = struct.unpack('=Q', struct.pack('=d', fnum))
+    # mantissa from frexp() is 0.1xxxx in binary, GDSII exponent is the
+    # binary one divided by 4 and rounded up, mantissa is shifted to match
+    (mant, exp) = math.frexp(fnum)
+    exp16 = -(-exp // 4)
+    if 0.5 <= abs(mant) < 1 and -64 <= exp16 < 64:
+        if mant < 0:
+            return 0xc000000000000000 + (exp16 << 56) + \
+                    int(-mant * _REAL8_MANT_SCALES[4 * exp16 - exp])
+        return 0x4000000000000000 + (exp16 << 56) + \
+                int(mant * _REAL8_MANT_SCALES[4 * exp16 - exp])
+
+    # zeroes, denormals, infinities and numbers out of range of REAL8:
+    # convert number to IEEE double and split it in parts
+    (ieee,) = _UINT64_FMT.unpack(_DOUBLE_FMT.pack(fnum))
     sign = ieee & 0x8000000000000000
     ieee_exp = (ieee >> 52) & 0x7ff
     ieee_mant = ieee & 0xfffffffffffff
@@ -277,6 +482,31 @@ def _real_to_int(fnum):
 
     return sign | (exp16_biased << 56) | ieee_mant_comp
 
+def _reals_to_ints(reals):
+    """
+    Vectorized version of :func:`_real_to_int`. Converts :mod:`numpy` array
+    of floats to array of REAL8 values in internal integer representation.
+    Returns ``None`` if some of the values need special handling (are too big
+    or too small for REAL8), :func:`_real_to_int` should be used then.
+    """
+    ieee = numpy.ascontiguousarray(reals, dtype=numpy.float64).view(numpy.uint64)
+    sign = ieee & numpy.uint64(0x8000000000000000)
+    ieee_exp = ((ieee >> numpy.uint64(52)) & numpy.uint64(0x7ff)).astype(numpy.int64)
+    ieee_mant = ieee & numpy.uint64(0xfffffffffffff)
+    zero = ieee_exp == 0
+
+    ieee_mant_full = (ieee_mant + numpy.uint64(0x10000000000000)) << numpy.uint64(3)
+    exp16, rest = numpy.divmod(ieee_exp - 1023 + 1, 4)
+    exp16 += rest != 0
+    ieee_mant_comp = ieee_mant_full >> ((4 - rest) % 4).astype(numpy.uint64)
+    exp16_biased = exp16 + 64
+
+    if numpy.any(((exp16_biased < 0) | (exp16_biased > 0x7f)) & ~zero):
+        return None
+    ints = sign | (exp16_biased.astype(numpy.uint64) << numpy.uint64(56)) | ieee_mant_comp
+    ints[zero] = 0
+    return ints
+
 def _pack_real8(data):
     """
     Pack REAL8 tag data.
@@ -288,7 +518,16 @@ def _pack_real8(data):
         ['0.0', '1.0', '-1.0', '0.5', '1e-09']
     """
     size = len(data)
-    return struct.pack('>{0}Q'.format(size), *[_real_to_int(num) for num in data])
+    if numpy is not None and size >= _REAL8_BATCH_MIN:
+        if not isinstance(data, (list, tuple, numpy.ndarray)):
+            data = list(data)
+        try:
+            ints = _reals_to_ints(numpy.asarray(data, dtype=numpy.float64))
+        except (TypeError, ValueError):
+            ints = None
+        if ints is not None:
+            return ints.astype('>u8').tobytes()
+    return _real8_struct(8*size).pack(*map(_real_to_int, data))
 
 def _pack_ascii(data):
     r"""
@@ -343,6 +582,8 @@ class Record(object):
         self.tag = tag
         if data is not None:
             self.data = data
+        elif isinstance(points, _points.PointArray):
+            self.data = points.flat
         elif points is not None:
             new_data = []
             # TODO make it faster
@@ -415,27 +656,8 @@ class Record(object):
         :raises: :exc:`UnsupportedTagType` if data cannot be parsed
         :raises: :exc:`EndOfFileError` if end of file is reached
         """
-        header = stream.read(4)
-        if not header or len(header) != 4:
-            raise exceptions.EndOfFileError
-        data_size, tag = _RECORD_HEADER_FMT.unpack(header)
-        if data_size < 4:
-            raise exceptions.IncorrectDataSize('data size is too small')
-        if data_size % 2:
-            raise exceptions.IncorrectDataSize('data size is odd')
-
-        data_size -= 4 # substract header size
-
-        data = stream.read(data_size)
-        if len(data) != data_size:
-            raise exceptions.EndOfFileError
-
-        tag_type = tags.type_of_tag(tag)
-        try:
-            parse_func = _PARSE_FUNCS[tag_type]
-        except KeyError:
-            raise exceptions.UnsupportedTagType(tag_type)
-        return cls(tag, parse_func(data))
+        tag, data = _read_raw(stream)
+        return cls(tag, _TAG_PARSERS[tag](data))
 
     def save(self, stream):
         """
@@ -503,7 +725,23 @@ class Record(object):
         data_size = len(self.data)
         if not data_size or (data_size % 2):
             raise exceptions.DataSizeError(self.tag)
-        return [(self.data[i], self.data[i+1]) for i in range(0, data_size, 2)]
+        coords = iter(self.data)
+        return list(zip(coords, coords))
+
+    @property
+    def point_array(self):
+        """
+        Same as :attr:`points` but returns :class:`gdsii.points.PointArray`.
+        Data is not copied if it was read by a reader with `xy_arrays` enabled.
+
+            >>> r = Record(tags.XY, [0, 1, 2, 3])
+            >>> r.point_array
+            PointArray([(0, 1), (2, 3)])
+        """
+        data_size = len(self.data)
+        if not data_size or (data_size % 2):
+            raise exceptions.DataSizeError(self.tag)
+        return _points.PointArray.from_flat(self.data)
 
     @property
     def times(self):
@@ -547,32 +785,644 @@ class Record(object):
         return list(zip(self.data[::3], self.data[1::3], self.data[2::3]))
 
     @classmethod
-    def iterate(cls, stream):
+    def iterate(cls, stream, lazy=False):
         """
         Generator function for iterating over all records in a GDSII file.
         Yields :class:`Record` objects.
 
         :param stream: GDS file opened for reading in binary mode
+        :param lazy: if true, yield :class:`LazyRecord` objects that parse
+            data only when it is accessed
         """
         last = False
         while not last:
-            rec = cls.read(stream)
+            if lazy:
+                rec = LazyRecord(*_read_raw(stream))
+            else:
+                rec = cls.read(stream)
             if rec.tag == tags.ENDLIB:
                 last = True
             yield rec
 
+    @classmethod
+    def iterate_mapped(cls, stream, lazy=False):
+        """
+        Same as :meth:`iterate`, but maps the file into memory and parses
+        records directly from the mapping instead of issuing reads
+        for every record. Falls back to :meth:`iterate` if `stream` cannot
+        be mapped (e.g. it is a pipe).
+
+        With `lazy` enabled payloads of yielded records are slices of
+        the mapping. The mapping is kept alive while such records exist.
+
+        :param stream: GDS file opened for reading in binary mode
+        :param lazy: same as for :meth:`iterate`
+        """
+        mapping = _map_stream(stream)
+        if mapping is None:
+            for rec in cls.iterate(stream, lazy):
+                yield rec
+            return
+        gen = MappedReader(mapping, stream.tell(), lazy=lazy)
+        try:
+            last = False
+            while not last:
+                rec = gen.read_next()
+                if rec.tag == tags.ENDLIB:
+                    last = True
+                yield rec
+            stream.seek(gen.offset)
+        finally:
+            gen.close()
+            _unmap(mapping)
+
+_RECORD_DATA = Record.data
+
+class LazyRecord(Record):
+    """
+    Record that keeps raw payload and parses it on first access to
+    :attr:`data` (or :attr:`points`, :attr:`times`, :attr:`acls`).
+    Parsed data is cached. Useful when only tags of records are of interest::
+
+        >>> r = LazyRecord(tags.LAYER, b'\\x00\\x05')
+        >>> r.tag_name
+        'LAYER'
+        >>> r.payload == b'\\x00\\x05'
+        True
+        >>> r.data
+        (5,)
+        >>> r.payload is None
+        True
+    """
+    __slots__ = ('payload',)
+
+    def __init__(self, tag, payload):
+        """Initialize with tag and raw (not parsed) data."""
+        self.tag = tag
+        self.payload = payload
+
+    @property
+    def data(self):
+        """Record data, parsed on first access."""
+        payload = self.payload
+        if payload is not None:
+            _RECORD_DATA.__set__(self, _parse_payload(self.tag, payload))
+            self.payload = None
+        return _RECORD_DATA.__get__(self, LazyRecord)
+
+    @data.setter
+    def data(self, value):
+        self.payload = None
+        _RECORD_DATA.__set__(self, value)
+
+    @property
+    def point_array(self):
+        """
+        Same as :attr:`Record.point_array`. If data was not parsed yet,
+        points are decoded directly from the payload.
+        """
+        payload = self.payload
+        if payload is None or tags.type_of_tag(self.tag) != types.INT4:
+            return Record.point_array.__get__(self, LazyRecord)
+        if not len(payload) or (len(payload) % 8):
+            raise exceptions.DataSizeError(self.tag)
+        return _points.PointArray.frombytes(payload)
+
+def _parse_xy_array(data):
+    """Parse payload of :const:`XY` record into :class:`array.array`."""
+    data_len = len(data)
+    if not data_len or (data_len % 4):
+        raise exceptions.IncorrectDataSize('INT4')
+    return _points._int4_array(data)
+
 class Reader(object):
-    """Class for buffered reading of Records"""
-    __slots__  = ('current', 'stream')
+    """
+    Class for buffered reading of Records.
+
+    If `xy_arrays` is true, data of :const:`XY` records is decoded directly
+    into :class:`array.array` instead of a tuple, see :attr:`Record.point_array`.
+    If `lazy` is true, :class:`LazyRecord` objects are returned.
+
+    `layers` and `element_types` are used when elements are read:
+    if `layers` is not None, only elements with pairs ``(layer, type)`` from
+    `layers` are loaded (``type`` is data type, text type etc.), if
+    `element_types` is not None, only elements of these classes are loaded.
+    Records of other elements are skipped without parsing.
+    """
+    __slots__  = ('current', 'stream', 'xy_arrays', 'lazy', 'layers', 'element_types')
 
-    def __init__(self, stream):
+    def __init__(self, stream, xy_arrays=False, lazy=False, layers=None,
+            element_types=None):
         self.stream = stream
+        self.xy_arrays = xy_arrays
+        self.lazy = lazy
+        self.layers = layers
+        self.element_types = element_types
 
     def read_next(self):
         """Read and return next record from stream."""
-        self.current = Record.read(self.stream)
+        tag, data = _read_raw(self.stream)
+        if self.lazy:
+            self.current = LazyRecord(tag, data)
+        elif tag == tags.XY and self.xy_arrays:
+            self.current = Record(tag, _parse_xy_array(data))
+        else:
+            self.current = Record(tag, _TAG_PARSERS[tag](data))
+        return self.current
+
+    def read_data(self):
+        """
+        Read next record and return tuple ``(tag, data)`` with parsed data
+        without creating a :class:`Record`. :attr:`current` is not updated.
+        """
+        tag, data = _read_raw(self.stream)
+        if tag == tags.XY and self.xy_arrays:
+            return tag, _parse_xy_array(data)
+        return tag, _TAG_PARSERS[tag](data)
+
+    def skip_until(self, tag):
+        """
+        Skip records up to and including the first record with `tag`
+        without parsing them. :attr:`current` is not updated.
+        """
+        while _read_raw(self.stream)[0] != tag:
+            pass
+
+class MappedReader(Reader):
+    """
+    Class for reading of Records from a memory buffer, usually a memory-mapped
+    GDS file (see :mod:`mmap`). Record headers are unpacked in place and
+    payloads are parsed from slices of the buffer, so no intermediate
+    objects are created for raw record data.
+
+    Example::
+
+        >>> buf = b'\\x00\\x06\\x0d\\x02\\x00\\x05\\x00\\x04\\x04\\x00'
+        >>> gen = MappedReader(buf)
+        >>> gen.read_next().data
+        (5,)
+        >>> gen.read_next().tag_name
+        'ENDLIB'
+        >>> gen.offset
+        10
+    """
+    __slots__ = ('buffer', 'offset')
+
+    def __init__(self, buf, offset=0, xy_arrays=False, lazy=False, layers=None,
+            element_types=None):
+        """
+        Initialize the reader.
+
+        :param buf: object supporting buffer protocol (:class:`mmap.mmap`, :class:`bytes`, etc.)
+        :param offset: offset of the first record in `buf`
+        :param xy_arrays: same as for :class:`Reader`
+        :param lazy: same as for :class:`Reader`, payloads of returned
+            records are slices of `buf`
+        :param layers: same as for :class:`Reader`
+        :param element_types: same as for :class:`Reader`
+        """
+        Reader.__init__(self, None, xy_arrays, lazy, layers, element_types)
+        self.buffer = memoryview(buf)
+        self.offset = offset
+
+    def read_next(self):
+        """Read and return next record from buffer."""
+        tag, data, self.offset = _unpack_raw(self.buffer, self.offset)
+        if self.lazy:
+            self.current = LazyRecord(tag, data)
+        elif tag == tags.XY and self.xy_arrays:
+            self.current = Record(tag, _parse_xy_array(data))
+        else:
+            self.current = Record(tag, _TAG_PARSERS[tag](data))
         return self.current
 
+    def read_data(self):
+        """Same as :meth:`Reader.read_data`."""
+        tag, data, self.offset = _unpack_raw(self.buffer, self.offset)
+        if tag == tags.XY and self.xy_arrays:
+            return tag, _parse_xy_array(data)
+        return tag, _TAG_PARSERS[tag](data)
+
+    def skip_until(self, tag):
+        """Same as :meth:`Reader.skip_until`, only record headers are read."""
+        unpack_from = _RECORD_HEADER_FMT.unpack_from
+        buf = self.buffer
+        buf_len = len(buf)
+        offset = self.offset
+        while True:
+            if offset + 4 > buf_len:
+                raise exceptions.EndOfFileError
+            size, cur_tag = unpack_from(buf, offset)
+            if size < 4:
+                raise exceptions.IncorrectDataSize('data size is too small')
+            offset += size
+            if cur_tag == tag:
+                break
+        if offset > buf_len:
+            raise exceptions.EndOfFileError
+        self.offset = offset
+
+    def close(self):
+        """Release the buffer. Underlying mapping can be closed after this call."""
+        self.current = None
+        self.buffer.release()
+
+# typecode of 64-bit signed integer used for file offsets
+_OFFSET_TYPECODE = 'q'
+
+# size of chunks used by scan_headers() for streams that cannot be mapped
+_SCAN_CHUNK_SIZE = 1 << 20
+
+# structures for records with a single value, header included
+# BITARRAY data is a single integer, not a sequence
+_BITARRAY_RECORD_FMT = struct.Struct('>HHH')
+
+_SINGLE_VALUE_FMTS = {
+    types.INT2: struct.Struct('>HHh'),
+    types.INT4: struct.Struct('>HHl')
+}
+
+class RecordWriter(object):
+    """
+    Class for buffered writing of records. Records are packed into a reusable
+    :class:`bytearray` which is written to the stream in large chunks.
+    :meth:`flush` must be called after the last record is written.
+
+        >>> import io
+        >>> stream = io.BytesIO()
+        >>> writer = RecordWriter(stream)
+        >>> writer.write(tags.LAYER, (5,))
+        >>> writer.write(tags.ENDLIB)
+        >>> stream.getvalue() == b''
+        True
+        >>> writer.flush()
+        >>> stream.getvalue() == b'\\x00\\x06\\x0d\\x02\\x00\\x05\\x00\\x04\\x04\\x00'
+        True
+    """
+    __slots__ = ('stream', '_buffer', '_pos')
+
+    def __init__(self, stream, buffer_size=1 << 16):
+        """
+        Initialize the writer.
+
+        :param stream: file opened for writing in binary mode
+        :param buffer_size: size of the buffer in bytes, should be
+            big enough to hold a record of maximal size
+        """
+        self.stream = stream
+        self._buffer = bytearray(max(buffer_size, 0x10000))
+        self._pos = 0
+
+    def write(self, tag, data=None):
+        """
+        Write a record with parsed data.
+
+        :param tag: record tag
+        :param data: record data as in :attr:`Record.data`, ignored for
+            :const:`NODATA` records
+        :raises: :exc:`UnsupportedTagType` if tag type is not supported
+        :raises: :exc:`FormatError` on incorrect data sizes, etc
+        """
+        tag_type = tags.type_of_tag(tag)
+        if tag_type == types.NODATA:
+            if self._pos + 4 > len(self._buffer):
+                self.flush()
+            _RECORD_HEADER_FMT.pack_into(self._buffer, self._pos, 4, tag)
+            self._pos += 4
+            return
+        if tag_type == types.BITARRAY:
+            if self._pos + 6 > len(self._buffer):
+                self.flush()
+            _BITARRAY_RECORD_FMT.pack_into(self._buffer, self._pos, 6, tag, data)
+            self._pos += 6
+            return
+        if tag_type in _SINGLE_VALUE_FMTS and len(data) == 1:
+            fmt = _SINGLE_VALUE_FMTS[tag_type]
+            if self._pos + fmt.size > len(self._buffer):
+                self.flush()
+            fmt.pack_into(self._buffer, self._pos, fmt.size, tag, data[0])
+            self._pos += fmt.size
+            return
+        try:
+            pack_func = _PACK_FUNCS[tag_type]
+        except KeyError:
+            raise exceptions.UnsupportedTagType(tag_type)
+        self.write_packed(tag, pack_func(data))
+
+    def write_packed(self, tag, packed_data):
+        """Write a record with already packed data."""
+        record_size = len(packed_data) + 4
+        if record_size > 0xFFFF:
+            raise exceptions.FormatError('data size is too big')
+        pos = self._pos
+        if pos + record_size > len(self._buffer):
+            self.flush()
+            pos = 0
+        _RECORD_HEADER_FMT.pack_into(self._buffer, pos, record_size, tag)
+        self._buffer[pos+4:pos+record_size] = packed_data
+        self._pos = pos + record_size
+
+    def write_record(self, rec):
+        """Write a :class:`Record`."""
+        self.write(rec.tag, rec.data)
+
+    def write_raw(self, data):
+        """Write already encoded records (:class:`bytes` or any buffer)."""
+        if self._pos + len(data) > len(self._buffer):
+            self.flush()
+            if len(data) > len(self._buffer):
+                self.stream.write(data)
+                return
+        self._buffer[self._pos:self._pos+len(data)] = data
+        self._pos += len(data)
+
+    def copy_range(self, fileno, buf, begin, end):
+        """
+        Write bytes from `begin` to `end` of a file with descriptor `fileno`.
+        If the stream is a real file, the bytes are copied by the kernel
+        (see :func:`os.copy_file_range`), otherwise they are written from
+        `buf`, a buffer with contents of the file (e.g. :class:`mmap.mmap`).
+        """
+        if begin >= end:
+            return
+        self.flush()
+        done = 0
+        try:
+            dst = self.stream.fileno()
+            self.stream.flush()
+            pos = self.stream.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            pass
+        else:
+            done = _copy_file_range(fileno, dst, begin, pos, end - begin)
+            self.stream.seek(pos + done)
+        if begin + done < end:
+            self.write_raw(memoryview(buf)[begin+done:end])
+
+    def flush(self):
+        """Write buffered records to the stream."""
+        if self._pos:
+            self.stream.write(memoryview(self._buffer)[:self._pos])
+            self._pos = 0
+
+class RecordIndex(object):
+    """
+    Table of all record headers in a GDS file, as built by :func:`scan_headers`.
+    Headers are stored in three parallel :class:`array.array` objects:
+    :attr:`offsets`, :attr:`sizes` and :attr:`tags`. Record numbers used
+    by methods of this class are indices in these arrays.
+    """
+    __slots__ = ('offsets', 'sizes', 'tags')
+
+    def __init__(self):
+        self.offsets = array(_OFFSET_TYPECODE)
+        self.sizes = array('H')
+        self.tags = array('H')
+
+    def __len__(self):
+        return len(self.tags)
+
+    def find(self, tag):
+        """Return list of numbers of records with given `tag`."""
+        return [i for (i, rec_tag) in enumerate(self.tags) if rec_tag == tag]
+
+    def count(self, tag):
+        """Return number of records with given `tag`."""
+        return self.tags.count(tag)
+
+    def counts(self):
+        """
+        Return :class:`dict` mapping tags to number of records with that tag.
+        Can be used to count elements of each type, e.g.
+        ``index.counts().get(tags.BOUNDARY, 0)``.
+        """
+        result = {}
+        for tag in self.tags:
+            result[tag] = result.get(tag, 0) + 1
+        return result
+
+    def structures(self):
+        """
+        Return list of tuples ``(begin, end)`` with numbers of :const:`BGNSTR`
+        and matching :const:`ENDSTR` records for every structure in the file.
+
+        :raises: :exc:`FormatError` if structures are not properly terminated
+        """
+        result = []
+        begin = None
+        for (i, tag) in enumerate(self.tags):
+            if tag == tags.BGNSTR:
+                if begin is not None:
+                    raise exceptions.FormatError('BGNSTR without ENDSTR')
+                begin = i
+            elif tag == tags.ENDSTR:
+                if begin is None:
+                    raise exceptions.FormatError('ENDSTR without BGNSTR')
+                result.append((begin, i))
+                begin = None
+        if begin is not None:
+            raise exceptions.FormatError('BGNSTR without ENDSTR')
+        return result
+
+    def byte_range(self, begin, end):
+        """
+        Return tuple ``(start, stop)`` with file offsets of records from
+        `begin` to `end` inclusive. For example, ``index.byte_range(*index.structures()[n])``
+        returns location of `n`-th structure in the file.
+        """
+        return (self.offsets[begin], self.offsets[end] + self.sizes[end])
+
+    def _add(self, offset, size, tag):
+        if size < 4:
+            raise exceptions.IncorrectDataSize('data size is too small')
+        if size % 2:
+            raise exceptions.IncorrectDataSize('data size is odd')
+        self.offsets.append(offset)
+        self.sizes.append(size)
+        self.tags.append(tag)
+
+def _scan_buffer(index, buf, offset):
+    """Add headers of records in `buf` starting at `offset` till ENDLIB to `index`."""
+    unpack_from = _RECORD_HEADER_FMT.unpack_from
+    add = index._add
+    buf_len = len(buf)
+    while offset + 4 <= buf_len:
+        size, tag = unpack_from(buf, offset)
+        add(offset, size, tag)
+        offset += size
+        if tag == tags.ENDLIB:
+            if offset > buf_len:
+                raise exceptions.EndOfFileError
+            return offset
+    raise exceptions.EndOfFileError
+
+def _scan_stream(index, stream, base):
+    """Same as :func:`_scan_buffer` but reads `stream` in large chunks."""
+    unpack_from = _RECORD_HEADER_FMT.unpack_from
+    add = index._add
+    buf = b''
+    pos = 0 # offset of the next header in buf
+    while True:
+        if pos + 4 > len(buf):
+            if pos > len(buf):
+                # skip the rest of a record payload
+                skip = pos - len(buf)
+                while skip:
+                    chunk = stream.read(min(skip, _SCAN_CHUNK_SIZE))
+                    if not chunk:
+                        raise exceptions.EndOfFileError
+                    skip -= len(chunk)
+                base += pos
+                buf = b''
+            else:
+                base += pos
+                buf = buf[pos:]
+            pos = 0
+            chunk = stream.read(_SCAN_CHUNK_SIZE)
+            if not chunk:
+                raise exceptions.EndOfFileError
+            buf += chunk
+            continue
+        size, tag = unpack_from(buf, pos)
+        add(base + pos, size, tag)
+        pos += size
+        if tag == tags.ENDLIB:
+            # read the rest of ENDLIB record, it has no payload normally
+            while pos > len(buf):
+                chunk = stream.read(pos - len(buf))
+                if not chunk:
+                    raise exceptions.EndOfFileError
+                buf += chunk
+            return base + pos
+
+def scan_headers(stream):
+    """
+    Scan all record headers in a GDS file without parsing record data.
+    Scanning stops after :const:`ENDLIB` record.
+
+    If `stream` is a real file, it is mapped into memory, otherwise it is
+    read in large chunks. Offsets are relative to the beginning of the file
+    (if the stream position can be determined).
+
+    :param stream: GDS file opened for reading in binary mode
+    :returns: a new :class:`RecordIndex`
+    :raises: :exc:`EndOfFileError` if file is truncated
+    """
+    index = RecordIndex()
+    mapping = _map_stream(stream)
+    if mapping is not None:
+        try:
+            end = _scan_buffer(index, mapping, stream.tell())
+        finally:
+            _unmap(mapping)
+        stream.seek(end)
+        return index
+    try:
+        base = stream.tell()
+    except (AttributeError, IOError, OSError, ValueError):
+        base = 0
+    _scan_stream(index, stream, base)
+    return index
+
+# headers of BGNSTR, ENDSTR and ENDLIB records, BGNSTR always has 12 INT2 values
+_BGNSTR_HEADER = _RECORD_HEADER_FMT.pack(28, tags.BGNSTR)
+_ENDSTR_HEADER = _RECORD_HEADER_FMT.pack(4, tags.ENDSTR)
+_ENDLIB_HEADER = _RECORD_HEADER_FMT.pack(4, tags.ENDLIB)
+
+def _structure_name(buf, offset):
+    """Return name from STRNAME record at `offset` or None if there is no such record."""
+    if offset + 4 > len(buf):
+        return None
+    size, tag = _RECORD_HEADER_FMT.unpack_from(buf, offset)
+    if tag != tags.STRNAME or size <= 4 or offset + size > len(buf):
+        return None
+    return _parse_ascii(buf[offset+4:offset+size])
+
+def _walk_structures(buf, offset):
+    """Exact version of :func:`scan_structures`, checks every record header."""
+    unpack_from = _RECORD_HEADER_FMT.unpack_from
+    buf_len = len(buf)
+    result = []
+    begin = None
+    while offset + 4 <= buf_len:
+        size, tag = unpack_from(buf, offset)
+        if size < 4:
+            raise exceptions.IncorrectDataSize('data size is too small')
+        if size % 2:
+            raise exceptions.IncorrectDataSize('data size is odd')
+        if tag == tags.BGNSTR:
+            begin = offset
+        elif tag == tags.ENDSTR:
+            if begin is None:
+                raise exceptions.FormatError('ENDSTR without BGNSTR')
+            name = _structure_name(buf, begin + 28)
+            if name is None:
+                raise exceptions.MissingRecord('Wanted: %s' % tags.STRNAME)
+            result.append((begin, offset + 4, name))
+            begin = None
+        offset += size
+        if tag == tags.ENDLIB:
+            if offset > buf_len:
+                break
+            return result
+    raise exceptions.EndOfFileError
+
+def scan_structures(buf, offset=0, exact=True):
+    """
+    Find byte ranges of all structures in a GDS file loaded or mapped into
+    memory, without parsing them.
+
+    By default every record header is checked, record data is skipped.
+    If `exact` is false, only the library header is read record by record
+    and the structures are found by searching for :const:`ENDSTR` records
+    followed by :const:`BGNSTR`, which is much faster. If results look
+    inconsistent, every header is checked instead. However, valid data
+    (for example coordinates) can contain the searched records by accident;
+    then the returned ranges and names are wrong and parsing of the affected
+    structures fails, because they do not end where expected. Use the fast
+    search only for files known not to contain such data.
+
+    :param buf: :class:`bytes`, :class:`mmap.mmap` or other buffer
+        with method ``find()``
+    :param offset: offset of the library in `buf`
+    :param exact: check every record header, if false search for
+        structure boundaries
+    :returns: list of tuples ``(begin, end, name)``, where ``buf[begin:end]``
+        contains records from :const:`BGNSTR` to :const:`ENDSTR` inclusive
+    :raises: :exc:`EndOfFileError` if file is truncated
+    """
+    if not hasattr(buf, 'find'):
+        buf = bytes(buf)
+    # library header is short, read it record by record
+    while True:
+        tag, unused_payload, next_offset = _unpack_raw(buf, offset)
+        if tag == tags.BGNSTR:
+            break
+        elif tag == tags.ENDLIB:
+            return []
+        offset = next_offset
+    if exact or buf[offset:offset+4] != _BGNSTR_HEADER:
+        return _walk_structures(buf, offset)
+
+    begins = [offset]
+    pattern = _ENDSTR_HEADER + _BGNSTR_HEADER
+    pos = buf.find(pattern, offset + 28)
+    while pos >= 0:
+        begins.append(pos + 4)
+        pos = buf.find(pattern, pos + 32)
+    end = buf.rfind(_ENDSTR_HEADER + _ENDLIB_HEADER, begins[-1] + 28)
+    if end < 0:
+        return _walk_structures(buf, offset)
+    ends = begins[1:] + [end + 4]
+
+    result = []
+    for (begin, end) in zip(begins, ends):
+        name = _structure_name(buf, begin + 28)
+        if name is None:
+            return _walk_structures(buf, offset)
+        result.append((begin, end, name))
+    return result
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod(optionflags=doctest.IGNORE_EXCEPTION_DETAIL)
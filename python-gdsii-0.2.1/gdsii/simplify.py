@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.simplify` --- removal of redundant vertices
+=======================================================
+
+This module removes vertices of :class:`gdsii.elements.Boundary` and
+:class:`gdsii.elements.Path` elements that do not change their geometry:
+repeated points and points lying on the segment between their neighbours.
+With a positive `tolerance` vertices closer than `tolerance` to the
+simplified outline are removed too::
+
+    report = simplify_library(lib, tolerance=2)
+    print(report)
+
+    for elem in simplify(elems, tolerance=2, report=report):
+        ...
+
+Every removed vertex is within `tolerance` of the segment that replaces
+it, taking into account vertices removed earlier, so the distance
+between the original and the simplified outline never exceeds
+`tolerance`. For paths the tolerance applies to the center line and end
+points are kept. Remaining vertices are original vertices, coordinates
+are not rounded. Boundaries keep at least three distinct points, those
+with fewer distinct points keep them all.
+Simplification with a positive tolerance can make narrow polygons
+self-intersecting.
+
+Vertices of all elements are processed together with :mod:`numpy`
+operations: each round removes an independent set of vertices (no two
+neighbours) chosen by a fixed pseudo-random priority, so long runs of
+removable vertices shrink geometrically.
+
+Requires :mod:`numpy`.
+"""
+from __future__ import absolute_import
+from . import elements, points
+from array import array
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('Report', 'simplify', 'simplify_library')
+
+_SIMPLIFIED = (elements.Boundary, elements.Path)
+
+# number of points processed together by simplify()
+_BATCH_POINTS = 1 << 20
+
+class Report(object):
+    """
+    Result of simplification. Attributes:
+
+        * :attr:`elements` -- number of changed elements,
+        * :attr:`vertices` -- number of removed vertices,
+        * :attr:`total` -- number of vertices before simplification.
+    """
+    __slots__ = ('elements', 'vertices', 'total')
+
+    def __init__(self):
+        self.elements = 0
+        self.vertices = 0
+        self.total = 0
+
+    def __repr__(self):
+        return '<Report: %d of %d vertices removed from %d elements>' % (self.vertices,
+                self.total, self.elements)
+
+def _check_numpy():
+    if numpy is None:
+        raise ImportError('numpy is required for gdsii.simplify')
+
+def _segment_distance(pts, starts, ends):
+    """Return distances of points `pts` to segments from `starts` to `ends`."""
+    vectors = ends - starts
+    offsets = pts - starts
+    lengths = vectors[:, 0] * vectors[:, 0] + vectors[:, 1] * vectors[:, 1]
+    dots = offsets[:, 0] * vectors[:, 0] + offsets[:, 1] * vectors[:, 1]
+    # the cross product is exactly zero for collinear integer points
+    crosses = offsets[:, 0] * vectors[:, 1] - offsets[:, 1] * vectors[:, 0]
+    rests = pts - ends
+    return numpy.where(dots <= 0, numpy.hypot(offsets[:, 0], offsets[:, 1]),
+            numpy.where(dots >= lengths, numpy.hypot(rests[:, 0], rests[:, 1]),
+                numpy.abs(crosses) / numpy.sqrt(numpy.where(lengths, lengths, 1))))
+
+def _reduce(coords, starts, closed, tolerance):
+    """
+    Return boolean array marking points of `coords` that are kept. Element
+    ``i`` has points ``coords[starts[i]:starts[i+1]]``, it is a polygon
+    with repeated first point if ``closed[i]`` is true, otherwise a line.
+    """
+    # repeated points are removed first, end points are kept
+    total = len(coords)
+    counts = numpy.diff(numpy.append(starts, total))
+    (firsts, lasts) = (starts[counts > 0], starts[counts > 0] + counts[counts > 0] - 1)
+    same = numpy.zeros(total, dtype=bool)
+    same[1:] = (coords[1:] == coords[:-1]).all(axis=1)
+    same[firsts] = False
+    # runs of equal points, the run of the last point is represented by it
+    runs = numpy.cumsum(~same)
+    alive = ~same
+    alive[numpy.isin(runs, runs[lasts])] = False
+    alive[firsts] = True
+    alive[lasts] = True
+    indices = numpy.nonzero(alive)[0]
+    alive[indices] = _reduce_distinct(coords[indices], numpy.searchsorted(indices, starts),
+            closed, tolerance)
+    return alive
+
+def _reduce_distinct(coords, starts, closed, tolerance):
+    """Same as :func:`_reduce` for elements without repeated consecutive points."""
+    total = len(coords)
+    count = len(starts)
+    counts = numpy.diff(numpy.append(starts, total))
+    elem_ids = numpy.repeat(numpy.arange(count), counts)
+    ends = starts + counts - 1
+    # polygons are rings without the repeated point, lines keep end points;
+    # closed polygons with less than three vertices are not changed
+    small = closed & (counts < 4) & (counts > 0)
+    small[small] = (coords[starts[small]] == coords[ends[small]]).all(axis=1)
+    closed = closed & (counts >= 4)
+    closed[closed] = (coords[starts[closed]] == coords[ends[closed]]).all(axis=1)
+    nexts = numpy.arange(1, total + 1)
+    prevs = numpy.arange(-1, total - 1)
+    rings = numpy.nonzero(closed)[0]
+    nexts[ends[rings] - 1] = starts[rings]
+    prevs[starts[rings]] = ends[rings] - 1
+    removable = numpy.ones(total, dtype=bool)
+    removable[ends[counts > 0]] = False
+    lines = numpy.nonzero(~closed & (counts > 0))[0]
+    removable[starts[lines]] = False
+    # the first point of a ring is kept, so that the repeated point stays valid
+    removable[starts[rings]] = False
+    removable[small[elem_ids]] = False
+    # vertices of rings that may still be removed; a removal takes at most
+    # one distinct point, so at least three distinct points are kept
+    ring_points = numpy.nonzero(closed[elem_ids])[0]
+    ring_points = ring_points[ring_points != ends[elem_ids[ring_points]]]
+    ring_points = ring_points[numpy.lexsort((coords[ring_points, 1], coords[ring_points, 0],
+        elem_ids[ring_points]))]
+    firsts = numpy.ones(len(ring_points), dtype=bool)
+    firsts[1:] = (elem_ids[ring_points[1:]] != elem_ids[ring_points[:-1]]) | \
+            (coords[ring_points[1:]] != coords[ring_points[:-1]]).any(axis=1)
+    spare = numpy.bincount(elem_ids[ring_points[firsts]], minlength=count) - 3
+
+    alive = numpy.ones(total, dtype=bool)
+    # largest distance of removed points to the segment from each point to the next one
+    errors = numpy.zeros(total)
+    priority = numpy.random.RandomState(0).permutation(total)
+    active = numpy.nonzero(removable)[0]
+    # priorities of candidates, other points have the largest priority
+    keys = numpy.full(total, total, dtype=numpy.int64)
+    marks = numpy.zeros(total, dtype=bool)
+    while len(active):
+        distances = _segment_distance(coords[active], coords[prevs[active]],
+                coords[nexts[active]])
+        distances += numpy.maximum(errors[prevs[active]], errors[active])
+        active = active[distances <= tolerance]
+        distances = distances[distances <= tolerance]
+        if not len(active):
+            break
+        keys[active] = priority[active]
+        chosen = (keys[active] < keys[prevs[active]]) & (keys[active] < keys[nexts[active]])
+        selected = active[chosen]
+        distances = distances[chosen]
+        # do not remove too many vertices of a ring
+        ids = elem_ids[selected]
+        ranks = numpy.arange(len(selected)) - numpy.searchsorted(ids, ids)
+        allowed = (ranks < spare[ids]) | ~closed[ids]
+        (selected, distances, ids) = (selected[allowed], distances[allowed], ids[allowed])
+        if not len(selected):
+            break
+        numpy.subtract.at(spare, ids, 1)
+        alive[selected] = False
+        (before, after) = (prevs[selected], nexts[selected])
+        nexts[before] = after
+        prevs[after] = before
+        errors[before] = distances
+        # neighbours of removed points have new segments and are checked again
+        keys[active] = total
+        marks[before] = True
+        marks[after] = True
+        marks[active[~chosen]] = True
+        marks &= removable & alive
+        active = numpy.nonzero(marks)[0]
+        marks[active] = False
+    return alive
+
+def _simplify_batch(elems, tolerance, report):
+    """Simplify elements from list `elems` in place, return list of changed elements."""
+    flat = array(points._TYPECODE)
+    extend = flat.extend
+    chain = itertools.chain.from_iterable
+    starts = array('q')
+    closed = array('b')
+    for elem in elems:
+        starts.append(len(flat) // 2)
+        closed.append(isinstance(elem, elements.Boundary))
+        xy = elem.xy
+        if isinstance(xy, points.PointArray):
+            extend(xy.flat)
+        else:
+            extend(chain(xy))
+    coords = numpy.frombuffer(flat, dtype=numpy.int32).reshape(-1, 2)
+    starts = numpy.frombuffer(starts, dtype=numpy.int64)
+    keep = _reduce(coords.astype(numpy.float64), starts,
+            numpy.frombuffer(closed, dtype=numpy.int8).astype(bool), tolerance)
+    report.total += len(coords)
+    counts = numpy.diff(numpy.append(starts, len(coords)))
+    kept = numpy.bincount(numpy.repeat(numpy.arange(len(starts)), counts)[keep],
+            minlength=len(starts))
+    changed = numpy.nonzero(kept < counts)[0]
+    if not len(changed):
+        return []
+    report.elements += len(changed)
+    report.vertices += int((counts - kept).sum())
+    new_flat = array(points._TYPECODE)
+    new_flat.frombytes(coords[keep].tobytes())
+    offsets = numpy.zeros(len(starts) + 1, dtype=numpy.int64)
+    numpy.cumsum(kept, out=offsets[1:])
+    result = []
+    for (index, begin, end) in zip(changed.tolist(), (2 * offsets[changed]).tolist(),
+            (2 * offsets[changed + 1]).tolist()):
+        elem = elems[index]
+        xy = new_flat[begin:end]
+        if isinstance(elem.xy, points.PointArray):
+            elem.xy = points.PointArray.from_flat(xy)
+        else:
+            elem.xy = list(zip(xy[0::2], xy[1::2]))
+        result.append(elem)
+    return result
+
+def simplify(elems, tolerance=0, report=None):
+    """
+    Generate elements from iterable `elems`, with vertices of
+    :class:`gdsii.elements.Boundary` and :class:`gdsii.elements.Path`
+    elements removed in place. Elements are processed in batches, so
+    the input is consumed ahead of the output; order is not changed.
+
+    :param tolerance: maximum distance of removed vertices from the
+        simplified outline, in database units
+    :param report: if not None, :class:`Report` updated with the results
+    """
+    _check_numpy()
+    if report is None:
+        report = Report()
+    batch = []
+    size = 0
+    for elem in elems:
+        batch.append(elem)
+        if isinstance(elem, _SIMPLIFIED):
+            size += len(elem.xy)
+            if size >= _BATCH_POINTS:
+                _simplify_batch([item for item in batch if isinstance(item, _SIMPLIFIED)],
+                        tolerance, report)
+                for item in batch:
+                    yield item
+                batch = []
+                size = 0
+    _simplify_batch([item for item in batch if isinstance(item, _SIMPLIFIED)], tolerance,
+            report)
+    for item in batch:
+        yield item
+
+def simplify_library(lib, tolerance=0):
+    """
+    Remove vertices of elements of all structures of library `lib` in
+    place and return :class:`Report`. See :func:`simplify` for parameters.
+    """
+    _check_numpy()
+    report = Report()
+    strucs = []
+    owners = {}
+    elems = []
+    for struc in lib:
+        for elem in struc:
+            if isinstance(elem, _SIMPLIFIED):
+                owners[id(elem)] = len(strucs)
+                elems.append(elem)
+        strucs.append(struc)
+    changed = set(owners[id(elem)] for elem in _simplify_batch(elems, tolerance, report))
+    for index in sorted(changed):
+        struc = strucs[index]
+        struc.reindex()
+        # structures of a lazy library are stored back so they are saved
+        lib[index] = struc
+    return report
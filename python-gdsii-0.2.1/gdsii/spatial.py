@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Lesser General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+:mod:`gdsii.spatial` --- spatial index of elements
+==================================================
+
+This module contains :class:`SpatialIndex`, an R-tree of rectangles, and
+:class:`StructureIndex`, which indexes bounding boxes of elements of a
+structure per pair ``(layer, type)``. Usually the latter is obtained with
+:meth:`gdsii.structure.Structure.spatial_index`::
+
+    index = struc.spatial_index()
+    for elem in index.query(0, 0, 1000, 1000, layers=[(5, 3)]):
+        print(elem)
+
+The tree is packed with the Sort-Tile-Recursive algorithm and stored in
+:mod:`numpy` arrays, one array of node boxes per level, so that a query
+tests all candidate nodes of a level with one vectorized comparison.
+Rectangles inserted after the tree was built are kept in a separate list
+that is searched linearly; the tree is rebuilt when this list becomes
+large.
+
+Queries find elements by bounding boxes, not by exact geometry. Boxes of
+paths are extended by half of the width and by the extensions.
+:class:`gdsii.elements.SRef` and :class:`gdsii.elements.ARef` elements
+are not indexed.
+
+Requires :mod:`numpy`.
+"""
+from __future__ import absolute_import
+from . import elements, extents, points
+from array import array
+import itertools
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('SpatialIndex', 'StructureIndex')
+
+class SpatialIndex(object):
+    """
+    R-tree of rectangles ``(xmin, ymin, xmax, ymax)`` with integer ids.
+    """
+
+    #: Number of children of tree nodes.
+    node_size = 16
+
+    #: Minimum number of inserted rectangles kept out of the tree.
+    pending_size = 1024
+
+    def __init__(self, boxes=(), ids=None):
+        """
+        Build the tree from array-like `boxes` of shape ``(N, 4)``.
+        `ids` are integers identifying the boxes, ``range(N)`` by default.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required for gdsii.spatial')
+        boxes = numpy.asarray(boxes, dtype=numpy.float64).reshape(-1, 4)
+        if ids is None:
+            ids = numpy.arange(len(boxes), dtype=numpy.int64)
+        self._pending_boxes = []
+        self._pending_ids = []
+        self._pending = None
+        self._build(boxes, numpy.asarray(ids, dtype=numpy.int64))
+
+    def _build(self, boxes, ids):
+        size = self.node_size
+        count = len(boxes)
+        if count:
+            # sort by X into vertical slices, then by Y inside slices
+            centers = boxes[:, :2] + boxes[:, 2:]
+            leaves = -(-count // size)
+            slices = int(math.ceil(math.sqrt(leaves)))
+            slice_size = size * -(-leaves // slices)
+            slice_numbers = numpy.empty(count, dtype=numpy.float64)
+            slice_numbers[numpy.argsort(centers[:, 0])] = numpy.arange(count) // slice_size
+            # one sort by slice number and Y is faster than numpy.lexsort
+            ys = centers[:, 1] - centers[:, 1].min()
+            order = numpy.argsort(slice_numbers * (ys.max() + 1) + ys)
+            boxes = boxes[order]
+            ids = ids[order]
+        levels = [boxes]
+        while len(levels[-1]) > 1:
+            level = levels[-1]
+            starts = numpy.arange(0, len(level), size)
+            levels.append(numpy.concatenate((numpy.minimum.reduceat(level[:, :2], starts),
+                numpy.maximum.reduceat(level[:, 2:], starts)), axis=1))
+        levels.reverse()
+        self._levels = levels
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._ids) + len(self._pending_ids)
+
+    def insert(self, box, item_id):
+        """Insert rectangle `box` with id `item_id`."""
+        self._pending_boxes.append(tuple(box))
+        self._pending_ids.append(item_id)
+        self._pending = None
+        if len(self._pending_ids) > max(self.pending_size, len(self._ids) // 4):
+            self._flush()
+
+    def extend(self, boxes, ids):
+        """Insert rectangles from array-like `boxes` with ids `ids`."""
+        boxes = numpy.asarray(boxes, dtype=numpy.float64).reshape(-1, 4)
+        self._pending_boxes.extend(map(tuple, boxes.tolist()))
+        self._pending_ids.extend(ids)
+        self._pending = None
+        if len(self._pending_ids) > max(self.pending_size, len(self._ids) // 4):
+            self._flush()
+
+    def _flush(self):
+        """Rebuild the tree with pending rectangles."""
+        boxes = numpy.concatenate((self._levels[-1],
+            numpy.array(self._pending_boxes, dtype=numpy.float64).reshape(-1, 4)))
+        ids = numpy.concatenate((self._ids, numpy.array(self._pending_ids, dtype=numpy.int64)))
+        self._pending_boxes = []
+        self._pending_ids = []
+        self._pending = None
+        self._build(boxes, ids)
+
+    def query(self, xmin, ymin, xmax, ymax):
+        """
+        Return :mod:`numpy` array of ids of rectangles intersecting
+        rectangle ``(xmin, ymin, xmax, ymax)``, touching counts as
+        intersection. Order of ids is not defined.
+        """
+        size = self.node_size
+        children = numpy.arange(size)
+        candidates = numpy.arange(len(self._levels[0]))
+        for (depth, level) in enumerate(self._levels):
+            if depth:
+                candidates = (candidates[:, None] * size + children).ravel()
+                candidates = candidates[candidates < len(level)]
+            boxes = level[candidates]
+            candidates = candidates[(boxes[:, 0] <= xmax) & (boxes[:, 2] >= xmin) &
+                    (boxes[:, 1] <= ymax) & (boxes[:, 3] >= ymin)]
+            if not len(candidates):
+                break
+        result = self._ids[candidates]
+        if self._pending_ids:
+            if self._pending is None:
+                self._pending = (numpy.array(self._pending_boxes, dtype=numpy.float64),
+                        numpy.array(self._pending_ids, dtype=numpy.int64))
+            (boxes, ids) = self._pending
+            result = numpy.concatenate((result, ids[(boxes[:, 0] <= xmax) &
+                (boxes[:, 2] >= xmin) & (boxes[:, 1] <= ymax) & (boxes[:, 3] >= ymin)]))
+        return result
+
+    def query_point(self, x, y):
+        """Return ids of rectangles containing point ``(x, y)``."""
+        return self.query(x, y, x, y)
+
+def _element_boxes(elems, first=0):
+    """
+    Return dictionary mapping ``(layer, type)`` to tuples ``(boxes, ids)``
+    of :mod:`numpy` arrays with bounding boxes of elements from `elems` and
+    their indices, counted from `first`. References are skipped.
+    """
+    groups = {}
+    for (index, elem) in enumerate(elems, first):
+        attrs = elem._gds_layer_attrs
+        if attrs is None:
+            continue
+        key = (getattr(elem, attrs[0]), getattr(elem, attrs[1]))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = (array(points._TYPECODE), array('q'), array('q'), array('d'), [])
+        (coords, starts, ids, pads, miters) = group
+        if isinstance(elem, elements.Path):
+            box = extents._miter_bbox(elem)
+            if box is not None:
+                miters.append((len(ids), box))
+        starts.append(len(coords) // 2)
+        xy = elem.xy
+        if isinstance(xy, points.PointArray):
+            coords.extend(xy.flat)
+        else:
+            coords.extend(itertools.chain.from_iterable(xy))
+        ids.append(index)
+        pads.append(extents._padding(elem))
+    result = {}
+    for (key, (coords, starts, ids, pads, miters)) in groups.items():
+        coords = numpy.frombuffer(coords, dtype=numpy.int32).reshape(-1, 2)
+        starts = numpy.frombuffer(starts, dtype=numpy.int64)
+        pads = numpy.frombuffer(pads, dtype=numpy.float64)[:, None]
+        boxes = numpy.concatenate((numpy.minimum.reduceat(coords, starts) - pads,
+            numpy.maximum.reduceat(coords, starts) + pads), axis=1)
+        for (row, box) in miters:
+            boxes[row, :2] = numpy.minimum(boxes[row, :2], box[:2])
+            boxes[row, 2:] = numpy.maximum(boxes[row, 2:], box[2:])
+        result[key] = (boxes, numpy.frombuffer(ids, dtype=numpy.int64))
+    return result
+
+class StructureIndex(dict):
+    """
+    Dictionary mapping pairs ``(layer, type)`` to :class:`SpatialIndex`
+    of elements of a structure, with indices of elements as ids.
+    """
+
+    def __init__(self, struc):
+        """Build index of elements of structure `struc`."""
+        dict.__init__(self)
+        self.structure = struc
+        for (key, (boxes, ids)) in _element_boxes(struc).items():
+            self[key] = SpatialIndex(boxes, ids)
+
+    def _appended(self, elems, first):
+        """Add elements `elems` appended to the structure at index `first`."""
+        for (key, (boxes, ids)) in _element_boxes(elems, first).items():
+            index = self.get(key)
+            if index is None:
+                self[key] = SpatialIndex(boxes, ids)
+            else:
+                index.extend(boxes, ids.tolist())
+
+    def query_indices(self, xmin, ymin, xmax, ymax, layers=None):
+        """
+        Return sorted :mod:`numpy` array of indices of elements with
+        bounding boxes intersecting rectangle ``(xmin, ymin, xmax, ymax)``.
+
+        :param layers: if not None, only elements with pairs ``(layer, type)``
+            from this iterable are returned
+        """
+        keys = self if layers is None else [key for key in layers if key in self]
+        found = [self[key].query(xmin, ymin, xmax, ymax) for key in keys]
+        if not found:
+            return numpy.empty(0, dtype=numpy.int64)
+        return numpy.sort(numpy.concatenate(found))
+
+    def query(self, xmin, ymin, xmax, ymax, layers=None):
+        """
+        Return list of elements found by :meth:`query_indices`
+        in structure order.
+        """
+        struc = self.structure
+        return [struc[index] for index in self.query_indices(xmin, ymin, xmax, ymax,
+            layers).tolist()]
+
+    def query_point(self, x, y, layers=None):
+        """Return list of elements with bounding boxes containing point ``(x, y)``."""
+        return self.query(x, y, x, y, layers)
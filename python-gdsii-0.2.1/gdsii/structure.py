@@ -23,18 +23,41 @@ This module contains class that represents a GDSII structure.
 .. moduleauthor:: Eugeniy Meshcheryakov <eugen@debian.org>
 """
 from __future__ import absolute_import
-from . import elements, record, tags, _records
+from . import elements, extents, tags, _records
 from datetime import datetime
 
 _STRNAME = _records.StringRecord('name', tags.STRNAME)
 _BGNSTR = _records.TimestampsRecord('mod_time', 'acc_time', tags.BGNSTR)
 _STRCLASS = _records.SimpleOptionalRecord('strclass', tags.STRCLASS)
 
+_REFERENCES = (elements.SRef, elements.ARef)
+
+# incremented when references are added to or removed from any structure,
+# used to invalidate cached hierarchy graphs of libraries
+_reference_generation = 0
+
+# incremented when elements of any structure are changed, used to
+# invalidate cached bounding boxes of libraries
+_generation = 0
+
+def _check_references(elems):
+    """Increment :data:`_reference_generation` if `elems` contain references."""
+    global _reference_generation
+    for elem in elems:
+        if isinstance(elem, _REFERENCES):
+            _reference_generation += 1
+            break
+
 class Structure(list):
     """
     GDSII structure class. This class is derived for :class:`list` and can
     contain one or more elements from :mod:`gdsii.elements`.
 
+    Elements should be added and removed with list methods, so that
+    cached data of libraries (for example
+    :meth:`gdsii.library.Library.hierarchy`) and of the structure is updated.
+    After elements are modified in place :meth:`reindex` should be called.
+
     GDS syntax for the structure:
         .. productionlist::
             structure: BGNSTR
@@ -44,6 +67,11 @@ class Structure(list):
                      : ENDSTR
     """
     _gds_objs = (_BGNSTR, _STRNAME, _STRCLASS)
+    _spatial = None
+    # bounding box of elements without references, False if not computed
+    _bbox = False
+    # set when elements are changed, see gdsii.library.LazyLibrary.save()
+    _modified = False
 
     def __init__(self, name, mod_time=None, acc_time=None):
         """
@@ -60,25 +88,146 @@ class Structure(list):
         self.strclass = None
 
     @classmethod
-    def _load(cls, gen):
+    def _load_header(cls, gen, validate=True):
+        """
+        Create a new structure and read structure header using `gen`.
+        On return ``gen.current`` is the first record after the header.
+        """
         self = cls.__new__(cls)
         list.__init__(self)
         self._init_optional()
 
-        for obj in self._gds_objs:
-            obj.read(self, gen)
+        if validate:
+            for obj in self._gds_objs:
+                obj.read(self, gen)
+        else:
+            for obj in self._gds_objs:
+                obj.read_trusted(self, gen)
+        return self
 
-        # read elements till ENDSTR
+    @classmethod
+    def _load(cls, gen, validate=True):
+        self = cls._load_header(gen, validate)
+
+        # read elements till ENDSTR, new structure does not need _changed()
+        load = elements._Base._load
+        append = list.append
         while gen.current.tag != tags.ENDSTR:
-            self.append(elements._Base._load(gen))
+            elem = load(gen, validate)
+            if elem is not None:
+                append(self, elem)
+        return self
+
+    def _changed(self, elems, appended=False):
+        """
+        Called after elements `elems` are added or removed. `appended`
+        is true if `elems` were added to the end and nothing was removed.
+        """
+        global _generation
+        _generation += 1
+        self._bbox = False
+        self._modified = True
+        _check_references(elems)
+        if self._spatial is not None:
+            if appended:
+                self._spatial._appended(elems, len(self) - len(elems))
+            else:
+                self._spatial = None
+
+    def reindex(self):
+        """Drop cached data, for example after elements were modified in place."""
+        global _generation
+        _generation += 1
+        self._spatial = None
+        self._bbox = False
+        self._modified = True
+
+    def bbox(self, lib=None):
+        """
+        Return bounding box ``(xmin, ymin, xmax, ymax)`` of elements,
+        or None if the structure is empty. See :mod:`gdsii.extents`.
+
+        :param lib: if not None, referenced structures are looked up in this
+            :class:`gdsii.library.Library` and included, otherwise references
+            are ignored
+        """
+        if lib is not None:
+            return lib._structure_bbox(self)
+        if self._bbox is False:
+            self._bbox = extents.elements_bbox(self)
+        return self._bbox
+
+    def spatial_index(self):
+        """
+        Return :class:`gdsii.spatial.StructureIndex` of elements.
+        The index is built on the first call and updated when elements are
+        appended. Requires :mod:`numpy`.
+        """
+        if self._spatial is None:
+            # imported here, so that numpy is loaded only when needed
+            from . import spatial
+            self._spatial = spatial.StructureIndex(self)
+        return self._spatial
+
+    def append(self, elem):
+        list.append(self, elem)
+        self._changed((elem,), True)
+
+    def extend(self, elems):
+        elems = list(elems)
+        list.extend(self, elems)
+        self._changed(elems, True)
+
+    def __iadd__(self, elems):
+        self.extend(elems)
         return self
 
-    def _save(self, stream):
+    def insert(self, index, elem):
+        list.insert(self, index, elem)
+        self._changed((elem,))
+
+    def remove(self, elem):
+        list.remove(self, elem)
+        self._changed((elem,))
+
+    def pop(self, index=-1):
+        elem = list.pop(self, index)
+        self._changed((elem,))
+        return elem
+
+    def clear(self):
+        elems = list(self)
+        list.clear(self)
+        self._changed(elems)
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._changed(())
+
+    def reverse(self):
+        list.reverse(self)
+        self._changed(())
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            elems = list.__getitem__(self, index) + value
+        else:
+            elems = [list.__getitem__(self, index), value]
+        list.__setitem__(self, index, value)
+        self._changed(elems)
+
+    def __delitem__(self, index):
+        old = list.__getitem__(self, index)
+        list.__delitem__(self, index)
+        self._changed(old if isinstance(index, slice) else (old,))
+
+    def _save(self, writer):
         for obj in self._gds_objs:
-            obj.save(self, stream)
+            obj.save(self, writer)
         for elem in self:
-            elem._save(stream)
-        record.Record(tags.ENDSTR).save(stream)
+            elem._save(writer)
+        writer.write(tags.ENDSTR)
 
     def __repr__(self):
         return '<Structure: %s>' % self.name.decode()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark for per-record overhead of record parsing.
+
+Compares parsing of all records of a GDS file using the current dispatch
+(precomputed tag table and cached compiled structures) with the original
+one (:func:`gdsii.tags.type_of_tag`, lookup in a dict of parse functions and
+formatting a new format string for every record).
+
+Usage: python -m test.bench_record [file.gds]
+"""
+from __future__ import print_function
+from gdsii import exceptions, record, tags, types
+import os.path
+import struct
+import sys
+import timeit
+
+DEFAULT_FILE = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+        'sample', 'updown_counter_flat.gds')
+
+def _old_parse_int2(data):
+    data_len = len(data)
+    if not data_len or (data_len % 2):
+        raise exceptions.IncorrectDataSize('INT2')
+    return struct.unpack('>%dh' % (data_len//2), data)
+
+def _old_parse_int4(data):
+    data_len = len(data)
+    if not data_len or (data_len % 4):
+        raise exceptions.IncorrectDataSize('INT4')
+    return struct.unpack('>%dl' % (data_len//4), data)
+
+def _old_parse_real8(data):
+    data_len = len(data)
+    if not data_len or (data_len % 8):
+        raise exceptions.IncorrectDataSize('REAL8')
+    ints = struct.unpack('>%dQ' % (data_len//8), data)
+    return tuple(record._int_to_real(n) for n in ints)
+
+_OLD_PARSE_FUNCS = dict(record._PARSE_FUNCS)
+_OLD_PARSE_FUNCS.update({
+    types.INT2: _old_parse_int2,
+    types.INT4: _old_parse_int4,
+    types.REAL8: _old_parse_real8
+})
+
+def old_parse(tag, data):
+    tag_type = tags.type_of_tag(tag)
+    try:
+        parse_func = _OLD_PARSE_FUNCS[tag_type]
+    except KeyError:
+        raise exceptions.UnsupportedTagType(tag_type)
+    return parse_func(data)
+
+def new_parse(tag, data):
+    return record._TAG_PARSERS[tag](data)
+
+def load_records(file_name):
+    with open(file_name, 'rb') as stream:
+        return [(rec.tag, rec.payload) for rec in record.Record.iterate(stream, lazy=True)]
+
+def bench(parse, records, number):
+    def run():
+        for (tag, data) in records:
+            parse(tag, data)
+    return min(timeit.repeat(run, number=number, repeat=3)) / number / len(records)
+
+def main(file_name, number=5):
+    records = load_records(file_name)
+    print('%s: %d records' % (file_name, len(records)))
+    old = bench(old_parse, records, number)
+    new = bench(new_parse, records, number)
+    print('before: %.3f us/record' % (old * 1e6))
+    print('after:  %.3f us/record' % (new * 1e6))
+    print('speedup: %.2fx' % (old / new))
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FILE)
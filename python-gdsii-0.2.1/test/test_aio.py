@@ -0,0 +1,103 @@
+import unittest
+from gdsii import aio, exceptions, library, record, tags
+from .util import TEST_FILE, save_to_bytes
+import asyncio
+import socket
+
+class TestAsyncLoad(unittest.TestCase):
+    """Feed GDS data through local socket pairs."""
+    def setUp(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.data = stream.read()
+        self.loop = asyncio.new_event_loop()
+        self.writers = []
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.close_pipes())
+        self.loop.close()
+
+    async def open_pipe(self, data, piece_size):
+        """Return stream reader getting `data` in pieces of `piece_size` bytes."""
+        rsock, wsock = socket.socketpair()
+        reader, rwriter = await asyncio.open_connection(sock=rsock)
+        unused_reader, writer = await asyncio.open_connection(sock=wsock)
+        async def feed():
+            try:
+                for i in range(0, len(data), piece_size):
+                    writer.write(data[i:i+piece_size])
+                    await writer.drain()
+                    await asyncio.sleep(0)
+            finally:
+                writer.close()
+                await writer.wait_closed()
+        # transport is closed when its writer is garbage collected
+        self.writers.append(rwriter)
+        return reader, asyncio.ensure_future(feed())
+
+    async def close_pipes(self):
+        for writer in self.writers:
+            writer.close()
+            await writer.wait_closed()
+
+    async def load(self, data, piece_size):
+        reader, feeder = await self.open_pipe(data, piece_size)
+        try:
+            return await library.Library.load_async(reader)
+        finally:
+            await feeder
+
+    def test_load(self):
+        lib = self.loop.run_until_complete(self.load(self.data, 7))
+        self.assertEqual(save_to_bytes(lib), self.data)
+
+    def test_concurrent(self):
+        async def load_all():
+            return await asyncio.gather(*[self.load(self.data, size) for size in (3, 50, 1000)])
+        for lib in self.loop.run_until_complete(load_all()):
+            self.assertEqual(lib.name, b'TEST.DB')
+            self.assertEqual(save_to_bytes(lib), self.data)
+
+    def test_read_next(self):
+        async def read_all():
+            reader, feeder = await self.open_pipe(self.data, 10)
+            gen = aio.AsyncReader(reader, chunk_size=16)
+            result = []
+            while not result or result[-1] != tags.ENDLIB:
+                result.append((await gen.read_next()).tag)
+            await feeder
+            return result
+        result = self.loop.run_until_complete(read_all())
+        self.assertEqual(result[0], tags.HEADER)
+        self.assertEqual(len(result), 24)
+
+    def test_read_data(self):
+        with open(TEST_FILE, 'rb') as stream:
+            expected = [(rec.tag, rec.data) for rec in record.Record.iterate(stream)]
+        async def read_all(**kwargs):
+            reader, feeder = await self.open_pipe(self.data, 10)
+            gen = aio.AsyncReader(reader, chunk_size=16, **kwargs)
+            result = []
+            while not result or result[-1].tag != tags.ENDLIB:
+                result.append(await gen.read_next())
+            await feeder
+            return result
+        for kwargs in ({}, {'lazy': True}, {'xy_arrays': True}):
+            result = self.loop.run_until_complete(read_all(**kwargs))
+            self.assertEqual([(rec.tag, tuple(rec.data) if rec.tag == tags.XY else rec.data)
+                for rec in result], expected)
+
+    def test_truncated(self):
+        self.assertRaises(exceptions.EndOfFileError, self.loop.run_until_complete,
+                self.load(self.data[:-10], 100))
+
+test_cases = (TestAsyncLoad,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from gdsii import columns, elements, library, points, structure
+import os.path
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TEST_FILE = os.path.join(os.path.dirname(__file__), 'data', 'test1.gds')
+
+def describe(elem):
+    attrs = [name for name in type(elem).__slots__ if name not in ('xy', 'properties')]
+    return repr((type(elem).__name__, tuple(getattr(elem, name, None) for name in attrs),
+            tuple(map(tuple, elem.xy)), elem.properties or None))
+
+def make_structure():
+    struc = structure.Structure(b'S')
+    struc.append(elements.Boundary(1, 0, [(0, 0), (10, 0), (10, 20), (0, 0)]))
+    struc.append(elements.Boundary(1, 0, [(-5, 3), (7, 3), (7, 8), (-5, 3)]))
+    path = elements.Path(1, 0, [(0, 0), (100, 0)])
+    path.width = 10
+    path.path_type = 2
+    struc.append(path)
+    struc.append(elements.Path(2, 1, [(5, 5), (5, 50), (50, 50)]))
+    struc.append(elements.Box(3, 1, [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]))
+    struc.append(elements.Node(4, 2, [(7, 7)]))
+    struc.append(elements.Text(5, 0, [(1, 1)], b'text'))
+    struc.append(elements.SRef(b'OTHER', [(0, 0)]))
+    boundary = elements.Boundary(1, 0, [(0, 0), (1, 0), (1, 1), (0, 0)])
+    boundary.properties = [(1, b'prop')]
+    struc.append(boundary)
+    extended = elements.Path(2, 1, [(0, 0), (0, 10)])
+    extended.bgn_extn = 3
+    struc.append(extended)
+    return struc
+
+class TestColumnStore(unittest.TestCase):
+    def setUp(self):
+        self.structure = make_structure()
+        self.store = columns.ColumnStore(self.structure)
+
+    def test_layout(self):
+        store = self.store
+        self.assertEqual(sorted(store), [(1, 0), (2, 1), (3, 1), (4, 2)])
+        self.assertEqual(len(store.others), 4)
+        layer = store[(1, 0)]
+        self.assertEqual(len(layer), 3)
+        self.assertEqual(layer.offsets.tolist(), [0, 4, 8, 10])
+        self.assertEqual(layer.kinds.tolist(), [0, 0, 1])
+        self.assertEqual(layer.widths[2], 10)
+        self.assertEqual(layer.coords[16:20].tolist(), [0, 0, 100, 0])
+
+    def test_round_trip(self):
+        expected = sorted(map(describe, self.structure))
+        for xy_arrays in (False, True):
+            result = list(self.store.to_elements(xy_arrays))
+            self.assertEqual(sorted(map(describe, result)), expected)
+        self.assertTrue(isinstance(self.store[(4, 2)].element(0, True).xy,
+            points.PointArray))
+
+    @unittest.skipIf(numpy is None, 'numpy is not available')
+    def test_bbox(self):
+        store = self.store
+        self.assertEqual(store[(1, 0)].bbox(), (-5, 0, 100, 20))
+        self.assertEqual(store.bbox(), (-5, 0, 100, 50))
+        self.assertEqual(store[(1, 0)].bboxes().tolist(),
+                [[0, 0, 10, 20], [-5, 3, 7, 8], [0, 0, 100, 0]])
+        self.assertEqual(columns.ColumnStore().bbox(), None)
+        self.assertEqual(columns.LayerColumns(1, 0).bboxes().shape, (0, 4))
+
+    @unittest.skipIf(numpy is None, 'numpy is not available')
+    def test_transform(self):
+        store = self.store
+        store.transform(0, -1, 1, 0, 1000, 0)
+        self.assertEqual(store[(1, 0)].element(0).xy,
+                [(1000, 0), (1000, 10), (980, 10), (1000, 0)])
+        store.scale(0.5)
+        self.assertEqual(store[(1, 0)].element(2).xy, [(500, 0), (500, 50)])
+        self.assertEqual(store[(1, 0)].element(2).width, 5)
+        store.translate(-500, 1)
+        self.assertEqual(store[(4, 2)].element(0).xy, [(-4, 5)])
+        self.assertEqual(store[(2, 1)].element(0).width, None)
+
+    def test_from_stream(self):
+        with open(TEST_FILE, 'rb') as stream:
+            lib = library.Library.load(stream)
+            stream.seek(0)
+            stores = columns.ColumnStore.from_stream(stream)
+        self.assertEqual(list(stores), [b'test_struc1'])
+        expected = columns.ColumnStore.from_library(lib)[b'test_struc1']
+        result = stores[b'test_struc1']
+        self.assertEqual(sorted(result), sorted(expected))
+        self.assertEqual(sorted(map(describe, result.to_elements())),
+                sorted(map(describe, lib[0])))
+
+test_cases = (TestColumnStore,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from gdsii import dedup, elements, points
+from .util import make_library, make_structure, save_to_bytes
+
+def make_cell(name, layer=1, ref=None):
+    struc = make_structure(name, [
+        elements.Boundary(layer, 0, [(0, 0), (10, 0), (10, 10), (0, 0)]),
+        elements.Path(2, 0, [(0, 0), (0, 100)])])
+    if ref is not None:
+        struc.append(elements.SRef(ref, [(5, 5)]))
+    return struc
+
+def make_cells():
+    """Library where A and B are equal, PA and PB refer to them."""
+    cell = make_cell(b'B')
+    cell.reverse()
+    top = make_structure(b'TOP', [elements.SRef(b'PA', [(0, 0)]),
+        elements.ARef(b'PB', 2, 2, [(0, 0), (200, 0), (0, 200)]),
+        elements.SRef(b'C', [(0, 0)]),
+        elements.SRef(b'B', [(0, 0)])])
+    return make_library([make_cell(b'A'), cell, make_cell(b'C', layer=7),
+        make_cell(b'PA', ref=b'A'), make_cell(b'PB', ref=b'B'), top])
+
+def encoded_size(lib):
+    return len(save_to_bytes(lib))
+
+class TestDeduplicate(unittest.TestCase):
+    def setUp(self):
+        self.library = make_cells()
+
+    def test_merge(self):
+        lib = self.library
+        size = encoded_size(lib)
+        report = dedup.deduplicate(lib)
+        self.assertEqual(report.merged, {b'B': b'A', b'PB': b'PA'})
+        self.assertEqual([struc.name for struc in lib], [b'A', b'C', b'PA', b'TOP'])
+        self.assertEqual([elem.struct_name for elem in lib.structure_by_name(b'TOP')],
+                [b'PA', b'PA', b'C', b'A'])
+        self.assertEqual(lib.hierarchy().undefined(), set())
+        self.assertEqual(report.elements, 2 + 3)
+        self.assertEqual(report.bytes, size - encoded_size(lib))
+
+    def test_share(self):
+        lib = self.library
+        report = dedup.deduplicate(lib, merge_structures=False)
+        self.assertEqual(report.merged, {})
+        self.assertEqual(len(lib), 6)
+        boundaries = [struc[0] for struc in lib[:5]]
+        boundaries[1] = lib[1][1]
+        for elem in boundaries:
+            self.assertTrue(elem.xy is boundaries[0].xy)
+        self.assertTrue(isinstance(boundaries[0].xy, tuple))
+        self.assertEqual(report.shared, 4 + 4)
+        self.assertTrue(report.memory > 0)
+        self.assertEqual(encoded_size(lib), encoded_size(make_cells()))
+
+    def test_share_arrays(self):
+        lib = self.library
+        for struc in lib:
+            for elem in struc:
+                elem.xy = points.PointArray(elem.xy)
+        report = dedup.deduplicate(lib, merge_structures=False)
+        self.assertEqual(report.shared, 4 + 4)
+        self.assertTrue(lib[0][0].xy.flat is lib[2][0].xy.flat)
+        self.assertTrue(isinstance(lib[0][0].xy, points.PointArray))
+        self.assertEqual(encoded_size(lib), encoded_size(make_cells()))
+        report = dedup.deduplicate(lib, merge_structures=False)
+        self.assertEqual(report.shared, 0)
+
+    def test_share_changed(self):
+        lib = self.library
+        for struc in (lib[0], lib[1], lib[2]):
+            for elem in struc:
+                elem.xy = points.PointArray(elem.xy)
+        dedup.deduplicate(lib, merge_structures=False)
+        (first, second, third) = (lib[0][0], lib[2][0], lib[1][1])
+        self.assertTrue(first.xy.flat is third.xy.flat)
+        self.assertTrue(isinstance(lib[3][0].xy, tuple))
+        third.xy.as_numpy()[0] = (1, 1)
+        self.assertEqual(second.xy[0], (0, 0))
+        first.xy[1] = (20, 0)
+        second.xy.append((5, 5))
+        self.assertEqual(list(first.xy), [(0, 0), (20, 0), (10, 10), (0, 0)])
+        self.assertEqual(list(second.xy), [(0, 0), (10, 0), (10, 10), (0, 0), (5, 5)])
+        self.assertEqual(list(third.xy), [(1, 1), (10, 0), (10, 10), (0, 0)])
+        self.assertEqual(list(lib[4][0].xy), [(0, 0), (10, 0), (10, 10), (0, 0)])
+        self.assertEqual(type(first.xy), points.PointArray)
+
+    def test_keep(self):
+        lib = self.library
+        report = dedup.deduplicate(lib, keep=[b'PB'])
+        self.assertEqual(report.merged, {b'B': b'A'})
+        self.assertEqual(lib.structure_by_name(b'PB')[2].struct_name, b'A')
+
+    def test_duplicates(self):
+        lib = self.library
+        cell = lib.structure_by_name(b'C')
+        cell.append(elements.Boundary(7, 0, [(0, 0), (10, 0), (10, 10), (0, 0)]))
+        cell.append(elements.Boundary(1, 0, [(0, 0), (10, 0), (10, 10), (0, 0)]))
+        report = dedup.deduplicate(lib, remove_duplicates=True)
+        self.assertEqual(len(lib.structure_by_name(b'C')), 3)
+        self.assertEqual(report.elements, 1 + 2 + 3)
+        self.assertEqual(report.bytes, encoded_size(make_cells()) + 2 * 56 -
+                encoded_size(lib))
+
+test_cases = (TestDeduplicate,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
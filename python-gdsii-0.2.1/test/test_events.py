@@ -0,0 +1,68 @@
+import unittest
+from gdsii import elements, events, exceptions, library
+import io
+import os.path
+
+TEST_FILE = os.path.join(os.path.dirname(__file__), 'data', 'test1.gds')
+
+class TestIterParse(unittest.TestCase):
+    def setUp(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.data = stream.read()
+
+    def test_events(self):
+        result = list(events.iterparse(io.BytesIO(self.data)))
+        self.assertEqual([event for (event, obj) in result], [events.LIBRARY,
+            events.BGNSTRUCTURE, events.ELEMENT, events.ELEMENT,
+            events.ENDSTRUCTURE, events.ENDLIBRARY])
+        lib = result[0][1]
+        self.assertEqual(lib.name, b'TEST.DB')
+        self.assertEqual(len(lib), 0)
+        self.assertTrue(result[-1][1] is lib)
+        struc = result[1][1]
+        self.assertEqual(struc.name, b'test_struc1')
+        self.assertEqual(len(struc), 0)
+        self.assertTrue(result[4][1] is struc)
+        self.assertTrue(isinstance(result[2][1], elements.Boundary))
+        self.assertTrue(isinstance(result[3][1], elements.Path))
+
+    def test_same_as_load(self):
+        lib = library.Library.load(io.BytesIO(self.data))
+        elems = [obj for (event, obj) in events.iterparse(io.BytesIO(self.data))
+                if event == events.ELEMENT]
+        for (elem, loaded) in zip(elems, lib[0]):
+            for attr in type(elem).__slots__:
+                self.assertEqual(getattr(elem, attr, None), getattr(loaded, attr, None))
+
+    def test_truncated(self):
+        self.assertRaises(exceptions.EndOfFileError, list,
+                events.iterparse(io.BytesIO(self.data[:-10])))
+
+class TestParse(unittest.TestCase):
+    class Recorder(events.Handler):
+        def __init__(self):
+            self.calls = []
+
+        def begin_structure(self, struc):
+            self.calls.append(struc.name)
+
+        def element(self, elem):
+            self.calls.append(type(elem))
+
+    def test_handler(self):
+        handler = self.Recorder()
+        with open(TEST_FILE, 'rb') as stream:
+            events.parse(stream, handler)
+        self.assertEqual(handler.calls, [b'test_struc1', elements.Boundary, elements.Path])
+
+test_cases = (TestIterParse, TestParse)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
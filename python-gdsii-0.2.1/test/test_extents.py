@@ -0,0 +1,95 @@
+import unittest
+from gdsii import elements, exceptions, extents
+from .util import make_hierarchy
+
+try:
+    from gdsii import flatten
+    import numpy
+except ImportError:
+    numpy = None
+
+def flat_bbox(lib, name):
+    """Bounding box of flattened elements, for comparison."""
+    return extents.union(extents.element_bbox(elem) for elem in flatten.flatten(lib, name))
+
+class TestExtents(unittest.TestCase):
+    def test_elements(self):
+        path = elements.Path(1, 0, [(0, 0), (10, 0)])
+        self.assertEqual(extents.element_bbox(path), (0, 0, 10, 0))
+        path.width = 3
+        self.assertEqual(extents.element_bbox(path), (-2, -2, 12, 2))
+        path.path_type = 4
+        path.end_extn = 5
+        self.assertEqual(extents.element_bbox(path), (-7, -7, 17, 7))
+        self.assertEqual(extents.element_bbox(elements.SRef(b'A', [(0, 0)])), None)
+        self.assertEqual(extents.elements_bbox([path, elements.Node(1, 1, [(100, -100)])]),
+                (-7, -100, 100, 7))
+        self.assertEqual(extents.elements_bbox([]), None)
+        self.assertEqual(extents.union([None, (0, 0, 1, 1), (-1, 0, 0, 2)]), (-1, 0, 1, 2))
+
+    def test_miter(self):
+        path = elements.Path(1, 0, [(0, 0), (1000, 0), (1000, 0), (0, 100)])
+        path.width = 100
+        self.assertEqual(extents.element_bbox(path), (-50, -50, 2003, 150))
+        self.assertEqual(extents.elements_bbox([path]), (-50, -50, 2003, 150))
+        # paths turning back are beveled
+        path.xy = [(0, 0), (1000, 0), (0, 0)]
+        self.assertEqual(extents.element_bbox(path), (-50, -50, 1050, 50))
+
+    def test_aref(self):
+        ref = elements.ARef(b'A', 4, 3, [(0, 0), (40, 0), (0, 30)])
+        self.assertEqual(extents.reference_bbox(ref, (0, 0, 5, 5)), (0, 0, 35, 25))
+        ref.angle = 180.0
+        self.assertEqual(extents.reference_bbox(ref, (0, 0, 5, 5)), (-5, -5, 30, 20))
+        self.assertEqual(extents.reference_bbox(ref, None), None)
+
+class TestStructureBBox(unittest.TestCase):
+    def setUp(self):
+        self.library = make_hierarchy()
+        # boxes of references rotated by multiples of 90 degrees are exact
+        self.library[2][0].angle = 270.0
+
+    def test_structure(self):
+        mid = self.library[1]
+        self.assertEqual(mid.bbox(), (0, 0, 1, 1))
+        self.assertEqual(self.library[2].bbox(), None)
+        mid.append(elements.Text(3, 0, [(-50, -50)], b'label'))
+        self.assertEqual(mid.bbox(), (-50, -50, 1, 1))
+        self.assertEqual(mid.bbox(self.library), self.library.bbox(b'MID'))
+
+    @unittest.skipIf(numpy is None, 'numpy is not available')
+    def test_library(self):
+        lib = self.library
+        for name in (b'LEAF', b'MID', b'TOP'):
+            self.assertEqual(lib.bbox(name), flat_bbox(lib, name))
+        leaf = lib.structure_by_name(b'LEAF')
+        leaf.append(elements.Node(5, 5, [(1000, 1000)]))
+        self.assertEqual(lib.bbox(b'TOP'), flat_bbox(lib, b'TOP'))
+        leaf[0].xy = [(0, 0), (-100, 0), (0, 1), (0, 0)]
+        leaf.reindex()
+        self.assertEqual(lib.bbox(b'TOP'), flat_bbox(lib, b'TOP'))
+
+    def test_cache(self):
+        lib = self.library
+        box = lib.bbox(b'TOP')
+        self.assertTrue(lib.bbox(b'TOP') is box)
+        lib.structure_by_name(b'MID').pop()
+        self.assertNotEqual(lib.bbox(b'TOP'), box)
+
+    def test_errors(self):
+        lib = self.library
+        self.assertRaises(KeyError, lib.bbox, b'MISSING')
+        lib[0].append(elements.SRef(b'TOP', [(0, 0)]))
+        self.assertRaises(exceptions.FormatError, lib.bbox, b'TOP')
+
+test_cases = (TestExtents, TestStructureBBox)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+from gdsii import elements, exceptions, flatten, library, points
+from .util import SAMPLE_DIR, make_hierarchy
+from collections import Counter
+import math
+import os.path
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def naive_flatten(lib, name, transform=lambda x, y: (x, y), mag=1.0):
+    """Expand references point by point, for comparison."""
+    result = []
+    for elem in lib.structure_by_name(name):
+        if isinstance(elem, (elements.SRef, elements.ARef)):
+            if elem.struct_name not in lib.hierarchy():
+                continue
+            scale = elem.mag or 1.0
+            angle = math.radians(elem.angle or 0)
+            flip = -1 if elem.strans and elem.strans & 0x8000 else 1
+            origins = [elem.xy[0]]
+            if isinstance(elem, elements.ARef):
+                (x0, y0), (x1, y1), (x2, y2) = elem.xy
+                origins = [(x0 + c * (x1 - x0) / elem.cols + r * (x2 - x0) / elem.rows,
+                    y0 + c * (y1 - y0) / elem.cols + r * (y2 - y0) / elem.rows)
+                    for r in range(elem.rows) for c in range(elem.cols)]
+            for (ox, oy) in origins:
+                def child(x, y, ox=ox, oy=oy, scale=scale, angle=angle, flip=flip):
+                    y *= flip
+                    return transform(ox + scale * (x * math.cos(angle) - y * math.sin(angle)),
+                            oy + scale * (x * math.sin(angle) + y * math.cos(angle)))
+                result.extend(naive_flatten(lib, elem.struct_name, child, mag * scale))
+        else:
+            xy = [tuple(int(round(c)) for c in transform(x, y)) for (x, y) in elem.xy]
+            width = getattr(elem, 'width', None)
+            if isinstance(elem, elements.Path):
+                width = int(round(width * mag))
+            result.append((type(elem), elem.layer, tuple(xy), width))
+    return result
+
+def summary(elems):
+    return Counter((type(elem), elem.layer, tuple(map(tuple, elem.xy)),
+        getattr(elem, 'width', None)) for elem in elems)
+
+@unittest.skipIf(numpy is None, 'numpy is not available')
+class TestFlatten(unittest.TestCase):
+    def setUp(self):
+        self.library = make_hierarchy()
+        self.expected = Counter(naive_flatten(self.library, b'TOP'))
+
+    def check(self, **kwargs):
+        result = list(flatten.flatten(self.library, b'TOP', **kwargs))
+        self.assertEqual(summary(result), self.expected)
+        return result
+
+    def test_cached(self):
+        result = self.check()
+        self.assertEqual(len(result), 5 * (1 + 7 * 3))
+
+    def test_uncached(self):
+        self.check(cache_limit=0)
+
+    def test_chunks(self):
+        old_chunk = flatten._CHUNK
+        flatten._CHUNK = 3
+        try:
+            self.check()
+            self.check(cache_limit=0)
+        finally:
+            flatten._CHUNK = old_chunk
+
+    def test_xy_arrays(self):
+        for elem in self.check(xy_arrays=True):
+            self.assertTrue(isinstance(elem.xy, points.PointArray))
+
+    def test_text(self):
+        texts = [elem for elem in flatten.flatten(self.library, b'MID')
+                if isinstance(elem, elements.Text)]
+        self.assertEqual([(elem.strans, elem.mag, elem.angle) for elem in texts],
+                [(0x8000, None, 90.0)] + [(None, 2.0, None)] * 6)
+        self.assertEqual(self.library[0][2].strans, None)
+
+    def test_errors(self):
+        self.assertRaises(KeyError, flatten.flatten, self.library, b'MISSING')
+        self.library[0].append(elements.SRef(b'TOP', [(0, 0)]))
+        self.assertRaises(exceptions.FormatError, flatten.Flattener, self.library)
+
+    @unittest.skipUnless(os.path.exists(os.path.join(SAMPLE_DIR, 'updown_counter.gds')),
+            'sample files are not available')
+    def test_sample(self):
+        def key(elem):
+            xy = [tuple(point) for point in elem.xy]
+            if isinstance(elem, elements.Boundary):
+                # reflection reverses order of points
+                xy = xy[:-1]
+                xy = min(tuple(pts[i:] + pts[:i]) for pts in (xy, xy[::-1])
+                        for i in range(len(pts)))
+            return (type(elem), elem.layer, tuple(xy), getattr(elem, 'width', None))
+        with open(os.path.join(SAMPLE_DIR, 'updown_counter.gds'), 'rb') as stream:
+            lib = library.Library.load(stream)
+        with open(os.path.join(SAMPLE_DIR, 'updown_counter_flat.gds'), 'rb') as stream:
+            flat = library.Library.load(stream)
+        for cache_limit in (None, 0):
+            result = flatten.flatten(lib, b'updown_counter', cache_limit=cache_limit)
+            self.assertEqual(Counter(map(key, result)), Counter(map(key, flat[0])))
+
+test_cases = (TestFlatten,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
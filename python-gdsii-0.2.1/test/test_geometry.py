@@ -0,0 +1,140 @@
+import unittest
+from gdsii import columns, elements, extents, points, structure
+import math
+import random
+
+try:
+    import numpy
+    from gdsii import geometry, outline
+except ImportError:
+    numpy = None
+
+def polygon_metrics(xy):
+    signed = 0.5 * sum(x0 * y1 - x1 * y0 for ((x0, y0), (x1, y1)) in zip(xy, xy[1:] + xy[:1]))
+    perimeter = sum(math.hypot(x1 - x0, y1 - y0) for ((x0, y0), (x1, y1)) in zip(xy, xy[1:] + xy[:1]))
+    return (abs(signed), perimeter, (signed > 0) - (signed < 0))
+
+def make_structure():
+    rnd = random.Random(2)
+    struc = structure.Structure(b'S')
+    for i in range(50):
+        xy = [(rnd.randint(-1000, 1000), rnd.randint(-1000, 1000)) for j in range(rnd.randint(3, 8))]
+        struc.append(elements.Boundary(i % 3, 0, xy + xy[:1]))
+    struc.append(elements.SRef(b'A', [(0, 0)]))
+    struc.append(elements.Box(1, 5, [(0, 0), (0, 4), (2, 4), (2, 0), (0, 0)]))
+    path = elements.Path(4, 0, [(0, 0), (30, 0), (30, 40)])
+    path.width = 10
+    struc.append(path)
+    path = elements.Path(4, 0, [(0, 0), (0, 10)])
+    path.width = 2
+    path.path_type = 1
+    struc.append(path)
+    struc.append(elements.Text(4, 0, [(0, 0)], b'text'))
+    return struc
+
+@unittest.skipIf(numpy is None, 'numpy is not available')
+class TestMeasure(unittest.TestCase):
+    def setUp(self):
+        self.structure = make_structure()
+
+    def test_polygons(self):
+        metrics = geometry.measure(self.structure)
+        self.assertEqual(metrics.indices.tolist(), list(range(50)) + [51, 52, 53])
+        for (i, index) in enumerate(metrics.indices.tolist()[:51]):
+            elem = self.structure[index]
+            (area, perimeter, orientation) = polygon_metrics(list(elem.xy))
+            self.assertAlmostEqual(metrics.area[i], area)
+            self.assertAlmostEqual(metrics.perimeter[i], perimeter)
+            self.assertEqual(metrics.orientation[i], orientation)
+            xs = [x for (x, y) in elem.xy]
+            ys = [y for (x, y) in elem.xy]
+            self.assertEqual(metrics.bboxes[i].tolist(), [min(xs), min(ys), max(xs), max(ys)])
+        self.assertEqual((metrics.layers[50], metrics.data_types[50], metrics.orientation[50]),
+                (1, 5, -1))
+
+    def test_paths(self):
+        metrics = geometry.measure(self.structure, layers={(4, 0)})
+        self.assertEqual(metrics.indices.tolist(), [52, 53])
+        self.assertEqual(metrics.area.tolist(), [700, 20 + math.pi])
+        self.assertEqual(metrics.perimeter.tolist(), [160, 20 + 2 * math.pi])
+        self.assertEqual(metrics.orientation.tolist(), [0, 0])
+        self.assertEqual(metrics.bboxes.tolist(), [[-5, -5, 35, 45], [-1, -1, 1, 11]])
+        path = self.structure[52]
+        path.path_type = 4
+        path.bgn_extn = 3
+        path.end_extn = 7
+        metrics = geometry.measure([path, elements.Node(1, 1, [(0, 0)])])
+        self.assertEqual(metrics.area.tolist(), [800])
+        self.assertEqual(metrics.bboxes.tolist(), [[-12, -12, 42, 52]])
+
+    def test_miter(self):
+        rnd = random.Random(3)
+        paths = []
+        for i in range(100):
+            path = elements.Path(1, 0, [(rnd.randint(-100, 100), rnd.randint(-100, 100))
+                for j in range(rnd.randint(2, 6))])
+            path.width = rnd.randint(1, 20)
+            path.path_type = rnd.choice((0, 2))
+            paths.append(path)
+        metrics = geometry.measure(paths)
+        (coords, offsets) = outline.outline(paths)
+        for (i, bbox) in enumerate(metrics.bboxes.tolist()):
+            ring = coords[offsets[i]:offsets[i + 1]]
+            # outline fits in the box, which is rounded outwards by extents
+            self.assertTrue((ring >= numpy.array(bbox[:2]) - 1e-6).all())
+            self.assertTrue((ring <= numpy.array(bbox[2:]) + 1e-6).all())
+            self.assertEqual(tuple(map(int, numpy.floor(bbox[:2]).tolist() +
+                numpy.ceil(bbox[2:]).tolist())), extents.element_bbox(paths[i]))
+
+    def test_xy_arrays(self):
+        struc = make_structure()
+        for elem in struc:
+            elem.xy = points.PointArray(elem.xy)
+        expected = geometry.measure(self.structure)
+        metrics = geometry.measure(struc)
+        for name in geometry.Metrics.__slots__:
+            self.assertEqual(getattr(metrics, name).tolist(), getattr(expected, name).tolist())
+
+    def test_large_coordinates(self):
+        for offset in (10 ** 8, 10 ** 9, 2 * 10 ** 9):
+            (x, y) = (offset, offset - 10)
+            boundary = elements.Boundary(1, 0, [(x, y), (x + 7, y), (x + 7, y + 5),
+                (x, y + 5), (x, y)])
+            metrics = geometry.measure([boundary])
+            self.assertEqual(metrics.area.tolist(), [35])
+            self.assertEqual(metrics.perimeter.tolist(), [24])
+            self.assertEqual(metrics.orientation.tolist(), [1])
+
+    def test_totals(self):
+        metrics = geometry.measure(self.structure)
+        totals = metrics.totals()
+        self.assertEqual(sorted(totals), [(0, 0), (1, 0), (1, 5), (2, 0), (4, 0)])
+        (count, area, perimeter, density) = totals[(1, 5)]
+        self.assertEqual((count, area, perimeter), (1, 8, 12))
+        bbox = metrics.bbox()
+        self.assertAlmostEqual(density, 8.0 / ((bbox[2] - bbox[0]) * (bbox[3] - bbox[1])))
+        self.assertEqual(metrics.totals((0, 0, 4, 4))[(1, 5)][3], 0.5)
+        self.assertEqual(geometry.measure([]).totals(), {})
+        self.assertEqual(geometry.measure([]).bbox(), None)
+
+    def test_columns(self):
+        struc = self.structure
+        expected = geometry.measure(struc)
+        metrics = geometry.measure_columns(columns.ColumnStore(struc))
+        self.assertEqual(sorted(metrics.totals().items()), sorted(expected.totals().items()))
+        self.assertEqual(sorted(metrics.area.tolist()), sorted(expected.area.tolist()))
+        metrics = geometry.measure_columns(columns.ColumnStore(struc), layers={(1, 5), (9, 9)})
+        self.assertEqual(metrics.indices.tolist(), [0])
+        self.assertEqual(len(geometry.measure_columns(columns.ColumnStore())), 0)
+
+test_cases = (TestMeasure,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from gdsii import elements, exceptions, library, structure
+from .util import make_library, make_structure
+import os
+import tempfile
+
+def make_graph():
+    """
+    Library with hierarchy TOP -> A (2 refs), TOP -> B, A -> B,
+    OTHER -> MISSING and standalone C.
+    """
+    lib = make_library()
+    for (name, refs) in ((b'TOP', (b'A', b'B', b'A')), (b'A', (b'B',)), (b'B', ()),
+            (b'C', ()), (b'OTHER', (b'MISSING',))):
+        struc = make_structure(name, [elements.Boundary(1, 0, [(0, 0), (1, 0), (1, 1), (0, 0)])])
+        for ref in refs:
+            if ref == b'B':
+                struc.append(elements.ARef(ref, 2, 3, [(0, 0), (20, 0), (0, 30)]))
+            else:
+                struc.append(elements.SRef(ref, [(0, 0)]))
+        lib.append(struc)
+    return lib
+
+class TestHierarchy(unittest.TestCase):
+    def setUp(self):
+        self.library = make_graph()
+        self.graph = self.library.hierarchy()
+
+    def test_edges(self):
+        graph = self.graph
+        self.assertEqual(list(graph), [b'TOP', b'A', b'B', b'C', b'OTHER'])
+        self.assertEqual(graph.children(b'TOP'), {b'A': 2, b'B': 1})
+        self.assertEqual(graph.children(b'B'), {})
+        self.assertEqual(graph.parents(b'B'), {b'TOP': 1, b'A': 1})
+        self.assertEqual(graph.ref_count(b'A'), 2)
+        self.assertEqual(graph.ref_count(b'MISSING'), 1)
+        self.assertEqual(graph.ref_count(b'TOP'), 0)
+        self.assertRaises(KeyError, graph.children, b'NONE')
+        self.assertTrue(b'C' in graph)
+        self.assertFalse(b'MISSING' in graph)
+
+    def test_queries(self):
+        graph = self.graph
+        self.assertEqual(graph.top_cells(), [b'TOP', b'C', b'OTHER'])
+        self.assertEqual(graph.undefined(), set([b'MISSING']))
+        self.assertEqual(graph.descendants(b'TOP'), set([b'A', b'B']))
+        order = graph.topological_order()
+        self.assertEqual(sorted(order), sorted(graph))
+        for name in order:
+            for child in graph.children(name):
+                if child in graph:
+                    self.assertTrue(order.index(child) < order.index(name))
+
+    def test_cycle(self):
+        self.library.structure_by_name(b'B').append(elements.SRef(b'TOP', [(0, 0)]))
+        graph = self.library.hierarchy()
+        self.assertEqual(graph.top_cells(), [b'C', b'OTHER'])
+        self.assertRaises(exceptions.FormatError, graph.topological_order)
+
+    def test_cache(self):
+        lib = self.library
+        lib.structure_by_name(b'C').append(elements.Box(1, 0, [(0, 0)] * 5))
+        self.assertTrue(lib.hierarchy() is self.graph)
+        lib.structure_by_name(b'C').append(elements.SRef(b'B', [(0, 0)]))
+        graph = lib.hierarchy()
+        self.assertFalse(graph is self.graph)
+        self.assertEqual(graph.parents(b'B'), {b'TOP': 1, b'A': 1, b'C': 1})
+        del lib.structure_by_name(b'C')[-1]
+        self.assertEqual(lib.hierarchy().parents(b'B'), {b'TOP': 1, b'A': 1})
+        lib.append(structure.Structure(b'MISSING'))
+        self.assertEqual(lib.hierarchy().undefined(), set())
+        lib.structure_by_name(b'OTHER')[1].struct_name = b'C'
+        lib.reindex()
+        self.assertEqual(lib.hierarchy().top_cells(), [b'TOP', b'OTHER', b'MISSING'])
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        self.library = make_graph()
+
+    def test_lookup(self):
+        lib = self.library
+        self.assertTrue(lib.structure_by_name(b'A') is lib[1])
+        self.assertRaises(KeyError, lib.structure_by_name, b'MISSING')
+        struc = structure.Structure(b'NEW')
+        lib.append(struc)
+        self.assertTrue(lib.structure_by_name(b'NEW') is struc)
+        lib.extend([structure.Structure(b'NEW'), structure.Structure(b'NEW2')])
+        self.assertTrue(lib.structure_by_name(b'NEW') is struc)
+        self.assertEqual(lib.structure_by_name(b'NEW2').name, b'NEW2')
+
+    def test_remove(self):
+        lib = self.library
+        a = lib.structure_by_name(b'A')
+        lib.remove(a)
+        self.assertRaises(KeyError, lib.structure_by_name, b'A')
+        del lib[0]
+        self.assertRaises(KeyError, lib.structure_by_name, b'TOP')
+        lib[0] = a
+        self.assertTrue(lib.structure_by_name(b'A') is a)
+        self.assertRaises(KeyError, lib.structure_by_name, b'B')
+
+    def test_rename(self):
+        lib = self.library
+        lib.structure_by_name(b'A').name = b'A2'
+        self.assertRaises(KeyError, lib.structure_by_name, b'A')
+        lib.reindex()
+        self.assertTrue(lib.structure_by_name(b'A2') is lib[1])
+
+    def test_lazy(self):
+        fd, path = tempfile.mkstemp(suffix='.gds')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                self.library.save(stream)
+            with library.Library.open_lazy(path) as lib:
+                self.assertEqual(len(lib.structure_by_name(b'A')), 2)
+                self.assertEqual(len(lib._cache), 1)
+                self.assertEqual(lib.hierarchy().children(b'TOP'), {b'A': 2, b'B': 1})
+        finally:
+            os.remove(path)
+
+test_cases = (TestHierarchy, TestNameIndex)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from gdsii import elements, extents
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def make_aref(cols, rows, xy, angle=None):
+    aref = elements.ARef(b'CELL', cols, rows, xy)
+    aref.angle = angle
+    return aref
+
+class TestLattice(unittest.TestCase):
+    def setUp(self):
+        self.aref = make_aref(4, 3, [(10, 20), (50, 20), (10, 50)])
+        self.lattice = self.aref.lattice()
+
+    def test_origins(self):
+        lat = self.lattice
+        self.assertEqual(len(lat), 12)
+        self.assertEqual(lat.origin(0, 0), (10, 20))
+        self.assertEqual(lat.origin(3, 2), (40, 40))
+        self.assertEqual(list(lat.origins())[:5], [(0, 0, 10, 20), (1, 0, 20, 20),
+            (2, 0, 30, 20), (3, 0, 40, 20), (0, 1, 10, 30)])
+        self.assertRaises(IndexError, lat.origin, 4, 0)
+        self.assertRaises(IndexError, lat.origin, 0, -1)
+        lat = make_aref(3, 1, [(0, 0), (10, 0), (0, 1)]).lattice()
+        self.assertEqual(lat.origin(1, 0), (10 / 3.0, 0))
+
+    @unittest.skipIf(numpy is None, 'numpy is not available')
+    def test_origin_array(self):
+        lat = self.lattice
+        expected = [[x, y] for (col, row, x, y) in lat.origins()]
+        self.assertEqual(lat.origin_array().tolist(), expected)
+        self.assertEqual(lat.origin_array(1, 2).tolist(), expected[4:8])
+        self.assertEqual(lat.origin_array(2, 10).tolist(), expected[8:])
+
+    def test_bbox(self):
+        lat = self.lattice
+        self.assertEqual(lat.bbox(), (10, 20, 40, 40))
+        self.assertEqual(lat.bbox((0, 0, 5, 5)), (10, 20, 45, 45))
+        self.assertEqual(lat.bbox((0, 0, 5, 5)), extents.reference_bbox(self.aref, (0, 0, 5, 5)))
+        self.assertEqual(make_aref(0, 3, self.aref.xy).lattice().bbox(), None)
+
+    def test_query(self):
+        lat = self.lattice
+        self.assertEqual(list(lat.query(15, 25, 30, 40)), [(1, 1), (2, 1), (1, 2), (2, 2)])
+        self.assertEqual(lat.query_point(20, 30), [(1, 1)])
+        self.assertEqual(lat.query_point(21, 30), [])
+        self.assertEqual(lat.query_point(21, 30, (0, 0, 5, 5)), [(1, 1)])
+        self.assertEqual(lat.query_point(20, 30, (0, 0, 10, 10)),
+                [(0, 0), (1, 0), (0, 1), (1, 1)])
+        self.assertEqual(list(lat.query(100, 100, 200, 200)), [])
+        self.assertEqual(list(lat.query(30, 30, 20, 20)), [])
+
+    def test_huge(self):
+        aref = make_aref(100000, 100000, [(0, 0), (100000000, 0), (0, 200000000)])
+        lat = aref.lattice()
+        self.assertEqual(len(lat), 10 ** 10)
+        self.assertEqual(lat.bbox((0, 0, 500, 1000)), (0, 0, 99999500, 199999000))
+        self.assertEqual(lat.query_point(123456, 654321, (0, 0, 500, 1000)), [(123, 327)])
+        self.assertEqual(lat.origin(99999, 99999), (99999000, 199998000))
+
+    def test_random(self):
+        rnd = random.Random(5)
+        for i in range(200):
+            (x0, y0) = (rnd.randint(-100, 100), rnd.randint(-100, 100))
+            (cols, rows) = (rnd.randint(1, 6), rnd.randint(1, 6))
+            xy = [(x0, y0), (x0 + rnd.randint(-60, 60), y0 + rnd.randint(-60, 60)),
+                    (x0 + rnd.randint(-60, 60), y0 + rnd.randint(-60, 60))]
+            aref = make_aref(cols, rows, xy, rnd.choice((None, 90, 30)))
+            lat = aref.lattice()
+            box = rnd.choice((None, (0, 0, 7, 3), (-4, -2, 9, 5)))
+            extent = lat._extent(box)
+            xmin = rnd.randint(-150, 150)
+            ymin = rnd.randint(-150, 150)
+            (xmax, ymax) = (xmin + rnd.randint(0, 80), ymin + rnd.randint(0, 80))
+            expected = [(col, row) for (col, row, x, y) in lat.origins()
+                    if x + extent[0] <= xmax and x + extent[2] >= xmin and
+                        y + extent[1] <= ymax and y + extent[3] >= ymin]
+            self.assertEqual(list(lat.query(xmin, ymin, xmax, ymax, box)), expected)
+
+test_cases = (TestLattice,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,13 @@
 import unittest
-from gdsii import library, elements
-import os.path
+from gdsii import exceptions, library, elements, points, record, structure, tags
+from .util import FORGED_XY, TEST_FILE, make_boundary_library, make_library
+import io
+import os
+import tempfile
 
 class TestLibraryLoad(unittest.TestCase):
     def setUp(self):
-        file_name = os.path.join(os.path.dirname(__file__), 'data', 'test1.gds')
-        with open(file_name, 'rb') as stream:
+        with open(TEST_FILE, 'rb') as stream:
             self.library = library.Library.load(stream)
 
     def test_library(self):
@@ -47,7 +49,323 @@ class TestLibraryLoad(unittest.TestCase):
         self.assertEqual(elem.properties[0], (1, b'test property 1'))
         self.assertEqual(elem.properties[1], (2, b'test property 2'))
 
-test_cases = (TestLibraryLoad,)
+class TestLibraryLoadStream(TestLibraryLoad):
+    """Same tests for a stream that cannot be memory-mapped."""
+    def setUp(self):
+        with open(TEST_FILE, 'rb') as stream:
+            data = stream.read()
+        self.library = library.Library.load(io.BytesIO(data))
+
+class TestLibraryLoadXYArrays(TestLibraryLoad):
+    def setUp(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.library = library.Library.load(stream, xy_arrays=True)
+
+    def test_xy_type(self):
+        for elem in self.library[0]:
+            self.assertTrue(isinstance(elem.xy, points.PointArray))
+
+class TestLibraryLoadTrusted(TestLibraryLoad):
+    def setUp(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.library = library.Library.load(stream, validate=False)
+
+    def test_truncated(self):
+        with open(TEST_FILE, 'rb') as stream:
+            data = stream.read()
+        self.assertRaises(exceptions.EndOfFileError, library.Library.load,
+                io.BytesIO(data[:-20]), validate=False)
+
+class TestLibraryLoadFiltered(unittest.TestCase):
+    def load(self, **kwargs):
+        with open(TEST_FILE, 'rb') as stream:
+            data = stream.read()
+        result = []
+        for validate in (True, False):
+            lib = library.Library.load(io.BytesIO(data), validate=validate, **kwargs)
+            result.append([type(elem) for elem in lib[0]])
+            with open(TEST_FILE, 'rb') as stream:
+                lib = library.Library.load(stream, validate=validate, **kwargs)
+            result.append([type(elem) for elem in lib[0]])
+        for types in result[1:]:
+            self.assertEqual(types, result[0])
+        return lib
+
+    def test_layers(self):
+        lib = self.load(layers={(44, 0)})
+        self.assertEqual(len(lib[0]), 1)
+        self.assertEqual(lib[0][0].width, 15000)
+        self.assertEqual(len(lib[0][0].properties), 2)
+        self.assertEqual(len(self.load(layers={(34, 0), (44, 0)})[0]), 2)
+        self.assertEqual(len(self.load(layers={(34, 1)})[0]), 0)
+
+    def test_element_types(self):
+        lib = self.load(element_types={elements.Boundary})
+        self.assertEqual([type(elem) for elem in lib[0]], [elements.Boundary])
+        lib = self.load(element_types={elements.Path}, layers={(34, 0)})
+        self.assertEqual(len(lib[0]), 0)
+
+    def test_references(self):
+        lib = make_library()
+        struc = structure.Structure(b'TOP')
+        struc.append(elements.Text(1, 2, [(0, 0)], b'label'))
+        struc.append(elements.SRef(b'CELL', [(0, 0)]))
+        struc.append(elements.Box(1, 3, [(0, 0)] * 5))
+        lib.append(struc)
+        stream = io.BytesIO()
+        lib.save(stream)
+        stream.seek(0)
+        lib = library.Library.load(stream, layers={(1, 3)})
+        self.assertEqual([type(elem) for elem in lib[0]],
+                [elements.SRef, elements.Box])
+
+class TestLibrarySave(unittest.TestCase):
+    def setUp(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.data = stream.read()
+
+    def check_round_trip(self, **kwargs):
+        lib = library.Library.load(io.BytesIO(self.data), **kwargs)
+        stream = io.BytesIO()
+        lib.save(stream)
+        self.assertEqual(stream.getvalue(), self.data)
+
+    def test_round_trip(self):
+        self.check_round_trip()
+
+    def test_round_trip_xy_arrays(self):
+        self.check_round_trip(xy_arrays=True)
+
+    def test_round_trip_trusted(self):
+        self.check_round_trip(validate=False)
+
+    def test_strans_round_trip(self):
+        lib = make_library()
+        struc = structure.Structure(b'TOP')
+        for elem in (elements.SRef(b'A', [(1, 2)]),
+                elements.ARef(b'A', 2, 3, [(0, 0), (20, 0), (0, 30)]),
+                elements.Text(1, 0, [(5, 5)], b'text')):
+            elem.strans = 0x8000
+            elem.mag = 2.0
+            elem.angle = 90.0
+            struc.append(elem)
+        lib.append(struc)
+        stream = io.BytesIO()
+        lib.save(stream)
+        stream.seek(0)
+        loaded = library.Library.load(stream)
+        for elem in loaded[0]:
+            self.assertEqual((elem.strans, elem.mag, elem.angle), (0x8000, 2.0, 90.0))
+
+class TestElementCode(unittest.TestCase):
+    """Generated readers and writers must match generic implementation."""
+    def setUp(self):
+        sref = elements.SRef(b'cell', [(1, 2)])
+        sref.strans = 0x8000
+        sref.angle = 90.0
+        aref = elements.ARef(b'cell', 2, 3, [(0, 0), (20, 0), (0, 30)])
+        aref.strans = 0
+        aref.mag = 2.0
+        aref.properties = [(1, b'prop')]
+        text = elements.Text(5, 1, [(3, 4)], b'label')
+        text.presentation = 5
+        self.elements = [elements.Boundary(1, 2, [(0, 0), (1, 0), (0, 0)]),
+                elements.Path(3, 0, [(0, 0), (5, 5)]), sref, aref, text,
+                elements.Node(4, 0, [(1, 1)]),
+                elements.Box(6, 0, [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)])]
+        for elem in self.elements:
+            # loaded elements always have a list of properties
+            if elem.properties is None:
+                elem.properties = []
+
+    def save(self, save_func):
+        stream = io.BytesIO()
+        writer = record.RecordWriter(stream)
+        for elem in self.elements:
+            save_func(elem, writer)
+        writer.write(tags.ENDSTR)
+        writer.flush()
+        return stream.getvalue()
+
+    def test_save(self):
+        self.assertEqual(self.save(lambda elem, writer: elem._save(writer)),
+                self.save(elements._Base._save))
+
+    def check_read(self, validate=True, **kwargs):
+        gen = record.MappedReader(self.save(elements._Base._save), **kwargs)
+        gen.read_next()
+        for elem in self.elements:
+            loaded = elements._Base._load(gen, validate)
+            self.assertEqual(type(loaded), type(elem))
+            for attr in type(elem).__slots__:
+                self.assertEqual(getattr(loaded, attr, None), getattr(elem, attr, None))
+        self.assertEqual(gen.current.tag, tags.ENDSTR)
+
+    def test_read(self):
+        self.check_read()
+
+    def test_read_xy_arrays(self):
+        self.check_read(xy_arrays=True)
+
+    def test_read_trusted(self):
+        self.check_read(validate=False)
+
+    def test_missing_record(self):
+        data = self.save(elements._Base._save)
+        # remove LAYER record of the first element
+        data = data[:4] + data[10:]
+        gen = record.MappedReader(data)
+        gen.read_next()
+        self.assertRaises(exceptions.MissingRecord, elements._Base._load, gen)
+
+class TestLibraryOpenLazy(TestLibraryLoad):
+    def setUp(self):
+        self.library = library.Library.open_lazy(TEST_FILE)
+
+    def tearDown(self):
+        self.library.close()
+
+    def test_type(self):
+        self.assertTrue(isinstance(self.library, library.LazyLibrary))
+        self.assertEqual(self.library.structure_names(), [b'test_struc1'])
+
+class TestLazyLibrary(unittest.TestCase):
+    def setUp(self):
+        lib = make_library()
+        for i in range(5):
+            struc = structure.Structure(b'S%d' % i)
+            for j in range(i + 1):
+                struc.append(elements.Boundary(i, j, [(0, 0), (j, i), (0, 0)]))
+            lib.append(struc)
+        fd, self.path = tempfile.mkstemp(suffix='.gds')
+        with os.fdopen(fd, 'wb') as stream:
+            lib.save(stream)
+        self.library = library.Library.open_lazy(self.path)
+
+    def tearDown(self):
+        self.library.close()
+        os.remove(self.path)
+
+    def test_names(self):
+        self.assertEqual(self.library.structure_names(),
+                [b'S0', b'S1', b'S2', b'S3', b'S4'])
+        self.assertEqual(len(self.library._cache), 0)
+
+    def test_access(self):
+        lib = self.library
+        struc = lib[3]
+        self.assertEqual(struc.name, b'S3')
+        self.assertEqual(len(struc), 4)
+        self.assertEqual(struc[2].xy, [(0, 0), (2, 3), (0, 0)])
+        self.assertTrue(lib[3] is struc)
+        self.assertEqual([s.name for s in lib[1:3]], [b'S1', b'S2'])
+        self.assertEqual([s.name for s in reversed(lib)], [b'S4', b'S3', b'S2', b'S1', b'S0'])
+
+    def test_eviction(self):
+        lib = self.library
+        lib.cache_size = 0
+        first = lib[0]
+        self.assertTrue(lib[0] is first)
+        self.assertEqual([len(s) for s in lib], [1, 2, 3, 4, 5])
+        self.assertEqual(len(lib._cache), 1)
+        self.assertFalse(lib[0] is first)
+
+    def test_eviction_modified(self):
+        lib = self.library
+        lib.cache_size = 0
+        lib[1].append(elements.Box(1, 1, [(0, 0)] * 5))
+        lib[2].name = b'RENAMED'
+        for unused in lib:
+            pass
+        self.assertEqual(len(lib._cache), 1)
+        self.assertEqual((len(lib[1]), lib[2].name), (3, b'RENAMED'))
+        stream = io.BytesIO()
+        lib.save(stream)
+        stream.seek(0)
+        saved = library.Library.load(stream)
+        self.assertEqual([len(s) for s in saved], [1, 3, 3, 4, 5])
+        self.assertEqual(saved[2].name, b'RENAMED')
+
+    def test_replace(self):
+        lib = self.library
+        lib.cache_size = 0
+        struc = lib[1]
+        struc.append(elements.Box(1, 1, [(0, 0)] * 5))
+        lib[1] = struc
+        for unused in lib:
+            pass
+        self.assertTrue(lib[1] is struc)
+        self.assertEqual(len(lib[1]), 3)
+        self.assertEqual(lib.pop(0).name, b'S0')
+        self.assertEqual(len(lib), 4)
+
+    def test_forged_structure(self):
+        lib = make_boundary_library((b'S0', b'S1'), FORGED_XY)
+        fd, path = tempfile.mkstemp(suffix='.gds')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                lib.save(stream)
+            with library.Library.open_lazy(path) as lazy:
+                self.assertEqual(lazy.structure_names(), [b'S0', b'S1'])
+                self.assertEqual([len(struc[0].xy) for struc in lazy], [7, 7])
+        finally:
+            os.remove(path)
+
+    def test_closed(self):
+        lib = self.library
+        struc = lib[0]
+        lib.close()
+        self.assertRaises(ValueError, lib.__getitem__, 0)
+        self.assertRaises(ValueError, lib.save, io.BytesIO())
+
+    def check_save(self, lib, expected):
+        stream = io.BytesIO()
+        lib.save(stream)
+        self.assertEqual(stream.getvalue(), expected)
+        # real files are copied by the kernel
+        fd, path = tempfile.mkstemp(suffix='.gds')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(b'x')
+                lib.save(out)
+            with open(path, 'rb') as result:
+                self.assertEqual(result.read(), b'x' + expected)
+        finally:
+            os.remove(path)
+
+    def test_save_unchanged(self):
+        with open(self.path, 'rb') as stream:
+            data = stream.read()
+        lib = self.library
+        self.assertEqual(len(lib[1]), 2)
+        self.assertFalse(lib[1]._modified)
+        self.check_save(lib, data)
+        self.assertEqual(len(lib._cache), 1)
+        # re-encoded structures are the same
+        lib[3].reverse()
+        lib[3].reverse()
+        self.assertTrue(lib[3]._modified)
+        self.check_save(lib, data)
+
+    def test_save_changed(self):
+        with open(self.path, 'rb') as stream:
+            expected = library.Library.load(stream)
+        lib = self.library
+        for copy in (lib, expected):
+            copy[1].append(elements.Box(1, 1, [(0, 0)] * 5))
+            copy[2].name = b'RENAMED'
+            copy[3].mod_time = copy[3].mod_time.replace(year=2001)
+            copy[4][0].xy[1] = (5, 5)
+            copy[4].reindex()
+        lib.append(structure.Structure(b'NEW', expected[0].mod_time, expected[0].acc_time))
+        expected.append(structure.Structure(b'NEW', expected[0].mod_time, expected[0].acc_time))
+        stream = io.BytesIO()
+        expected.save(stream)
+        self.check_save(lib, stream.getvalue())
+
+test_cases = (TestLibraryLoad, TestLibraryLoadStream, TestLibraryLoadXYArrays,
+        TestLibraryLoadTrusted, TestLibraryLoadFiltered, TestLibraryOpenLazy, TestLazyLibrary,
+        TestLibrarySave, TestElementCode)
 
 def load_tests(loader, tests, pattern):
     suite = unittest.TestSuite()
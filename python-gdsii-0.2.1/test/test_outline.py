@@ -0,0 +1,126 @@
+import unittest
+from gdsii import elements, points, structure
+from .util import make_library
+import io
+import math
+
+try:
+    import numpy
+    from gdsii import geometry, outline
+except ImportError:
+    numpy = None
+
+def make_path(xy, width, path_type=None, bgn_extn=None, end_extn=None):
+    path = elements.Path(3, 7, xy)
+    path.width = width
+    path.path_type = path_type
+    path.bgn_extn = bgn_extn
+    path.end_extn = end_extn
+    return path
+
+@unittest.skipIf(numpy is None, 'numpy is not available')
+class TestOutline(unittest.TestCase):
+    def outlines(self, paths, **kwargs):
+        (coords, offsets) = outline.outline(paths, **kwargs)
+        return [coords[begin:end].tolist() for (begin, end) in zip(offsets, offsets[1:])]
+
+    def test_ends(self):
+        paths = [make_path([(0, 0), (10, 0)], 4), make_path([(0, 0), (10, 0)], 4, 2),
+                make_path([(0, 0), (10, 0)], 4, 4, 1, 3), make_path([(0, 0), (0, 10)], -4, 4)]
+        self.assertEqual(self.outlines(paths), [
+            [[0, -2], [10, -2], [10, 2], [0, 2]],
+            [[-2, -2], [12, -2], [12, 2], [-2, 2]],
+            [[-1, -2], [13, -2], [13, 2], [-1, 2]],
+            [[2, 0], [2, 10], [-2, 10], [-2, 0]]])
+
+    def test_round_ends(self):
+        (outlines,) = self.outlines([make_path([(0, 0), (10, 0)], 2, 1)], arc_points=1)
+        self.assertEqual(numpy.round(outlines, 9).tolist(),
+                [[0, -1], [10, -1], [11, 0], [10, 1], [0, 1], [-1, 0]])
+        path = make_path([(0, 0), (10, 0)], 2000, 1)
+        area = geometry.measure(outline.boundaries([path], arc_points=64)[0]).area[0]
+        self.assertAlmostEqual(area / (20000 + math.pi * 1000000), 1, 3)
+
+    def test_miter(self):
+        path = make_path([(0, 0), (10, 0), (10, 10)], 2)
+        self.assertEqual(self.outlines([path]),
+                [[[0, -1], [11, -1], [11, 10], [9, 10], [9, 1], [0, 1]]])
+        # the miter of this bend is 2.6 times longer than the half width
+        path = make_path([(0, 0), (10, 0), (0, 5)], 2)
+        (outlines,) = self.outlines([path])
+        self.assertEqual(len(outlines), 6)
+        (outlines,) = self.outlines([path], miter_limit=2)
+        self.assertEqual(len(outlines), 8)
+        (outlines,) = self.outlines([make_path([(0, 0), (10, 0), (0, 0)], 2)])
+        self.assertEqual(outlines[:4], [[0, -1], [10, -1], [10, 1], [0, 1]])
+
+    def test_degenerate(self):
+        paths = [make_path([(0, 0), (0, 0)], 2), make_path([(5, 5)], 2),
+                make_path(points.PointArray([(0, 0), (10, 0), (10, 0), (10, 0)]), 2)]
+        outlines = self.outlines(paths)
+        self.assertEqual(outlines[:2], [[], []])
+        self.assertEqual(outlines[2], [[0, -1], [10, -1], [10, 1], [0, 1]])
+        self.assertEqual(self.outlines([]), [])
+
+    def test_boundaries(self):
+        path = make_path([(0, 0), (10, 0), (10, 10)], 4, 2)
+        path.properties = [(1, b'net')]
+        ([boundary], empty) = outline.boundaries([path, make_path([(0, 0)], 4)])
+        self.assertEqual(empty, [])
+        self.assertEqual((boundary.layer, boundary.data_type, boundary.properties),
+                (3, 7, [(1, b'net')]))
+        self.assertEqual(list(boundary.xy), [(-2, -2), (12, -2), (12, 12), (8, 12), (8, 2),
+            (-2, 2), (-2, -2)])
+        self.assertEqual(geometry.measure([boundary]).orientation.tolist(), [1])
+
+    def test_split(self):
+        path = make_path([(i * 10, 0) for i in range(10)], 2, 1)
+        pieces = outline.boundaries([path], arc_points=1, max_points=15)[0]
+        self.assertEqual([list(piece.xy) for piece in pieces], [
+            [(0, -1), (10, -1), (20, -1), (30, -1), (40, -1), (50, -1), (50, 1), (40, 1),
+                (30, 1), (20, 1), (10, 1), (0, 1), (-1, 0), (0, -1)],
+            [(50, -1), (60, -1), (70, -1), (80, -1), (90, -1), (91, 0), (90, 1), (80, 1),
+                (70, 1), (60, 1), (50, 1), (50, -1)]])
+        self.assertRaises(ValueError, outline.boundaries, [path], 1, None, 6)
+
+    def test_long_path(self):
+        struc = structure.Structure(b'S')
+        path = make_path([(i * 10, (i % 2) * 10) for i in range(5000)], 4)
+        struc.append(path)
+        (outlines, offsets) = outline.outline([path])
+        self.assertEqual(len(outlines), 10000)
+        self.assertEqual(outline.replace_paths(struc), 1)
+        self.assertEqual(len(struc), 2)
+        self.assertTrue(all(len(elem.xy) <= 8191 for elem in struc))
+        self.assertEqual(struc.bbox(), tuple(numpy.rint(numpy.concatenate((outlines.min(axis=0),
+            outlines.max(axis=0)))).astype(int).tolist()))
+        lib = make_library()
+        lib.append(struc)
+        lib.save(io.BytesIO())
+
+    def test_replace_paths(self):
+        struc = structure.Structure(b'S')
+        struc.append(elements.Boundary(1, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]))
+        struc.append(make_path([(0, 0), (10, 0)], 2))
+        struc.append(make_path([(0, 0), (10, 0)], 2, 1))
+        struc.append(make_path([(0, 0)], 2))
+        bbox = struc.bbox()
+        self.assertEqual(outline.replace_paths(struc, path_types={0, 2, 4}), 1)
+        self.assertEqual([type(elem) for elem in struc], [elements.Boundary, elements.Boundary,
+            elements.Path, elements.Path])
+        self.assertEqual(outline.replace_paths(struc), 1)
+        self.assertTrue(isinstance(struc[2], elements.Boundary))
+        self.assertEqual(struc.bbox(), bbox)
+        self.assertEqual(outline.replace_paths(struc), 0)
+
+test_cases = (TestOutline,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
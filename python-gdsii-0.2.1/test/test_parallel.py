@@ -0,0 +1,76 @@
+import unittest
+from gdsii import elements, library, parallel, points, structure
+from .util import FORGED_XY, TEST_FILE, make_boundary_library, make_library, save_to_bytes
+import os
+import tempfile
+
+class TestParallelLoad(unittest.TestCase):
+    def setUp(self):
+        lib = make_library()
+        for i in range(10):
+            struc = structure.Structure(b'S%d' % i)
+            struc.append(elements.Boundary(i, 0, [(0, 0), (i, i), (0, 0)]))
+            path = elements.Path(1, 2, [(0, 0), (10, i)])
+            path.width = 5
+            path.properties = [(1, b'value')]
+            struc.append(path)
+            sref = elements.SRef(b'S0', [(i, 0)])
+            sref.strans = 0x8000
+            sref.angle = 90.0
+            struc.append(sref)
+            struc.append(elements.ARef(b'S0', 2, 3, [(0, 0), (2, 0), (0, 3)]))
+            struc.append(elements.Text(4, 0, [(1, 1)], b'label %d' % i))
+            struc.append(elements.Node(5, 0, [(0, 0), (1, 1)]))
+            struc.append(elements.Box(6, 0, [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]))
+            lib.append(struc)
+        self.data = save_to_bytes(lib)
+        fd, self.path = tempfile.mkstemp(suffix='.gds')
+        with os.fdopen(fd, 'wb') as stream:
+            stream.write(self.data)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_load(self):
+        lib = library.Library.load_parallel(self.path, workers=2)
+        self.assertEqual([struc.name for struc in lib], [b'S%d' % i for i in range(10)])
+        self.assertEqual(lib[3][0].xy, [(0, 0), (3, 3), (0, 0)])
+        self.assertEqual(save_to_bytes(lib), self.data)
+
+    def test_xy_arrays(self):
+        lib = parallel.load_library(self.path, workers=2, xy_arrays=True)
+        self.assertTrue(isinstance(lib[3][0].xy, points.PointArray))
+        self.assertEqual(save_to_bytes(lib), self.data)
+
+    def test_split(self):
+        ranges = [(i * 10, i * 10 + 10, b'') for i in range(10)]
+        for count in (1, 3, 10, 20):
+            chunks = parallel._split(ranges, count)
+            self.assertTrue(len(chunks) <= count)
+            self.assertEqual(sum(chunks, []), ranges)
+
+    def test_forged_structure(self):
+        data = save_to_bytes(make_boundary_library((b'S0', b'S1', b'S2'), FORGED_XY))
+        with open(self.path, 'wb') as stream:
+            stream.write(data)
+        for exact in (True, False):
+            lib = parallel.load_library(self.path, workers=2, exact=exact)
+            self.assertEqual([struc.name for struc in lib], [b'S0', b'S1', b'S2'])
+            self.assertEqual(save_to_bytes(lib), data)
+
+    def test_single_structure(self):
+        lib = library.Library.load_parallel(TEST_FILE, workers=2)
+        with open(TEST_FILE, 'rb') as stream:
+            self.assertEqual(save_to_bytes(lib), stream.read())
+
+test_cases = (TestParallelLoad,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
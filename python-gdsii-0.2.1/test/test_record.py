@@ -1,6 +1,12 @@
 import unittest
 from gdsii.record import _parse_real8, _pack_real8, _int_to_real, _real_to_int
-from gdsii import exceptions
+from gdsii.record import Record, LazyRecord, Reader, MappedReader, RecordWriter, scan_headers
+from gdsii.record import scan_structures
+from gdsii import exceptions, record, structure, tags
+from .util import FORGED_XY, TEST_FILE, make_boundary_library, save_to_bytes
+import io
+import os.path
+import random
 import struct
 
 class TestReal8(unittest.TestCase):
@@ -52,8 +58,270 @@ class TestReal8(unittest.TestCase):
     def test_exceptions(self):
         for i in range(8):
             self.assertRaises(exceptions.IncorrectDataSize, _parse_real8, b' '*i)
+        for value in (1e300, float('inf'), float('nan')):
+            self.assertRaises(exceptions.FormatError, _real_to_int, value)
 
-test_cases = (TestReal8,)
+    def test_limits(self):
+        limits = {
+            0x0080000000000000: 0.5 * 16.0**-64,
+            0x0010000000000000: 2.0**-260,
+            0xfffffffffffffff8: -(1 - 2.0**-53) * 16.0**63,
+            0xc01999999999999a: -0.1
+        }
+        for int_val, real_val in limits.items():
+            self.assertEqual(_real_to_int(real_val), int_val)
+            self.assertEqual(_int_to_real(int_val), real_val)
+        for real_val in (0.0, -0.0, 5e-324):
+            self.assertEqual(_real_to_int(real_val), 0)
+        self.assertEqual(str(_int_to_real(0x8000000000000000)), '0.0')
+
+@unittest.skipIf(record.numpy is None, 'numpy is not available')
+class TestReal8Batch(unittest.TestCase):
+    """Batched conversion must give the same bits as scalar one."""
+    def setUp(self):
+        rnd = random.Random(42)
+        self.ints = [rnd.getrandbits(64) for i in range(2000)] + \
+                list(TestReal8.data.keys()) + [0x8000000000000000, 0xff00000000000000]
+        self.reals = [rnd.uniform(-1e6, 1e6) for i in range(1000)] + \
+                [rnd.choice((-1, 1)) * 10**rnd.uniform(-70, 70) for i in range(1000)] + \
+                list(TestReal8.data.values()) + [-0.0, 1e-9]
+
+    def scalar(self, func, *args):
+        saved = record.numpy
+        record.numpy = None
+        try:
+            return func(*args)
+        finally:
+            record.numpy = saved
+
+    def test_parse(self):
+        packed = struct.pack('>{0}Q'.format(len(self.ints)), *self.ints)
+        batch = _parse_real8(packed)
+        scalar = self.scalar(_parse_real8, packed)
+        self.assertEqual(struct.pack('>{0}d'.format(len(batch)), *batch),
+                struct.pack('>{0}d'.format(len(scalar)), *scalar))
+
+    def test_pack(self):
+        self.assertEqual(_pack_real8(self.reals), self.scalar(_pack_real8, self.reals))
+
+    def test_pack_fallback(self):
+        # values that cannot be converted in batch are handled by scalar code
+        self.assertRaises(exceptions.FormatError, _pack_real8, [1e300] * 100)
+        self.assertEqual(_pack_real8([0.0] * 100), b'\0' * 800)
+
+class TestMappedReader(unittest.TestCase):
+    def setUp(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.expected = [(rec.tag, rec.data) for rec in Record.iterate(stream)]
+
+    def test_iterate_mapped(self):
+        with open(TEST_FILE, 'rb') as stream:
+            recs = [(rec.tag, rec.data) for rec in Record.iterate_mapped(stream)]
+            self.assertEqual(stream.tell(), os.path.getsize(TEST_FILE))
+        self.assertEqual(recs, self.expected)
+
+    def test_iterate_mapped_fallback(self):
+        with open(TEST_FILE, 'rb') as stream:
+            stream = io.BytesIO(stream.read())
+        recs = [(rec.tag, rec.data) for rec in Record.iterate_mapped(stream)]
+        self.assertEqual(recs, self.expected)
+
+    def test_truncated(self):
+        with open(TEST_FILE, 'rb') as stream:
+            data = stream.read()
+        gen = MappedReader(data[:-1])
+        self.assertRaises(exceptions.EndOfFileError,
+                lambda: [gen.read_next() for i in range(len(self.expected))])
+        gen = MappedReader(data)
+        for i in range(len(self.expected)):
+            gen.read_next()
+        self.assertEqual(gen.current.tag, tags.ENDLIB)
+        self.assertRaises(exceptions.EndOfFileError, gen.read_next)
+
+    def test_skip_until(self):
+        with open(TEST_FILE, 'rb') as stream:
+            data = stream.read()
+        expected = [tag for (tag, unused_data) in self.expected]
+        after = expected[expected.index(tags.ENDEL) + 1]
+        for gen in (MappedReader(data), Reader(io.BytesIO(data))):
+            gen.skip_until(tags.ENDEL)
+            self.assertEqual(gen.read_next().tag, after)
+            gen.skip_until(tags.ENDLIB)
+            self.assertRaises(exceptions.EndOfFileError, gen.skip_until, tags.ENDEL)
+
+class TestLazyRecord(unittest.TestCase):
+    def setUp(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.data = stream.read()
+        self.expected = [(rec.tag, rec.data) for rec in Record.iterate(io.BytesIO(self.data))]
+
+    def check_records(self, records):
+        tags_only = []
+        for rec in records:
+            self.assertTrue(isinstance(rec, LazyRecord))
+            self.assertTrue(rec.payload is not None)
+            tags_only.append(rec)
+        self.assertEqual([rec.tag for rec in tags_only], [tag for (tag, data) in self.expected])
+        self.assertEqual([(rec.tag, rec.data) for rec in tags_only], self.expected)
+        for rec in tags_only:
+            self.assertTrue(rec.payload is None)
+
+    def test_iterate(self):
+        self.check_records(Record.iterate(io.BytesIO(self.data), lazy=True))
+
+    def test_iterate_mapped(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.check_records(Record.iterate_mapped(stream, lazy=True))
+
+    def test_point_array(self):
+        rec = LazyRecord(tags.XY, struct.pack('>4l', 1, -2, 3, 4))
+        self.assertEqual(rec.point_array, [(1, -2), (3, 4)])
+        self.assertTrue(rec.payload is not None)
+        self.assertEqual(rec.points, [(1, -2), (3, 4)])
+        self.assertEqual(rec.point_array, [(1, -2), (3, 4)])
+        rec = LazyRecord(tags.XY, struct.pack('>3l', 1, 2, 3))
+        self.assertRaises(exceptions.DataSizeError, lambda: rec.point_array)
+
+class TestRecordWriter(unittest.TestCase):
+    def setUp(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.data = stream.read()
+        self.records = list(Record.iterate(io.BytesIO(self.data)))
+
+    def test_same_as_save(self):
+        stream = io.BytesIO()
+        writer = RecordWriter(stream)
+        for rec in self.records:
+            writer.write_record(rec)
+        writer.flush()
+        self.assertEqual(stream.getvalue(), self.data)
+
+    def test_chunks(self):
+        # write more data than fits into the buffer
+        stream = io.BytesIO()
+        writer = RecordWriter(stream)
+        count = 0
+        while stream.tell() == 0:
+            for rec in self.records:
+                writer.write_record(rec)
+            count += 1
+        writer.write_raw(self.data * 1000)
+        writer.flush()
+        self.assertEqual(stream.getvalue(), self.data * (count + 1000))
+
+    def test_bitarray(self):
+        stream = io.BytesIO()
+        writer = RecordWriter(stream)
+        writer.write(tags.STRANS, 0x8000)
+        writer.flush()
+        self.assertEqual(stream.getvalue(), b'\x00\x06\x1a\x01\x80\x00')
+        stream.seek(0)
+        rec = Record.read(stream)
+        self.assertEqual((rec.tag, rec.data), (tags.STRANS, 0x8000))
+
+    def test_too_big(self):
+        writer = RecordWriter(io.BytesIO())
+        self.assertRaises(exceptions.FormatError, writer.write, tags.XY, [0] * 0x4000)
+
+class TestScanHeaders(unittest.TestCase):
+    def setUp(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.data = stream.read()
+        self.expected = []
+        stream = io.BytesIO(self.data)
+        for rec in Record.iterate(stream):
+            self.expected.append(rec.tag)
+
+    def check_index(self, index):
+        self.assertEqual(list(index.tags), self.expected)
+        self.assertEqual(index.offsets[0], 0)
+        for i in range(1, len(index)):
+            self.assertEqual(index.offsets[i], index.offsets[i-1] + index.sizes[i-1])
+        self.assertEqual(index.count(tags.BOUNDARY), 1)
+        self.assertEqual(index.counts()[tags.PATH], 1)
+        structures = index.structures()
+        self.assertEqual(len(structures), 1)
+        (begin, end) = structures[0]
+        self.assertEqual(index.tags[begin], tags.BGNSTR)
+        self.assertEqual(index.tags[end], tags.ENDSTR)
+        start, stop = index.byte_range(begin, end)
+        gen = MappedReader(self.data[start:stop])
+        self.assertEqual(gen.read_next().tag, tags.BGNSTR)
+        self.assertEqual(gen.read_next().data, b'test_struc1')
+
+    def test_mapped(self):
+        with open(TEST_FILE, 'rb') as stream:
+            self.check_index(scan_headers(stream))
+            self.assertEqual(stream.tell(), len(self.data))
+
+    def test_stream(self):
+        saved = record._SCAN_CHUNK_SIZE
+        try:
+            for chunk_size in (5, 64, saved):
+                record._SCAN_CHUNK_SIZE = chunk_size
+                stream = io.BytesIO(self.data)
+                self.check_index(scan_headers(stream))
+                self.assertEqual(stream.tell(), len(self.data))
+        finally:
+            record._SCAN_CHUNK_SIZE = saved
+
+    def test_truncated(self):
+        for size in (len(self.data) - 2, len(self.data) // 2):
+            self.assertRaises(exceptions.EndOfFileError, scan_headers,
+                    io.BytesIO(self.data[:size]))
+
+def make_data(xy=((0, 0), (0, 0), (0, 0))):
+    """Return data of a library with three structures."""
+    return save_to_bytes(make_boundary_library((b'A', b'BB', b'CCC'), list(xy)))
+
+class TestScanStructures(unittest.TestCase):
+    def setUp(self):
+        self.data = make_data()
+
+    def check_ranges(self, ranges):
+        self.assertEqual([name for (begin, end, name) in ranges], [b'A', b'BB', b'CCC'])
+        for (begin, end, name) in ranges:
+            gen = MappedReader(self.data, begin)
+            gen.read_next()
+            self.assertEqual(structure.Structure._load(gen).name, name)
+            self.assertEqual(gen.offset, end)
+
+    def test_scan(self):
+        self.check_ranges(scan_structures(self.data))
+
+    def test_fast(self):
+        self.check_ranges(scan_structures(self.data, exact=False))
+
+    def test_memoryview(self):
+        for exact in (False, True):
+            self.check_ranges(scan_structures(memoryview(self.data), exact=exact))
+
+    def test_empty(self):
+        with open(TEST_FILE, 'rb') as stream:
+            data = stream.read()
+        # remove the only structure
+        (begin, end, name), = scan_structures(data)
+        self.assertEqual(scan_structures(data[:begin] + data[end:]), [])
+
+    def test_pattern_in_data(self):
+        # coordinates that look like ENDSTR and BGNSTR records,
+        # detected because STRNAME does not follow
+        self.data = make_data(((0, 0), (0x00040700, 0x001c0502), (0, 0)))
+        self.check_ranges(scan_structures(self.data, exact=False))
+
+    def test_forged_structure(self):
+        self.data = make_data(FORGED_XY)
+        self.check_ranges(scan_structures(self.data))
+        # the fast search is misled
+        self.assertEqual(len(scan_structures(self.data, exact=False)), 6)
+
+    def test_truncated(self):
+        for exact in (False, True):
+            self.assertRaises(exceptions.EndOfFileError, scan_structures,
+                    self.data[:-10], exact=exact)
+
+test_cases = (TestReal8, TestReal8Batch, TestMappedReader, TestLazyRecord, TestRecordWriter,
+        TestScanHeaders, TestScanStructures)
 
 def load_tests(loader, tests, pattern):
     suite = unittest.TestSuite()
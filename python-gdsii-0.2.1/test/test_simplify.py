@@ -0,0 +1,143 @@
+import unittest
+from gdsii import elements, library, points, structure
+from .util import make_library
+import io
+import math
+import os
+import random
+import tempfile
+
+try:
+    import numpy
+    from gdsii import simplify
+except ImportError:
+    numpy = None
+
+def segment_distance(pt, start, end):
+    (dx, dy) = (end[0] - start[0], end[1] - start[1])
+    length = dx * dx + dy * dy
+    t = 0 if not length else max(0, min(1, ((pt[0] - start[0]) * dx +
+        (pt[1] - start[1]) * dy) / float(length)))
+    return math.hypot(pt[0] - start[0] - t * dx, pt[1] - start[1] - t * dy)
+
+def polyline_distance(pt, xy):
+    return min(segment_distance(pt, start, end) for (start, end) in zip(xy, xy[1:]))
+
+@unittest.skipIf(numpy is None, 'numpy is not available')
+class TestSimplify(unittest.TestCase):
+    def test_redundant(self):
+        boundary = elements.Boundary(1, 0, [(0, 0), (5, 0), (10, 0), (10, 0), (10, 5),
+            (10, 10), (0, 10), (0, 5), (0, 0)])
+        path = elements.Path(2, 0, points.PointArray([(0, 0), (0, 0), (5, 0), (10, 0),
+            (10, 1), (10, 10), (5, 10)]))
+        # tip of a spike and a diagonal run
+        spike = elements.Boundary(1, 0, [(0, 0), (10, 0), (20, 0), (10, 0), (10, 10),
+            (1, 1), (0, 0)])
+        text = elements.Text(1, 0, [(0, 0)], b'text')
+        report = simplify.Report()
+        result = list(simplify.simplify([boundary, text, path, spike], report=report))
+        self.assertEqual(result, [boundary, text, path, spike])
+        self.assertEqual(boundary.xy, [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)])
+        self.assertTrue(isinstance(path.xy, points.PointArray))
+        self.assertEqual(path.xy, [(0, 0), (10, 0), (10, 10), (5, 10)])
+        self.assertEqual(spike.xy, [(0, 0), (20, 0), (10, 0), (10, 10), (0, 0)])
+        self.assertEqual((report.elements, report.vertices, report.total), (3, 9, 23))
+
+    def test_minimal(self):
+        triangle = [(0, 0), (10, 0), (0, 10), (0, 0)]
+        boundary = elements.Boundary(1, 0, list(triangle))
+        path = elements.Path(1, 0, [(0, 0), (0, 0)])
+        list(simplify.simplify([boundary, path], tolerance=100))
+        self.assertEqual(boundary.xy, triangle)
+        self.assertEqual(path.xy, [(0, 0), (0, 0)])
+        # collinear polygon keeps three points
+        boundary = elements.Boundary(1, 0, [(0, 0), (1, 0), (2, 0), (3, 0), (4, 0), (0, 0)])
+        list(simplify.simplify([boundary]))
+        self.assertEqual(len(boundary.xy), 4)
+        self.assertEqual(list(simplify.simplify([])), [])
+
+    def test_distinct(self):
+        boundary = elements.Boundary(1, 0, [(1, 0), (1, 0), (2, 0), (7, 0), (6, 0), (5, 0),
+            (6, 1), (6, 4), (11, 5), (10, 5), (12, 5), (1, 0)])
+        list(simplify.simplify([boundary], tolerance=10))
+        self.assertEqual(len(set(boundary.xy)), 3)
+        self.assertEqual(len(boundary.xy), 4)
+        rnd = random.Random(5)
+        elems = []
+        for i in range(300):
+            xy = [(rnd.randint(0, 3), rnd.randint(0, 3)) for j in range(rnd.randint(3, 12))]
+            elems.append(elements.Boundary(1, 0, xy + xy[:1]))
+        originals = [list(elem.xy) for elem in elems]
+        list(simplify.simplify(elems, tolerance=10))
+        for (elem, xy) in zip(elems, originals):
+            self.assertEqual(elem.xy[-1], elem.xy[0])
+            self.assertTrue(len(set(elem.xy)) >= min(3, len(set(xy))))
+
+    def test_tolerance(self):
+        rnd = random.Random(3)
+        elems = []
+        for i in range(100):
+            xy = [(0, 0)]
+            for j in range(rnd.randint(1, 30)):
+                xy.append((xy[-1][0] + rnd.randint(1, 10), rnd.randint(-3, 3)))
+            elems.append(elements.Path(1, 0, xy))
+        originals = [list(elem.xy) for elem in elems]
+        report = simplify.Report()
+        list(simplify.simplify(elems, tolerance=2.5, report=report))
+        self.assertTrue(report.vertices > 0)
+        for (elem, xy) in zip(elems, originals):
+            self.assertEqual((elem.xy[0], elem.xy[-1]), (xy[0], xy[-1]))
+            self.assertTrue(set(elem.xy) <= set(xy))
+            for pt in xy:
+                self.assertTrue(polyline_distance(pt, elem.xy) <= 2.5)
+
+    def test_library(self):
+        lib = make_library()
+        struc = structure.Structure(b'S')
+        struc.append(elements.Boundary(1, 0, [(0, 0), (5, 0), (10, 0), (10, 10), (0, 10),
+            (0, 0)]))
+        struc.append(elements.Boundary(1, 0, [(0, 0), (1, 0), (1, 1), (0, 0)]))
+        lib.append(struc)
+        lib.append(structure.Structure(b'EMPTY'))
+        self.assertEqual(struc.bbox(), (0, 0, 10, 10))
+        report = simplify.simplify_library(lib, tolerance=0)
+        self.assertEqual((report.elements, report.vertices, report.total), (1, 1, 10))
+        self.assertEqual(len(struc[0].xy), 5)
+        self.assertEqual(struc.bbox(), (0, 0, 10, 10))
+        self.assertEqual(repr(report), '<Report: 1 of 10 vertices removed from 1 elements>')
+
+    def test_lazy_library(self):
+        lib = make_library()
+        for name in (b'A', b'B', b'C'):
+            struc = structure.Structure(name)
+            struc.append(elements.Boundary(1, 0, [(0, 0), (5, 0), (10, 0), (10, 10),
+                (0, 10), (0, 0)]))
+            struc.append(elements.Path(1, 0, [(0, 0), (0, 3)]))
+            lib.append(struc)
+        fd, path = tempfile.mkstemp(suffix='.gds')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                lib.save(stream)
+            with library.Library.open_lazy(path, cache_size=0) as lazy:
+                report = simplify.simplify_library(lazy)
+                self.assertEqual((report.elements, report.vertices), (3, 3))
+                stream = io.BytesIO()
+                lazy.save(stream)
+        finally:
+            os.remove(path)
+        stream.seek(0)
+        saved = library.Library.load(stream)
+        self.assertEqual([[len(elem.xy) for elem in struc] for struc in saved],
+                [[5, 2]] * 3)
+
+test_cases = (TestSimplify,)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
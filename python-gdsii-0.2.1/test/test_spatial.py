@@ -0,0 +1,116 @@
+import unittest
+from gdsii import elements, spatial, structure
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def brute_force(boxes, xmin, ymin, xmax, ymax):
+    return sorted(i for (i, (x0, y0, x1, y1)) in enumerate(boxes)
+            if x0 <= xmax and x1 >= xmin and y0 <= ymax and y1 >= ymin)
+
+def make_structure():
+    struc = structure.Structure(b'S')
+    struc.append(elements.Boundary(1, 0, [(0, 0), (10, 0), (10, 20), (0, 0)]))
+    struc.append(elements.SRef(b'OTHER', [(0, 0)]))
+    path = elements.Path(1, 0, [(100, 0), (200, 0)])
+    path.width = 10
+    path.path_type = 2
+    struc.append(path)
+    struc.append(elements.Text(2, 0, [(50, 50)], b'text'))
+    struc.append(elements.Box(3, 1, [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]))
+    return struc
+
+@unittest.skipIf(numpy is None, 'numpy is not available')
+class TestSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(1)
+        self.boxes = []
+        for i in range(3000):
+            (x, y) = (rnd.randint(-10000, 10000), rnd.randint(-10000, 10000))
+            self.boxes.append((x, y, x + rnd.randint(0, 500), y + rnd.randint(0, 500)))
+        self.windows = [(-10000, -10000, 10000, 10000), (0, 0, 0, 0), (20000, 0, 30000, 1)]
+        for i in range(50):
+            (x, y) = (rnd.randint(-10000, 10000), rnd.randint(-10000, 10000))
+            self.windows.append((x, y, x + rnd.randint(0, 2000), y + rnd.randint(0, 2000)))
+
+    def check(self, index):
+        for window in self.windows:
+            self.assertEqual(sorted(index.query(*window).tolist()),
+                    brute_force(self.boxes, *window))
+        (x, y) = self.boxes[7][:2]
+        self.assertTrue(7 in index.query_point(x, y).tolist())
+
+    def test_bulk(self):
+        index = spatial.SpatialIndex(self.boxes)
+        self.assertEqual(len(index), len(self.boxes))
+        self.check(index)
+
+    def test_insert(self):
+        index = spatial.SpatialIndex(self.boxes[:100])
+        for (i, box) in enumerate(self.boxes[100:2000], 100):
+            index.insert(box, i)
+        index.extend(self.boxes[2000:], range(2000, len(self.boxes)))
+        self.assertEqual(len(index), len(self.boxes))
+        self.check(index)
+
+    def test_empty(self):
+        index = spatial.SpatialIndex()
+        self.assertEqual(index.query(0, 0, 1, 1).tolist(), [])
+        index.insert((0, 0, 1, 1), 5)
+        self.assertEqual(index.query_point(1, 1).tolist(), [5])
+
+@unittest.skipIf(numpy is None, 'numpy is not available')
+class TestStructureIndex(unittest.TestCase):
+    def setUp(self):
+        self.structure = make_structure()
+
+    def test_query(self):
+        struc = self.structure
+        index = struc.spatial_index()
+        self.assertEqual(sorted(index), [(1, 0), (2, 0), (3, 1)])
+        self.assertEqual(index.query(-100, -100, 1000, 1000),
+                [struc[0], struc[2], struc[3], struc[4]])
+        self.assertEqual(index.query(0, 0, 1, 1, layers=[(1, 0), (7, 7)]), [struc[0]])
+        # half of the width plus square end extension
+        self.assertEqual(index.query_point(90, 10), [struc[2]])
+        self.assertEqual(index.query_point(89, 5), [])
+        self.assertEqual(index.query_indices(50, 50, 50, 50).tolist(), [3])
+
+    def test_miter(self):
+        path = elements.Path(5, 0, [(0, 0), (1000, 0), (0, 100)])
+        path.width = 100
+        struc = structure.Structure(b'S')
+        struc.append(path)
+        self.assertEqual(struc.spatial_index().query_point(2000, 100), [path])
+
+    def test_update(self):
+        struc = self.structure
+        index = struc.spatial_index()
+        struc.append(elements.Boundary(1, 0, [(500, 500), (510, 500), (510, 510), (500, 500)]))
+        struc.extend([elements.Node(9, 9, [(505, 505)])])
+        self.assertTrue(struc.spatial_index() is index)
+        self.assertEqual(index.query_indices(505, 505, 505, 505).tolist(), [5, 6])
+        del struc[0]
+        self.assertEqual(struc.spatial_index().query_indices(505, 505, 505, 505).tolist(),
+                [4, 5])
+        struc.reverse()
+        self.assertEqual(struc.spatial_index().query_indices(505, 505, 505, 505).tolist(),
+                [0, 1])
+        struc[0].xy = [(0, 0), (1, 0), (1, 1), (0, 0)]
+        struc.reindex()
+        self.assertEqual(struc.spatial_index().query_point(505, 505), [struc[1]])
+
+test_cases = (TestSpatialIndex, TestStructureIndex)
+
+def load_tests(loader, tests, pattern):
+    suite = unittest.TestSuite()
+    for test_class in test_cases:
+        tests = loader.loadTestsFromTestCase(test_class)
+        suite.addTests(tests)
+    return suite
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Helpers shared by the tests."""
+from gdsii import elements, library, structure
+import io
+import os.path
+
+TEST_FILE = os.path.join(os.path.dirname(__file__), 'data', 'test1.gds')
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'sample')
+
+# points of a boundary with ENDSTR, BGNSTR and STRNAME b'AB' records
+# inside its coordinates
+FORGED_XY = [(0, 0), (0x00040700, 0x001c0502), (0, 0), (0, 0), (0, 0),
+        (0x00080606, 0x41420000), (0, 0)]
+
+def save_to_bytes(lib):
+    stream = io.BytesIO()
+    lib.save(stream)
+    return stream.getvalue()
+
+def make_structure(name, elems=()):
+    struc = structure.Structure(name)
+    for elem in elems:
+        struc.append(elem)
+    return struc
+
+def make_library(strucs=()):
+    lib = library.Library(5, b'LIB', 1e-9, 1e-3)
+    for struc in strucs:
+        lib.append(struc)
+    return lib
+
+def make_boundary_library(names, xy):
+    """Library with structures `names`, each with one boundary with points `xy`."""
+    return make_library(make_structure(name, [elements.Boundary(1, 0, xy)]) for name in names)
+
+def make_hierarchy():
+    """
+    Library with hierarchy TOP -> MID -> LEAF, references are transformed
+    and TOP also refers to MISSING.
+    """
+    path = elements.Path(2, 0, [(0, 0), (0, 20)])
+    path.width = 4
+    leaf = make_structure(b'LEAF', [
+        elements.Boundary(1, 0, [(0, 0), (10, 0), (10, 5), (0, 0)]),
+        path,
+        elements.Text(3, 0, [(1, 2)], b'label')])
+
+    mid = make_structure(b'MID', [elements.Box(4, 0, [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)])])
+    ref = elements.SRef(b'LEAF', [(100, 0)])
+    ref.strans = 0x8000
+    ref.angle = 90.0
+    mid.append(ref)
+    ref = elements.ARef(b'LEAF', 3, 2, [(0, 0), (300, 0), (0, 400)])
+    ref.mag = 2.0
+    mid.append(ref)
+
+    top = make_structure(b'TOP')
+    ref = elements.SRef(b'MID', [(1000, 1000)])
+    ref.angle = 30.0
+    top.append(ref)
+    top.append(elements.SRef(b'MISSING', [(0, 0)]))
+    ref = elements.ARef(b'MID', 2, 2, [(0, 0), (0, 5000), (-5000, 0)])
+    ref.angle = 90.0
+    top.append(ref)
+    return make_library([leaf, mid, top])
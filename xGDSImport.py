@@ -59,9 +59,21 @@ if cmd_subfolder not in sys.path:
 
 from gdsii import types
 from gdsii.record import Record
+from gdsii.events import iterparse, ELEMENT
 from gdsii.library import Library
+from gdsii.flatten import Flattener
 from gdsii.elements import *
 
+##  Path outlines are computed with numpy when it is available,
+##  otherwise all paths are drawn as lines with rounded ends.
+try:
+    import numpy
+    from gdsii.outline import boundaries as pathBoundaries
+    from gdsii.simplify import simplify as simplifyElements, Report as SimplifyReport
+except ImportError:
+    pathBoundaries = None
+    simplifyElements = None
+
 ##  Gracefully handle compatibility between Python 2.7 and 3.5
 try:
     import Tkinter as TK, Tkconstants as TKConst, tkFileDialog as TKFileDialog
@@ -89,14 +101,19 @@ if sys.version_info < ( 2, 6):
 
 debug = False
 erase = True
+flatten = False
 gdsin = None
 replace = False
 progress = False
 lockserver = False
 shuffle = False
+simplify = None
 transaction = False
 work = None
 
+##  Number of square ended paths outlined together
+PATH_BATCH = 10000
+
 ##  Global variables to store the Xpedition application
 ##  and document objects so they don't need to be passed.
 
@@ -144,6 +161,39 @@ def showData(rec):
     return ', '.join('{0}'.format(i) for i in rec.data)
 
 
+##  Read the GDS file one element at a time so that only the
+##  current element is held in memory.  When flattening, references
+##  of the top cells of the already loaded library are expanded instead.
+def gdsElements(gdsin, lib=None):
+    """Yields elements of all structures in a GDS file or of flattened library lib."""
+    if lib is not None:
+        flattener = Flattener(lib)
+        for top in lib.hierarchy().top_cells():
+            for elem in flattener.flatten(top, xy_arrays=True):
+                yield elem
+        return
+    with open(gdsin, 'rb') as stream:
+        for (event, obj) in iterparse(stream, xy_arrays=True):
+            if event == ELEMENT:
+                yield obj
+
+
+##  Elements of the structures used by the top cells of library lib,
+##  they are on the same layers as the flattened elements.
+def libraryElements(lib):
+    """Yields elements of structures reachable from the top cells."""
+    hierarchy = lib.hierarchy()
+    names = set()
+    for top in hierarchy.top_cells():
+        names.add(top)
+        names |= hierarchy.descendants(top)
+    for struc in lib:
+        if struc.name in names:
+            for elem in struc:
+                if not isinstance(elem, (SRef, ARef)):
+                    yield elem
+
+
 ##  Output messages to console and optionally to the Xpeditio/t
 ##  message window.  By default, all messages are sent to both.
 def Transcript(msg, svrty = None, echo = True):
@@ -165,7 +215,7 @@ class BuildGUI(TK.Frame):
     widgets = {}
 
     def __init__(self, parent, gdsin=None, replace=True, progress=False, \
-            lockserver=False, shuffle=False, transaction=False, work=os.getcwd()):
+            lockserver=False, shuffle=False, transaction=False, flatten=False, work=os.getcwd()):
         TK.Frame.__init__(self, parent)
 
         ##  Init class properties
@@ -177,6 +227,7 @@ class BuildGUI(TK.Frame):
         self.lockserver = lockserver
         self.shuffle = shuffle
         self.transaction = transaction
+        self.flatten = flatten
         self.gdsin = gdsin
 
         ##  Construct the GUI
@@ -196,7 +247,7 @@ class BuildGUI(TK.Frame):
         self.Cancel()
 
     def Run(self):
-        global erase, gdsin, replace, progress, lockserver, shuffle, transaction
+        global erase, flatten, gdsin, replace, progress, lockserver, shuffle, transaction
 
         ##  Set the global variables based on the current state of the GUI
 
@@ -206,6 +257,7 @@ class BuildGUI(TK.Frame):
         lockserver = self.widgets['opts.lf.ls'].get()
         shuffle = self.widgets['opts.lf.sfl'].get()
         transaction = self.widgets['opts.lf.tr'].get()
+        flatten = self.widgets['opts.lf.fl'].get()
 
         self.quit()
 
@@ -302,6 +354,13 @@ class BuildGUI(TK.Frame):
             offvalue=False, variable=self.widgets['opts.lf.sfl'])
         self.widgets['opts.lf.sfl.cb'].grid(row=4, column=0, sticky=TKConst.W, padx=5)
 
+        self.widgets['opts.lf.fl'] = TK.BooleanVar()
+        self.widgets['opts.lf.fl'].set(self.flatten)
+        self.widgets['opts.lf.fl.cb'] = TK.Checkbutton(self.widgets['opts.lf'], \
+            text='Flatten Hierarchy (expand SREF/AREF references of top cells)', onvalue=True, \
+            offvalue=False, variable=self.widgets['opts.lf.fl'])
+        self.widgets['opts.lf.fl.cb'].grid(row=5, column=0, sticky=TKConst.W, padx=5)
+
         ## Separator
         self.widgets['separator'] = TK.Frame(self.widgets['ofr'], height=2, borderwidth=2, relief=TKConst.SUNKEN)
         self.widgets['separator'].pack(fill=TKConst.X, expand=True, padx=5, pady=5)
@@ -328,16 +387,16 @@ def Version():
 ##  Main routine
 def main(argv):
     global pcbApp, pcbDoc, pcbGui, pcbUtil
-    global erase, gdsin, progress, lockserver, replace, shuffle, transaction, work
+    global erase, flatten, gdsin, progress, lockserver, replace, shuffle, simplify, transaction, work
 
     Version()
 
     ##  Parse command line
 
     try:
-        opts, args = getopt.getopt(argv, "deghi:lprstvw:", [ \
-            "debug", "erase", "gui", "help", "gds=", "lockserver", \
-            "progress", "replaced", "shuffle", "transaction", \
+        opts, args = getopt.getopt(argv, "defghi:lprsS:tvw:", [ \
+            "debug", "erase", "flatten", "gui", "help", "gds=", "lockserver", \
+            "progress", "replaced", "shuffle", "simplify=", "transaction", \
             "version", "work="])
     except getopt.GetoptError as err:
         tprint(err)
@@ -352,6 +411,7 @@ def main(argv):
 
     rc = 0
     erase = False
+    flatten = False
     debug = False
     gui = False
     gdsin = None
@@ -374,6 +434,9 @@ def main(argv):
             debug = True
         if opt in ("-e", "--erase"):
             erase = True
+        if opt in ("-f", "--flatten"):
+            flatten = True
+            Transcript("{} option enabled".format(opt), "note", False)
         if opt in ("-g", "--gui"):
             gui = True
         if opt in ("-i", "--gds"):
@@ -389,6 +452,13 @@ def main(argv):
         if opt in ("-s", "--shuffle"):
             shuffle = True
             Transcript("{} option enabled".format(opt), "note", False)
+        if opt in ("-S", "--simplify"):
+            try:
+                simplify = float(arg)
+            except ValueError:
+                Transcript("{} requires a numeric tolerance, not {}".format(opt, arg), "error", False)
+                sys.exit(2)
+            Transcript("{} set to:  {}".format(opt, arg), "note", False)
         if opt in ("-t", "--transaction"):
             transaction = True
             Transcript("{} option enabled".format(opt), "note", False)
@@ -436,7 +506,7 @@ def main(argv):
         root = TK.Tk()
         root.title("Import GDS")
         #root.geometry("600x600+300+300")
-        app = BuildGUI(root, gdsin, replace, progress, lockserver, shuffle, transaction, work)
+        app = BuildGUI(root, gdsin, replace, progress, lockserver, shuffle, transaction, flatten, work)
         ##  Setup key binds for Run and Cancel
         root.bind('<Return>', app.ReturnKey)
         root.bind('<Escape>', app.EscapeKey)
@@ -460,28 +530,34 @@ def main(argv):
     ##  Capture the start time
     st = time.time()
 
-    ##  Load the source GDS file
-    with open(gdsin, 'rb') as stream:
-        lib = Library.load(stream)
-
     ##  "Pre-scan" the GDS to gather up the layers that will be imported.
+    ##  The source GDS file is streamed, not loaded into memory, unless
+    ##  flattening.  The library to flatten is loaded once and its layers
+    ##  are taken from the structures, it is flattened only while drawing.
     gdslayers = []
+    gdslib = None
 
-    for struc in lib:
-        for elem in struc:
-            if isinstance(elem, Boundary):
-                gdslayer = "{}.{}".format(elem.layer, elem.data_type)
-            if isinstance(elem, Path):
-                gdslayer = "{}.{}".format(elem.layer, elem.path_type)
-            elif isinstance(elem, Text):
-                gdslayer = "{}.{}".format(elem.layer, elem.text_type)
-            elif isinstance(elem, Node):
-                gdslayer = "{}.{}".format(elem.layer, elem.node_type)
-            elif isinstance(elem, Box):
-                gdslayer = "{}.{}".format(elem.layer, elem.box_type)
-
-            if gdslayer not in gdslayers:
-                gdslayers.append(gdslayer)
+    if flatten:
+        with open(gdsin, 'rb') as stream:
+            gdslib = Library.load(stream, xy_arrays=True)
+        prescan = libraryElements(gdslib)
+    else:
+        prescan = gdsElements(gdsin)
+
+    for elem in prescan:
+        if isinstance(elem, Boundary):
+            gdslayer = "{}.{}".format(elem.layer, elem.data_type)
+        if isinstance(elem, Path):
+            gdslayer = "{}.{}".format(elem.layer, elem.path_type)
+        elif isinstance(elem, Text):
+            gdslayer = "{}.{}".format(elem.layer, elem.text_type)
+        elif isinstance(elem, Node):
+            gdslayer = "{}.{}".format(elem.layer, elem.node_type)
+        elif isinstance(elem, Box):
+            gdslayer = "{}.{}".format(elem.layer, elem.box_type)
+
+        if gdslayer not in gdslayers:
+            gdslayers.append(gdslayer)
 
     for gdslayer in gdslayers:
         Transcript("GDS layer {} will be imported.".format(gdslayer), "note")
@@ -583,48 +659,69 @@ def main(argv):
         cp = colorpatterns[(gdslayers.index(gdslayer) % len(colorpatterns))]
         setupUserLayer(uln, cp)
 
-    ##  Traverse the design, looking for layers to import
-    for struc in lib:
-        for elem in struc:
-            if progress:
-                Transcript("GDS Element on Layer {}" .format(elem.layer), "note")
-                if isinstance(elem, Boundary):
-                    Transcript("GDS Element of Datatype {}".format(elem.data_type), "note")
-                if isinstance(elem, Path):
-                    Transcript("GDS Element of Pathtype {}".format(elem.path_type), "note")
-                elif isinstance(elem, Text):
-                    Transcript("GDS Element of Texttype {}".format(elem.text_type), "note")
-                elif isinstance(elem, Node):
-                    Transcript("GDS Element of Nodetype {}".format(elem.node_type), "note")
-                elif isinstance(elem, Box):
-                    Transcript("GDS Element of Boxtype {}".format(elem.box_type), "note")
-
+    ##  Remove redundant vertices while reading?
+    elems = gdsElements(gdsin, gdslib)
+    simplifyReport = None
+    if simplify is not None:
+        if simplifyElements is None:
+            Transcript("Vertex simplification requires numpy, option ignored.", "warning")
+        else:
+            simplifyReport = SimplifyReport()
+            elems = simplifyElements(elems, simplify, simplifyReport)
 
+    ##  Traverse the design, looking for layers to import
+    paths = []
+    for elem in elems:
+        if progress:
+            Transcript("GDS Element on Layer {}" .format(elem.layer), "note")
             if isinstance(elem, Boundary):
-                if progress:
-                    Transcript("GDS Boundary element found ...", "note")
-                drawBoundry(elem)
-            elif isinstance(elem, Path):
-                if progress:
-                    Transcript("GDS Path element found ...", "note")
-                drawPath(elem)
+                Transcript("GDS Element of Datatype {}".format(elem.data_type), "note")
+            if isinstance(elem, Path):
+                Transcript("GDS Element of Pathtype {}".format(elem.path_type), "note")
             elif isinstance(elem, Text):
-                if progress:
-                    Transcript("GDS Text element found ...", "note")
-                drawText(elem)
+                Transcript("GDS Element of Texttype {}".format(elem.text_type), "note")
             elif isinstance(elem, Node):
-                if progress:
-                    Transcript("GDS Node element found ...", "note")
-                Transcript("GDS Node element has not been implemented.", "warning")
+                Transcript("GDS Element of Nodetype {}".format(elem.node_type), "note")
             elif isinstance(elem, Box):
-                if progress:
-                    Transcript("GDS Box element found ...", "note")
-                Transcript("GDS Box element has not been implemented.", "warning")
+                Transcript("GDS Element of Boxtype {}".format(elem.box_type), "note")
 
-            rc+= 1
-#            if rc == 25:
-#                break
-        
+
+        if isinstance(elem, Boundary):
+            if progress:
+                Transcript("GDS Boundary element found ...", "note")
+            drawBoundry(elem)
+        elif isinstance(elem, Path):
+            if progress:
+                Transcript("GDS Path element found ...", "note")
+            ##  Square ended paths are collected and converted to polygons in batches
+            if pathBoundaries is None or elem.path_type == 1:
+                drawPath(elem)
+            else:
+                paths.append(elem)
+                if len(paths) >= PATH_BATCH:
+                    drawPaths(paths)
+                    paths = []
+        elif isinstance(elem, Text):
+            if progress:
+                Transcript("GDS Text element found ...", "note")
+            drawText(elem)
+        elif isinstance(elem, Node):
+            if progress:
+                Transcript("GDS Node element found ...", "note")
+            Transcript("GDS Node element has not been implemented.", "warning")
+        elif isinstance(elem, Box):
+            if progress:
+                Transcript("GDS Box element found ...", "note")
+            Transcript("GDS Box element has not been implemented.", "warning")
+
+        rc+= 1
+#        if rc == 25:
+#            break
+
+    ##  Draw the remaining square ended paths
+    if paths:
+        drawPaths(paths)
+    
     ##  End Transaction?
     if transaction:
         tre = pcbDoc.TransactionEnd(True)
@@ -643,6 +740,9 @@ def main(argv):
     rt = datetime.timedelta(seconds=int(et-st))
 
     Transcript("Processed {} records in GDS source file.".format(rc), "note")
+    if simplifyReport is not None:
+        Transcript("Removed {} of {} vertices from {} elements.".format(simplifyReport.vertices, \
+            simplifyReport.total, simplifyReport.elements), "note")
     Transcript("Start Time:  {}".format(time.strftime("%a, %d %b %Y %H:%M:%S", time.localtime(st))), "note")
     Transcript("  End Time:  {}".format(time.strftime("%a, %d %b %Y %H:%M:%S", time.localtime(et))), "note")
     Transcript("  Run Time:  {}".format(rt.__str__()), "note")
@@ -795,11 +895,9 @@ def drawPath(elem):
         tprint("GDS Path PATHTYPE:  {}".format(str(elem.path_type)), "debug")
 
     ##  A Path element with rounded ends (PATHTYPE == 1) is handled as a simple
-    ##  line with a width.  Square ended paths (PATHTYPE == 0 or PATHTYPE == 2)
-    ##  need to be converted from coordinate pairs to a polygon with the proper
-    ##  line end handling.
-    ##
-    ##  For now all lines are handled with rounded ends ...
+    ##  line with a width.  Square ended paths (PATHTYPE == 0, 2 or 4) are
+    ##  converted to polygons by drawPaths(), they only end up here when numpy
+    ##  is not available and are then drawn with rounded ends too.
 
     ##  Need to convert the elem.xy vertices into a points array ...
     X = []
@@ -837,10 +935,28 @@ def drawPath(elem):
         pcbDoc.PutUserLayerGfx(ul, W, len(X), xyr, False, None, constants.epcbUnitUM)
 
 
+##
+##  drawPaths
+##
+##  Draw square ended paths as polygons on user layers in Xpedition.
+##  The outlines honor the PATHTYPE, WIDTH, BGNEXTN and ENDEXTN of
+##  the paths and are computed for the whole list at once.
+##
+def drawPaths(paths):
+    for (elem, boundaries) in zip(paths, pathBoundaries(paths)):
+        ##  Paths with less than two distinct points have no outline,
+        ##  long outlines are cut into several boundaries
+        if not boundaries:
+            drawPath(elem)
+        for boundary in boundaries:
+            drawBoundry(boundary)
+
+
 def usage(prog):
     usage = """
     -d --debug                Report detailed information while reading GDS
     -e --erase                Erase any existing GDS user layers matching GDS_L.D pattern
+    -f --flatten              Expand structure references (SREF/AREF) of top cells
     -g --gui                  Use GUI, default when missing --gds option
     -i --gds <gdsfile>        GDS input file
     -h --help                 Display this help content
@@ -848,6 +964,8 @@ def usage(prog):
     -p --progress             Report progress during GDS import
     -r --replace              Replace existing user layers when importing GDS
     -s --shuffle              Shuffle color patterns assigned to GDS user layers
+    -S --simplify <tolerance> Remove redundant vertices and vertices closer than tolerance
+                              (in database units, 0 for exact) before import
     -t --transaction          Wrap GDS import in a Transaction to improve performance
     -v --version              Print version number
     -w --work <path>          Initial path for GDS file selection, default to current directory